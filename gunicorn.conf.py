@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+import tempfile
+from pathlib import Path
+
+bind = os.getenv("APP__BIND", "0.0.0.0:8000")
+workers = int(os.getenv("APP__WORKERS", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv("APP__WORKER_TIMEOUT", 30))
+max_requests = int(os.getenv("APP__MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# Import the application once in the master; the workers are forked from it and share the loaded
+# modules copy-on-write, which makes worker (re)starts nearly free.
+preload_app = True
+wsgi_app = "shop.wsgi:application"
+
+# Every worker writes its request metrics to this directory and /metrics merges them, so a scrape answered
+# by any worker covers all of them. Set before the application is loaded, which reads it from the settings.
+if not os.getenv("APP__METRICS_DIR"):
+    os.environ["APP__METRICS_DIR"] = tempfile.mkdtemp(prefix="shop-metrics-")
+
+
+def on_starting(server):
+    # Metrics of a previous server are not carried over.
+    for path in Path(os.environ["APP__METRICS_DIR"]).glob("*.db"):
+        path.unlink()
+
+
+def pre_fork(server, worker):
+    # Database connections must never be shared across a fork.
+    from django.db import connections
+
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    # Threads do not survive a fork, so every worker starts its own cache invalidation listener.
+    from shop.invalidation import bus
+
+    bus.ensure_started()
@@ -6,4 +6,5 @@ class ProductsConfig(AppConfig):
     name = "products"
 
     def ready(self):
+        import products.checks  # noqa: F401
         import products.signals  # noqa: F401
@@ -0,0 +1,285 @@
+import json
+import math
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from products.models import Category, Price, Product
+from products.serializers import PriceForCategorySerializer
+from products.utils.analytics import get_category_analytics
+from products.utils.average import get_average_by_category, get_average_by_product
+from products.utils.pricing import resolve_overlapping_prices
+
+BATCH_SIZE = 5000
+HISTORY_START = date(2020, 1, 1)
+HISTORY_DAYS = 5 * 365
+DEFAULT_SIZES = (100, 10_000, 100_000)
+OVERLAPS = (0, 1, 10)
+UPSERT_ITEMS = 1000
+SEARCH_PRODUCTS = 1_000_000
+# One word of each list per product: a colour is in 1 of 10 products, a material in 1 of 12, an item in 1 of 40.
+SEARCH_WORDS = {
+    "colour": "red blue green black white grey yellow orange purple brown".split(),
+    "material": "oak pine steel glass leather cotton wool ceramic bamboo marble linen brass".split(),
+    "item": (
+        "chair table lamp sofa desk shelf bed mirror rug cabinet stool bench wardrobe dresser ottoman armchair "
+        "bookcase sideboard nightstand cushion curtain blanket vase clock frame basket planter candle tray bowl mug "
+        "plate kettle teapot pan pot knife spoon fork jar"
+    ).split(),
+}
+# Named after the kind of match; the common words are found in 25k and 83k products.
+SEARCH_QUERIES = {
+    "common-name-word": "lamp",
+    "name-typo": "wardrobbe",
+    "sku": "SRCH-0424242",
+    "description": "oak",
+    "description-phrase": '"mirror in oak" -black',
+}
+WINDOWS = {"1-month": 30, "5-years": HISTORY_DAYS}
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        with rolled_back():
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(ordered, pct):
+    position = (len(ordered) - 1) * pct / 100
+    lower, upper = math.floor(position), math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        "runs": len(ordered),
+        "ops_per_sec": len(ordered) / sum(ordered) if sum(ordered) else float("inf"),
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+    }
+
+
+def create_catalog(name, products, segments=1, segment_days=7):
+    category = Category.objects.create(name=name)
+    created = []
+    for offset in range(0, products, BATCH_SIZE):
+        created += Product.objects.bulk_create(
+            Product(name=f"{name} {i}", sku=f"{name}-{i}", category=category)
+            for i in range(offset, min(products, offset + BATCH_SIZE))
+        )
+    Price.objects.bulk_create(
+        (
+            Price(
+                product=product,
+                price=Decimal(10 + (i + n) % 90),
+                start_date=HISTORY_START + timedelta(days=segment_days * n),
+                end_date=None if n == segments - 1 else HISTORY_START + timedelta(days=segment_days * (n + 1) - 1),
+            )
+            for i, product in enumerate(created)
+            for n in range(segments)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    # Fresh planner statistics, otherwise the queries are planned as if the tables were still empty.
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {Product._meta.db_table}, {Price._meta.db_table}")
+    return category, created
+
+
+def create_search_catalog(products):
+    category = Category.objects.create(name="bench-search")
+    # Every block of 10 * 12 * 40 consecutive products holds each combination of words once.
+    words, combinations = {}, 1
+    for kind, values in SEARCH_WORDS.items():
+        array = "ARRAY[" + ", ".join(f"'{word}'" for word in values) + "]"
+        words[kind] = f"({array})[1 + mod(i / {combinations}, {len(values)})]"
+        combinations *= len(values)
+    colour, material, item = words.values()
+    # A million products through bulk_create would take the whole run; the rows are generated in the database.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {Product._meta.db_table} (name, sku, category_id, description)
+            SELECT initcap({colour}) || ' ' || {material} || ' ' || {item} || ' ' || i,
+                   'SRCH-' || lpad(i::text, 7, '0'),
+                   %s,
+                   'A ' || {colour} || ' ' || {item} || ' in ' || {material} || '.'
+            FROM generate_series(1, %s) AS i
+            """,
+            [category.id, products],
+        )
+        # Autovacuum cannot see the rows of this transaction; without it every query would scan the pending
+        # lists the insert left in the GIN indexes.
+        for index in Product._meta.indexes:
+            cursor.execute("SELECT gin_clean_pending_list(%s::regclass)", [index.name])
+        cursor.execute(f"ANALYZE {Product._meta.db_table}")
+    return category
+
+
+def bench_single_insert(repeat, sizes, wanted):
+    names = {f"resolve/overlaps={overlaps}": overlaps for overlaps in OVERLAPS}
+    if not any(map(wanted, names)):
+        return
+    _, (product,) = create_catalog("bench-resolve", 1, segments=max(OVERLAPS) + 1)
+    for name, overlaps in names.items():
+        if not wanted(name):
+            continue
+        if overlaps:
+            start, end = HISTORY_START + timedelta(days=1), HISTORY_START + timedelta(days=7 * (overlaps - 1) + 5)
+        else:
+            start, end = HISTORY_START - timedelta(days=30), HISTORY_START - timedelta(days=1)
+
+        def run():
+            data = {"product": product, "price": Decimal("1.00"), "start_date": start, "end_date": end}
+            Price.objects.create(**resolve_overlapping_prices(data))
+
+        yield name, timed(run, repeat)
+
+
+def bench_bulk_category(repeat, sizes, wanted):
+    for size in sizes:
+        name = f"bulk-category/products={size}"
+        if not wanted(name):
+            continue
+        with rolled_back():
+            category, _ = create_catalog(f"bench-bulk-{size}", size)
+            data = {"category_id": category.id, "price": "9.99", "start_date": HISTORY_START + timedelta(days=3)}
+
+            def run():
+                serializer = PriceForCategorySerializer(data=data)
+                serializer.is_valid(raise_exception=True)
+                serializer.create_prices_for_category()
+
+            yield name, timed(run, max(1, min(repeat, 100_000 // (size * 10))))
+
+
+def bench_averages(repeat, sizes, wanted):
+    names = [f"{kind}/{window}" for kind in ("average-product", "average-category", "analytics") for window in WINDOWS]
+    names += ["endpoint/product-list", "endpoint/average-price", "endpoint/average-by-category"]
+    if not any(map(wanted, names)):
+        return
+    category, products = create_catalog("bench-history", 50, segments=HISTORY_DAYS // 7)
+    product = products[0]
+    end = HISTORY_START + timedelta(days=HISTORY_DAYS)
+    for window, days in WINDOWS.items():
+        start = end - timedelta(days=days)
+        if wanted(f"average-product/{window}"):
+            yield f"average-product/{window}", timed(
+                lambda: get_average_by_product(product, start, end, "month"), repeat
+            )
+        if wanted(f"average-category/{window}"):
+            yield f"average-category/{window}", timed(
+                lambda: get_average_by_category(category.name, start, end), repeat
+            )
+        if wanted(f"analytics/{window}"):
+            yield f"analytics/{window}", timed(
+                lambda: get_category_analytics(category, start, end, None, False), repeat
+            )
+
+    client = Client(HTTP_HOST="127.0.0.1")
+    period = {"start_date": HISTORY_START.isoformat(), "end_date": end.isoformat()}
+    requests = {
+        "endpoint/product-list": (reverse("product-list"), {}),
+        "endpoint/average-price": (
+            reverse("product-average-price", args=[product.id]),
+            {**period, "group_by": "month"},
+        ),
+        "endpoint/average-by-category": (reverse("price-average-by-category"), {**period, "category": category.name}),
+    }
+    for name, (url, params) in requests.items():
+        if wanted(name):
+            yield name, timed(lambda: client.get(url, params), repeat)
+
+
+def bench_upsert(repeat, sizes, wanted):
+    names = ["upsert/batch-endpoint", "upsert/per-request"]
+    if not any(map(wanted, names)):
+        return
+    category, products = create_catalog("bench-upsert", UPSERT_ITEMS // 2)
+    items = [
+        {"sku": f"bench-upsert-{i}", "name": f"Upserted {i}", "category": category.name, "description": "updated"}
+        for i in range(UPSERT_ITEMS)
+    ]
+    client = Client(HTTP_HOST="127.0.0.1")
+    if wanted("upsert/batch-endpoint"):
+        url = reverse("product-bulk-upsert")
+        yield "upsert/batch-endpoint", timed(
+            lambda: client.post(url, {"products": items}, content_type="application/json"), repeat
+        )
+    if wanted("upsert/per-request"):
+        ids = {product.sku: product.pk for product in products}
+
+        def run():
+            for item in items:
+                if item["sku"] in ids:
+                    client.put(
+                        reverse("product-detail", args=[ids[item["sku"]]]), item, content_type="application/json"
+                    )
+                else:
+                    client.post(reverse("product-list"), item, content_type="application/json")
+
+        yield "upsert/per-request", timed(run, max(1, repeat // 10))
+
+
+def bench_search(repeat, sizes, wanted):
+    names = {f"search/{kind}": text for kind, text in SEARCH_QUERIES.items()}
+    if not any(map(wanted, names)):
+        return
+    create_search_catalog(SEARCH_PRODUCTS)
+    client = Client(HTTP_HOST="127.0.0.1")
+    url = reverse("product-search")
+    for name, text in names.items():
+        if wanted(name):
+            yield name, timed(lambda: client.get(url, {"q": text}), repeat)
+
+
+BENCHMARKS = [bench_single_insert, bench_bulk_category, bench_averages, bench_upsert, bench_search]
+
+
+def run_benchmarks(repeat=20, sizes=DEFAULT_SIZES, patterns=None):
+    def wanted(name):
+        return not patterns or any(pattern in name for pattern in patterns)
+
+    results = {}
+    with rolled_back():
+        for benchmark in BENCHMARKS:
+            for name, timings in benchmark(repeat, sizes, wanted):
+                results[name] = summarize(timings)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = {}
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous and result["p50_ms"] > previous["p50_ms"] * (1 + threshold):
+            regressions[name] = result["p50_ms"] / previous["p50_ms"] - 1
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, results):
+    with open(path, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
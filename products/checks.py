@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose counters are per process, or whose incr is a read followed by a write.
+UNSHARED_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+    "django.core.cache.backends.db.DatabaseCache",
+    "django.core.cache.backends.filebased.FileBasedCache",
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_throttle_cache(app_configs, **kwargs):
+    options = settings.COST_THROTTLE
+    backend = settings.CACHES.get(options["CACHE"], {}).get("BACKEND")
+    if not options["ENABLED"] or backend not in UNSHARED_CACHES:
+        return []
+    return [
+        Warning(
+            f"The cost throttle's cache {options['CACHE']!r} uses {backend}, so its budgets are not enforced "
+            "across workers.",
+            hint="Configure a Redis or Memcached cache (APP__CACHE_BACKEND, APP__CACHE_LOCATION).",
+            id="products.W001",
+        )
+    ]
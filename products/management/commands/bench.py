@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from products.benchmarks import DEFAULT_SIZES, compare, load_baseline, run_benchmarks, save_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the pricing engine, the average queries and the API endpoints against the local database. "
+        "All data is created inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Runs per scenario.")
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=list(DEFAULT_SIZES),
+            help="Category sizes for the bulk pricing scenarios.",
+        )
+        parser.add_argument("--scenario", action="append", help="Only run scenarios whose name contains this text.")
+        parser.add_argument("--baseline", help="JSON baseline to compare against.")
+        parser.add_argument("--save-baseline", help="Write the results as a JSON baseline to this path.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.1,
+            help="Allowed p50 slowdown against the baseline before failing (0.1 = 10%%).",
+        )
+
+    def handle(self, *args, **options):
+        with override_settings(DEBUG=False):
+            results = run_benchmarks(options["repeat"], options["sizes"], options["scenario"])
+        baseline = load_baseline(options["baseline"]) if options["baseline"] else {}
+
+        self.stdout.write(f"{'scenario':<40} {'runs':>5} {'ops/sec':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, result in results.items():
+            line = (
+                f"{name:<40} {result['runs']:>5} {result['ops_per_sec']:>10.1f} "
+                f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+            )
+            if name in baseline:
+                line += f" {result['p50_ms'] / baseline[name]['p50_ms'] - 1:>+8.1%}"
+            self.stdout.write(line)
+
+        if options["save_baseline"]:
+            save_baseline(options["save_baseline"], results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['save_baseline']}"))
+
+        regressions = compare(results, baseline, options["threshold"])
+        if regressions:
+            details = ", ".join(f"{name} (+{slowdown:.1%})" for name, slowdown in regressions.items())
+            raise CommandError(f"Performance regression over {options['threshold']:.0%}: {details}")
@@ -0,0 +1,66 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure_import(module: str) -> tuple[float, list]:
+    """Import ``module`` in a fresh interpreter and return its cumulative import time (ms) and per-import rows."""
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "shop.settings")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        cwd=settings.BASE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise CommandError(f"Importing {module} failed:\n{result.stderr}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            rows.append((int(match[2]) / 1000, len(match[3]) // 2, match[4]))
+    total = next((cumulative for cumulative, depth, name in rows if depth == 0 and name == module), None)
+    if total is None:
+        raise CommandError(f"No import time reported for {module}.")
+    return total, rows
+
+
+class Command(BaseCommand):
+    help = "Measure the startup import time of the WSGI application with `python -X importtime` against a budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--module", default="shop.wsgi", help="Module to import.")
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            default=settings.IMPORT_TIME_BUDGET_MS,
+            help="Fail when the median cumulative import time exceeds this many milliseconds.",
+        )
+        parser.add_argument("--runs", type=int, default=3, help="Number of fresh interpreters to measure.")
+        parser.add_argument("--top", type=int, default=10, help="Number of slowest top-level imports to list.")
+
+    def handle(self, *args, **options):
+        module = options["module"]
+        measurements = [measure_import(module) for _ in range(options["runs"])]
+        median = statistics.median(total for total, rows in measurements)
+
+        rows = measurements[-1][1]
+        slowest = sorted((row for row in rows if row[1] <= 1 and row[2] != module), reverse=True)
+        for cumulative, depth, name in slowest[: options["top"]]:
+            self.stdout.write(f"{cumulative:>10.1f} ms  {name}")
+
+        summary = (
+            f"{module} imports in {median:.1f} ms (median of {options['runs']}), budget {options['budget_ms']:.0f} ms"
+        )
+        if median > options["budget_ms"]:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.utils.integrity import repair_prices, scan_prices
+
+
+class Command(BaseCommand):
+    help = "Find inverted, overlapping and multiple open-ended price segments, and optionally repair them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repair", action="store_true", help="Rewrite the affected products' prices.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Products repaired per transaction.")
+
+    def handle(self, *args, **options):
+        findings = 0
+        product_ids = set()
+        for finding in scan_prices():
+            findings += 1
+            product_ids.add(finding.product_id)
+            if options["verbosity"] > 0:
+                self.stdout.write(
+                    f"{finding.issue}: product {finding.product_id}, price {finding.price_id} "
+                    f"({finding.price}, {finding.start_date} - {finding.end_date})"
+                )
+        if not findings:
+            self.stdout.write(self.style.SUCCESS("No price issues found."))
+            return
+        if not options["repair"]:
+            raise CommandError(
+                f"Found {findings} price issue(s) in {len(product_ids)} product(s); run with --repair to fix them.",
+                returncode=1,
+            )
+
+        def progress(totals):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Batch {totals['batches']}: {totals['products']} product(s) repaired so far")
+
+        totals = repair_prices(list(product_ids), options["batch_size"], progress=progress)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Repaired {findings} price issue(s) in {totals['products']} product(s): "
+                f"{totals['deleted']} deleted, {totals['updated']} updated, {totals['created']} created."
+            )
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from products.utils.compaction import compact_prices
+
+
+class Command(BaseCommand):
+    help = "Coalesce back-to-back price segments of a product that have the same price."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Products compacted per transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be removed.")
+
+    def handle(self, *args, **options):
+        def progress(totals):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Batch {totals['batches']}: {totals['removed']} row(s) so far")
+
+        totals = compact_prices(options["batch_size"], dry_run=options["dry_run"], progress=progress)
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {totals['removed']} price row(s) from {totals['products']} product(s) "
+                f"in {totals['batches']} batch(es)."
+            )
+        )
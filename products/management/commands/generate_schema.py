@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.schema import generate_schema, schema_path
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema once and write it as JSON and YAML to OPENAPI_SCHEMA_DIR."
+
+    def handle(self, *args, **options):
+        settings.OPENAPI_SCHEMA_DIR.mkdir(parents=True, exist_ok=True)
+        for extension, content in generate_schema().items():
+            path = schema_path(extension)
+            path.write_bytes(content)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {path} ({len(content)} bytes)"))
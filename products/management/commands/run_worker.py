@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.utils.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Process background jobs from the database-backed job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOBS["POLL_INTERVAL"],
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=float,
+            default=settings.JOBS["STALE_AFTER"],
+            help="Seconds without a heartbeat after which a running job is considered crashed and retried.",
+        )
+        parser.add_argument("--burst", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            options["poll_interval"], options["stale_after"], burst=options["burst"], log=self.stdout.write
+        )
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
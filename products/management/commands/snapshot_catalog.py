@@ -0,0 +1,25 @@
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.utils.snapshots import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write a gzip NDJSON snapshot of all products with the price active on a date, and update index.json."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date", type=date.fromisoformat, default=None, help="Price date (YYYY-MM-DD), today by default."
+        )
+        parser.add_argument(
+            "--dir", type=Path, default=None, help="Output directory, CATALOG_SNAPSHOTS['DIR'] by default."
+        )
+
+    def handle(self, *args, **options):
+        entry = write_snapshot(options["date"] or timezone.localdate(), directory=options["dir"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {entry['file']}: {entry['products']} product(s), {entry['bytes']} bytes")
+        )
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-19 03:29
+
+import django.contrib.postgres.operations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("products", "0004_product_search"),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name="price",
+            index=models.Index(fields=["product", "start_date", "end_date"], include=("price",), name="price_validity"),
+        ),
+    ]
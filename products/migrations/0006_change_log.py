@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-19 03:34
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0005_price_validity_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLogEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("seq", models.BigIntegerField(blank=True, null=True, unique=True)),
+                ("model", models.CharField(choices=[("price", "Price"), ("product", "Product")], max_length=20)),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("created", "Created"), ("updated", "Updated"), ("deleted", "Deleted")], max_length=20
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("product_id", models.BigIntegerField()),
+                ("data", models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(condition=models.Q(("seq__isnull", True)), fields=["id"], name="changelog_unsequenced")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.2 on 2026-10-19 04:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_throttle_bucket"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="ThrottleBucket",
+        ),
+    ]
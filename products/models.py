@@ -1,7 +1,13 @@
 from decimal import Decimal
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Upper
+
+SEARCH_CONFIG = "english"
 
 
 class Category(models.Model):
@@ -16,6 +22,18 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="products")
     sku = models.CharField(max_length=100, unique=True, db_index=True)
     description = models.TextField(blank=True, null=True)
+    search_vector = models.GeneratedField(
+        expression=SearchVector("description", config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(OpClass("name", name="gin_trgm_ops"), name="product_name_trgm"),
+            GinIndex(OpClass(Upper("sku"), name="gin_trgm_ops"), name="product_sku_upper_trgm"),
+            GinIndex(fields=["search_vector"], name="product_description_search"),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.sku}"
@@ -27,6 +45,12 @@ class Price(models.Model):
     start_date = models.DateField(db_index=True)
     end_date = models.DateField(null=True, blank=True, db_index=True)
 
+    class Meta:
+        indexes = [
+            # Price of a product on a date; covers the price too, so the lookup is index-only.
+            models.Index(fields=["product", "start_date", "end_date"], include=["price"], name="price_validity"),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.price} ({self.start_date} - {self.end_date})"
 
@@ -40,3 +64,95 @@ class PriceChangeHistory(models.Model):
 
     def __str__(self):
         return f"{self.product.name} - {self.changed_at}"
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only log of price and product changes. Entries are written with ``seq`` unset and numbered
+    after their transaction has committed (``products.utils.changes.sequence_changes``), so ``seq`` grows
+    in commit order and a consumer reading past its last ``seq`` never skips an entry that committed late.
+    """
+
+    PRICE = "price"
+    PRODUCT = "product"
+    MODEL_CHOICES = [(PRICE, "Price"), (PRODUCT, "Product")]
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    ACTION_CHOICES = [(CREATED, "Created"), (UPDATED, "Updated"), (DELETED, "Deleted")]
+
+    seq = models.BigIntegerField(null=True, blank=True, unique=True)
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    object_id = models.BigIntegerField()
+    product_id = models.BigIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["id"], condition=models.Q(seq__isnull=True), name="changelog_unsequenced")]
+
+    def __str__(self):
+        return f"{self.seq} - {self.model} {self.object_id} {self.action}"
+
+
+class PriceBulkRun(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (RUNNING, "Running"), (COMPLETED, "Completed"), (FAILED, "Failed")]
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="price_bulk_runs")
+    price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal("0.00"))])
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    chunk_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.category.name} - {self.price} ({self.status})"
+
+
+class PriceBulkChunk(models.Model):
+    run = models.ForeignKey(PriceBulkRun, on_delete=models.CASCADE, related_name="chunks")
+    first_product_id = models.BigIntegerField()
+    last_product_id = models.BigIntegerField()
+    product_count = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=PriceBulkRun.STATUS_CHOICES, default=PriceBulkRun.PENDING)
+    error = models.TextField(blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.run_id} - [{self.first_product_id}, {self.last_product_id}] ({self.status})"
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (SUCCEEDED, "Succeeded"), (FAILED, "Failed")]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
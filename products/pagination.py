@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProductSearchPagination(CursorPagination):
+    """Keyset pagination over the search rank, so deep pages cost the same as the first one."""
+
+    ordering = ("-rank", "-id")
+    page_size = 20
+    page_size_query_param = "limit"
+    max_page_size = 100
@@ -0,0 +1,382 @@
+"""
+OpenAPI descriptions of the product API views.
+
+They live outside ``views.py`` so that drf_yasg is only imported when the schema is generated
+(``manage.py generate_schema`` or the first hit on the documentation URLs), never on the API request path.
+Importing this module attaches the descriptions to the view methods.
+"""
+
+from django.utils.decorators import method_decorator
+from drf_yasg import openapi
+from drf_yasg.utils import no_body, swagger_auto_schema
+
+from .serializers import (
+    CategoryAnalyticsInputSerializer,
+    ChangeFeedInputSerializer,
+    JobSerializer,
+    PriceBulkRunDetailSerializer,
+    PriceCloseSerializer,
+    PriceForCategorySerializer,
+    PriceSerializer,
+    PriceStatisticsInputSerializer,
+    ProductBulkUpsertSerializer,
+    ProductExpandSerializer,
+    ProductListFilterSerializer,
+    ProductSearchInputSerializer,
+    ProductWithPricesSerializer,
+)
+from .views import ChangeViewSet, PriceBulkRunViewSet, PriceViewSet, ProductViewSet
+
+swagger_auto_schema(
+    method="get",
+    manual_parameters=[
+        openapi.Parameter(
+            "start_date",
+            openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            format="date",
+            required=True,
+        ),
+        openapi.Parameter(
+            "end_date",
+            openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            format="date",
+            required=True,
+        ),
+        openapi.Parameter(
+            "group_by",
+            openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            enum=["week", "month"],
+            required=True,
+        ),
+        openapi.Parameter(
+            "weighted",
+            openapi.IN_QUERY,
+            description="Weight each price by the number of days it was active within each calendar period",
+            type=openapi.TYPE_BOOLEAN,
+            required=False,
+        ),
+    ],
+    responses={
+        200: openapi.Response(
+            description="Average price per period (week/month)",
+            schema=openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Items(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        "period": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                        "average_price": openapi.Schema(type=openapi.TYPE_NUMBER, format="decimal"),
+                    },
+                    required=["period", "average_price"],
+                ),
+            ),
+        ),
+        400: openapi.Response(
+            description="Validation error",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "field_name": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING),
+                    )
+                },
+            ),
+        ),
+        404: openapi.Response(
+            description="Product not found",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "detail": openapi.Schema(type=openapi.TYPE_STRING),
+                },
+            ),
+        ),
+    },
+)(ProductViewSet.average_price)
+
+swagger_auto_schema(
+    method="get",
+    manual_parameters=[
+        openapi.Parameter("date", openapi.IN_QUERY, type=openapi.TYPE_STRING, format="date", required=True),
+    ],
+    responses={
+        200: openapi.Response(
+            description="Price active on the given date, or null when the product had no price",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "product": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                    "price": openapi.Schema(type=openapi.TYPE_NUMBER, format="decimal", x_nullable=True),
+                },
+            ),
+        ),
+    },
+)(ProductViewSet.price_at)
+
+
+class ProductListQuerySerializer(ProductListFilterSerializer, ProductExpandSerializer):
+    """Documents the list filters and the ``expand`` options together; views validate them separately."""
+
+
+method_decorator(name="list", decorator=swagger_auto_schema(query_serializer=ProductListQuerySerializer))(
+    ProductViewSet
+)
+method_decorator(
+    name="retrieve",
+    decorator=swagger_auto_schema(
+        query_serializer=ProductExpandSerializer, responses={200: ProductWithPricesSerializer}
+    ),
+)(ProductViewSet)
+
+swagger_auto_schema(
+    method="get",
+    query_serializer=ProductSearchInputSerializer,
+    manual_parameters=[
+        openapi.Parameter("cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+        openapi.Parameter("limit", openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+    ],
+    responses={
+        200: openapi.Response(
+            description="Matching products, best match first",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "next": openapi.Schema(type=openapi.TYPE_STRING, format="uri", x_nullable=True),
+                    "previous": openapi.Schema(type=openapi.TYPE_STRING, format="uri", x_nullable=True),
+                    "results": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                },
+            ),
+        ),
+    },
+)(ProductViewSet.search)
+
+swagger_auto_schema(
+    request_body=ProductBulkUpsertSerializer,
+    responses={
+        200: openapi.Response(
+            description="Counts per outcome and one result per item, in request order",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "created": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "updated": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "error": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "results": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "index": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "sku": openapi.Schema(type=openapi.TYPE_STRING),
+                                "status": openapi.Schema(
+                                    type=openapi.TYPE_STRING, enum=["created", "updated", "error"]
+                                ),
+                                "id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "errors": openapi.Schema(type=openapi.TYPE_OBJECT),
+                            },
+                        ),
+                    ),
+                },
+            ),
+        ),
+        202: JobSerializer,
+    },
+)(ProductViewSet.bulk_upsert)
+
+swagger_auto_schema(request_body=PriceSerializer, responses={201: PriceSerializer})(PriceViewSet.create)
+
+swagger_auto_schema(
+    request_body=PriceForCategorySerializer,
+    responses={201: PriceSerializer(many=True), 202: JobSerializer, 500: PriceBulkRunDetailSerializer},
+)(PriceViewSet.bulk_create_by_category)
+
+swagger_auto_schema(
+    request_body=PriceCloseSerializer,
+    responses={
+        200: openapi.Response(
+            description="Prices closed",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                    "products": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "closed": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "deleted": openapi.Schema(type=openapi.TYPE_INTEGER),
+                },
+            ),
+        )
+    },
+)(PriceViewSet.bulk_close)
+
+swagger_auto_schema(
+    method="get",
+    manual_parameters=[
+        openapi.Parameter(
+            "category",
+            openapi.IN_QUERY,
+            description="Category Name",
+            type=openapi.TYPE_STRING,
+            required=True,
+        ),
+        openapi.Parameter(
+            "start_date",
+            openapi.IN_QUERY,
+            description="Start date (YYYY-MM-DD)",
+            type=openapi.TYPE_STRING,
+            format="date",
+            required=True,
+        ),
+        openapi.Parameter(
+            "end_date",
+            openapi.IN_QUERY,
+            description="End date (YYYY-MM-DD)",
+            type=openapi.TYPE_STRING,
+            format="date",
+            required=True,
+        ),
+    ],
+    responses={
+        200: openapi.Response(
+            description="Average price response",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "category": openapi.Schema(type=openapi.TYPE_STRING),
+                    "start_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                    "end_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                    "average_price": openapi.Schema(type=openapi.TYPE_NUMBER, format="decimal"),
+                },
+            ),
+        ),
+        400: openapi.Response(
+            description="Validation error",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "field_name": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_STRING),
+                    )
+                },
+            ),
+        ),
+        404: openapi.Response(
+            description="Category not found",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "detail": openapi.Schema(type=openapi.TYPE_STRING),
+                },
+            ),
+        ),
+    },
+)(PriceViewSet.average_by_category)
+
+swagger_auto_schema(
+    method="get",
+    query_serializer=CategoryAnalyticsInputSerializer,
+    responses={
+        200: openapi.Response(
+            description="Time-weighted price statistics per calendar bucket, optionally per product",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "category": openapi.Schema(type=openapi.TYPE_STRING),
+                    "start_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                    "end_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                    "bucket": openapi.Schema(type=openapi.TYPE_STRING, x_nullable=True),
+                    "buckets": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "start_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                                "end_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                                "average_price": openapi.Schema(type=openapi.TYPE_NUMBER),
+                                "min_price": openapi.Schema(type=openapi.TYPE_NUMBER),
+                                "max_price": openapi.Schema(type=openapi.TYPE_NUMBER),
+                                "volatility": openapi.Schema(type=openapi.TYPE_NUMBER),
+                                "products": openapi.Schema(type=openapi.TYPE_INTEGER),
+                            },
+                        ),
+                    ),
+                    "products": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                },
+            ),
+        ),
+        404: openapi.Response(
+            description="Category not found",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"detail": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
+    },
+)(PriceViewSet.analytics_by_category)
+
+swagger_auto_schema(
+    method="get",
+    query_serializer=PriceStatisticsInputSerializer,
+    responses={
+        200: openapi.Response(
+            description="Price distribution per group, computed in the database",
+            schema=openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        "category": openapi.Schema(type=openapi.TYPE_STRING),
+                        "period": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
+                        "count": openapi.Schema(type=openapi.TYPE_INTEGER),
+                        "min_price": openapi.Schema(type=openapi.TYPE_NUMBER),
+                        "p10": openapi.Schema(type=openapi.TYPE_NUMBER),
+                        "median": openapi.Schema(type=openapi.TYPE_NUMBER),
+                        "p90": openapi.Schema(type=openapi.TYPE_NUMBER),
+                        "max_price": openapi.Schema(type=openapi.TYPE_NUMBER),
+                        "average_price": openapi.Schema(type=openapi.TYPE_NUMBER),
+                        "stddev": openapi.Schema(type=openapi.TYPE_NUMBER, x_nullable=True),
+                    },
+                ),
+            ),
+        ),
+    },
+)(PriceViewSet.statistics)
+
+swagger_auto_schema(request_body=no_body, responses={201: PriceBulkRunDetailSerializer})(PriceBulkRunViewSet.resume)
+
+swagger_auto_schema(
+    query_serializer=ChangeFeedInputSerializer,
+    responses={
+        200: openapi.Response(
+            description="Changes after ``since`` in commit order; poll again with ``next_since``",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "changes": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "seq": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "model": openapi.Schema(type=openapi.TYPE_STRING, enum=["price", "product"]),
+                                "action": openapi.Schema(
+                                    type=openapi.TYPE_STRING, enum=["created", "updated", "deleted"]
+                                ),
+                                "object_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "product_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "data": openapi.Schema(type=openapi.TYPE_OBJECT),
+                                "created_at": openapi.Schema(type=openapi.TYPE_STRING, format="date-time"),
+                            },
+                        ),
+                    ),
+                    "next_since": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "has_more": openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                },
+            ),
+        ),
+    },
+)(ChangeViewSet.list)
@@ -1,28 +1,117 @@
 from decimal import Decimal
 
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from .models import (
     Category,
+    Job,
     Price,
+    PriceBulkChunk,
+    PriceBulkRun,
     Product,
 )
+from .utils.chunked import execute_price_run, plan_price_run
+from .utils.closing import close_prices
+from .utils.jobs import enqueue
 from .utils.pricing import resolve_overlapping_prices
+from .utils.upsert import upsert_products
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Accepts ``fields``: the names of the fields to keep; all fields when omitted."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = "__all__"
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = serializers.SlugRelatedField(slug_field="name", queryset=Category.objects.all())
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = ["search_vector"]
+
+
+class ProductListSerializer(ProductSerializer):
+    current_price = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False, read_only=True)
+
+
+class PriceSegmentSerializer(serializers.ModelSerializer):
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False)
+
+    class Meta:
+        model = Price
+        fields = ["price", "start_date", "end_date"]
+
+
+class ProductWithPricesSerializer(ProductSerializer):
+    prices = PriceSegmentSerializer(source="price_segments", many=True, read_only=True)
+
+
+class ProductListWithPricesSerializer(ProductListSerializer):
+    prices = PriceSegmentSerializer(source="price_segments", many=True, read_only=True)
+
+
+class ProductExpandSerializer(serializers.Serializer):
+    expand = serializers.ChoiceField(choices=["prices"], required=False)
+    prices_from = serializers.DateField(required=False)
+    prices_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get("prices_from") and data.get("prices_to") and data["prices_to"] < data["prices_from"]:
+            raise serializers.ValidationError({"prices_from": ["Start date must be before end date."]})
+        return data
+
+
+class ProductListFilterSerializer(serializers.Serializer):
+    category = serializers.CharField(required=False)
+    price_date = serializers.DateField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    ordering = serializers.ChoiceField(choices=["id", "-id", "price", "-price"], required=False, default="id")
+
+    def validate(self, data):
+        if data.get("min_price") is not None and data.get("max_price") is not None:
+            if data["min_price"] > data["max_price"]:
+                raise serializers.ValidationError({"min_price": ["Minimum price must not exceed maximum price."]})
+        return data
+
+
+class ProductSearchSerializer(ProductSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+
+class ProductSearchInputSerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=2, max_length=200)
+
+
+class ProductBulkUpsertSerializer(serializers.Serializer):
+    products = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    background = serializers.BooleanField(required=False, default=False)
+
+    def validate_products(self, products):
+        max_items = settings.PRODUCT_BULK_UPSERT["MAX_ITEMS"]
+        if len(products) > max_items:
+            raise serializers.ValidationError(f"At most {max_items} products per request.")
+        return products
+
+    def upsert(self):
+        return upsert_products(self.validated_data["products"])
+
+    def enqueue_upsert(self):
+        return enqueue("products.bulk_upsert", {"products": self.validated_data["products"]})
 
 
 class PriceForCategorySerializer(serializers.Serializer):
@@ -30,6 +119,8 @@ class PriceForCategorySerializer(serializers.Serializer):
     price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0.00"), coerce_to_string=False)
     start_date = serializers.DateField()
     end_date = serializers.DateField(required=False)
+    parallel = serializers.BooleanField(required=False, default=False)
+    background = serializers.BooleanField(required=False, default=False)
 
     def validate(self, data):
         start_date = data["start_date"]
@@ -46,8 +137,8 @@ class PriceForCategorySerializer(serializers.Serializer):
     def create_prices_for_category(self):
         validated_data = self.validated_data
         category_id = validated_data["category_id"]
-        products = Product.objects.filter(category=category_id)
-        if not products.exists():
+        products = list(Product.objects.select_for_update().filter(category=category_id).order_by("pk"))
+        if not products:
             raise ValidationError({"category": ["No products found in this category."]})
         created_prices = []
         for product in products:
@@ -57,12 +148,60 @@ class PriceForCategorySerializer(serializers.Serializer):
                 "start_date": validated_data["start_date"],
                 "end_date": validated_data.get("end_date"),
             }
-            resolved_data = resolve_overlapping_prices(price_data)
+            resolved_data = resolve_overlapping_prices(price_data, lock=False)
             created_prices.append(Price.objects.create(**resolved_data))
         return created_prices
 
+    def enqueue_prices_for_category(self):
+        validated_data = self.validated_data
+        payload = {
+            "category_id": validated_data["category_id"],
+            "price": str(validated_data["price"]),
+            "start_date": validated_data["start_date"].isoformat(),
+            "end_date": validated_data["end_date"].isoformat() if validated_data.get("end_date") else None,
+        }
+        return enqueue("prices.bulk_create_by_category", payload)
+
+    def create_prices_for_category_in_chunks(self):
+        validated_data = self.validated_data
+        run = plan_price_run(
+            validated_data["category_id"],
+            validated_data["price"],
+            validated_data["start_date"],
+            validated_data.get("end_date"),
+        )
+        if not run.chunks.exists():
+            run.delete()
+            raise ValidationError({"category": ["No products found in this category."]})
+        return execute_price_run(run)
+
 
-class PriceSerializer(serializers.ModelSerializer):
+class PriceCloseSerializer(serializers.Serializer):
+    category_id = serializers.IntegerField(min_value=1, required=False)
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10_000, required=False
+    )
+    date = serializers.DateField()
+
+    def validate(self, data):
+        if ("category_id" in data) == ("product_ids" in data):
+            raise serializers.ValidationError({"category_id": ["Provide either category_id or product_ids."]})
+
+        if "category_id" in data and not Category.objects.filter(id=data["category_id"]).exists():
+            raise serializers.ValidationError({"category_id": ["Category does not exist."]})
+
+        return data
+
+    def close(self):
+        validated_data = self.validated_data
+        return close_prices(
+            validated_data["date"],
+            category_id=validated_data.get("category_id"),
+            product_ids=validated_data.get("product_ids"),
+        )
+
+
+class PriceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0.00"), coerce_to_string=False)
 
     class Meta:
@@ -78,11 +217,87 @@ class PriceSerializer(serializers.ModelSerializer):
 
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         new_price = resolve_overlapping_prices(validated_data)
         return super().create(new_price)
 
 
+class PriceBulkChunkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceBulkChunk
+        fields = ["id", "first_product_id", "last_product_id", "product_count", "status", "error", "completed_at"]
+
+
+class PriceBulkRunSerializer(serializers.ModelSerializer):
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False)
+    total_chunks = serializers.IntegerField(read_only=True)
+    completed_chunks = serializers.IntegerField(read_only=True)
+    failed_chunks = serializers.IntegerField(read_only=True)
+    total_products = serializers.IntegerField(read_only=True)
+    processed_products = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = PriceBulkRun
+        fields = [
+            "id",
+            "category",
+            "price",
+            "start_date",
+            "end_date",
+            "chunk_size",
+            "status",
+            "created_at",
+            "finished_at",
+            "total_chunks",
+            "completed_chunks",
+            "failed_chunks",
+            "total_products",
+            "processed_products",
+        ]
+
+
+class PriceBulkRunDetailSerializer(PriceBulkRunSerializer):
+    failed = serializers.SerializerMethodField()
+
+    class Meta(PriceBulkRunSerializer.Meta):
+        fields = PriceBulkRunSerializer.Meta.fields + ["failed"]
+
+    def get_failed(self, run):
+        chunks = run.chunks.filter(status=PriceBulkRun.FAILED).order_by("pk")
+        return PriceBulkChunkSerializer(chunks, many=True).data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    queued_seconds = serializers.SerializerMethodField()
+    run_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "attempts",
+            "max_attempts",
+            "progress_done",
+            "progress_total",
+            "result",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "queued_seconds",
+            "run_seconds",
+        ]
+
+    def get_queued_seconds(self, job):
+        return (job.started_at - job.created_at).total_seconds() if job.started_at else None
+
+    def get_run_seconds(self, job):
+        return (job.finished_at - job.started_at).total_seconds() if job.started_at and job.finished_at else None
+
+
 class AveragePriceByCategoryInputSerializer(serializers.Serializer):
     category = serializers.CharField()
     start_date = serializers.DateField()
@@ -94,12 +309,43 @@ class AveragePriceByCategoryInputSerializer(serializers.Serializer):
         return data
 
 
+class PriceAtInputSerializer(serializers.Serializer):
+    date = serializers.DateField()
+
+
+class CategoryAnalyticsInputSerializer(AveragePriceByCategoryInputSerializer):
+    bucket = serializers.ChoiceField(choices=["week", "month", "quarter", "year"], required=False)
+    per_product = serializers.BooleanField(required=False, default=False)
+
+
+class PriceStatisticsInputSerializer(serializers.Serializer):
+    category = serializers.CharField(required=False)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    group_by = serializers.MultipleChoiceField(choices=["category", "week", "month"], required=False)
+
+    def validate(self, data):
+        if data["start_date"] > data["end_date"]:
+            raise serializers.ValidationError({"start_date": ["Start date must be before end date."]})
+        if {"week", "month"} <= data.get("group_by", set()):
+            raise serializers.ValidationError({"group_by": ["Group by either week or month, not both."]})
+        return data
+
+
 class AveragePriceByProductInputSerializer(serializers.Serializer):
     start_date = serializers.DateField()
     end_date = serializers.DateField()
     group_by = serializers.ChoiceField(choices=["week", "month"])
+    weighted = serializers.BooleanField(required=False, default=False)
 
     def validate(self, data):
         if data["start_date"] > data["end_date"]:
             raise serializers.ValidationError({"start_date": ["Start date must be before end date."]})
         return data
+
+
+class ChangeFeedInputSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.CHANGE_FEED["MAX_PAGE_SIZE"], default=settings.CHANGE_FEED["PAGE_SIZE"]
+    )
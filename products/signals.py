@@ -1,11 +1,60 @@
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
-from .models import Price, PriceChangeHistory
+from shop.invalidation import bus
+
+from .models import Category, ChangeLogEntry, Price, PriceChangeHistory, Product
+from .utils.changes import price_entry, product_entry
+from .utils.timeline import cache as timeline_cache
 
 
 @receiver(pre_delete, sender=Price)
 def create_price_history_on_delete(sender, instance, **kwargs):
     PriceChangeHistory.objects.create(
-        product=instance.product, old_price=instance.price, start_date=instance.start_date, end_date=instance.end_date
+        product_id=instance.product_id,
+        old_price=instance.price,
+        start_date=instance.start_date,
+        end_date=instance.end_date,
     )
+
+
+@receiver(post_save, sender=Price)
+@receiver(post_delete, sender=Price)
+def invalidate_price_caches(sender, instance, **kwargs):
+    # Evict now for this worker; every worker evicts again once the transaction commits, in case
+    # another request reloaded the old rows meanwhile.
+    timeline_cache.invalidate([instance.product_id])
+    bus.invalidate("product", [instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_caches(sender, instance, **kwargs):
+    bus.invalidate("product", [instance.pk])
+    bus.invalidate("category", [instance.category_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_caches(sender, instance, **kwargs):
+    bus.invalidate("category", [instance.pk])
+
+
+@receiver(post_save, sender=Price)
+def log_price_save(sender, instance, created, **kwargs):
+    price_entry(instance, ChangeLogEntry.CREATED if created else ChangeLogEntry.UPDATED).save()
+
+
+@receiver(post_delete, sender=Price)
+def log_price_delete(sender, instance, **kwargs):
+    price_entry(instance, ChangeLogEntry.DELETED).save()
+
+
+@receiver(post_save, sender=Product)
+def log_product_save(sender, instance, created, **kwargs):
+    product_entry(instance, ChangeLogEntry.CREATED if created else ChangeLogEntry.UPDATED).save()
+
+
+@receiver(post_delete, sender=Product)
+def log_product_delete(sender, instance, **kwargs):
+    product_entry(instance, ChangeLogEntry.DELETED).save()
@@ -1,13 +1,62 @@
-from datetime import date
+import gzip
+import json
+import multiprocessing
+import os
+import re
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
 from decimal import Decimal
-
-from django.test import TestCase
-from django.urls import reverse
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+import psycopg2
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.text import compress_string
 from rest_framework import status
-from rest_framework.test import APITestCase
-
-from .models import Category, Price, Product
-from .utils.pricing import resolve_overlapping_prices
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from shop import schema
+from shop.invalidation import bus, process_origin
+from shop.metrics import MetricsRegistry, registry
+from shop.middleware import CompressionMiddleware, QueryTimeouts, brotli
+
+from .models import (
+    Category,
+    ChangeLogEntry,
+    Job,
+    Price,
+    PriceBulkRun,
+    PriceChangeHistory,
+    Product,
+)
+from .serializers import PriceSerializer
+from .throttling import CostThrottle
+from .utils import chunked
+from .utils.changes import product_entry, record_changes
+from .utils.jobs import requeue_stale_jobs
+from .utils.pricing import lock_products, resolve_overlapping_prices
+from .utils.search import search_products
+from .utils.timeline import PriceTimeline
+from .utils.timeline import cache as timeline_cache
 
 
 class PricingTestCase(TestCase):
@@ -391,6 +440,59 @@ class PricingTestCase(TestCase):
         self.assertPrice(prices[0], date(2025, 6, 1), date(2025, 6, 30), 20)
         self.assertPrice(prices[1], date(2025, 7, 15), None, 10)
 
+    def test_case_adjacent_same_price_is_coalesced(self):
+        """Case 17: New interval touches neighbours with the same price on both sides"""
+        Price.objects.create(product=self.product, price=15, start_date=date(2025, 7, 1), end_date=date(2025, 7, 10))
+        Price.objects.create(product=self.product, price=15, start_date=date(2025, 7, 21), end_date=None)
+        validated_data = {
+            "product": self.product,
+            "start_date": date(2025, 7, 11),
+            "end_date": date(2025, 7, 20),
+            "price": 15,
+        }
+        new_price = resolve_overlapping_prices(validated_data)
+        Price.objects.create(**new_price)
+
+        prices = Price.objects.filter(product=self.product)
+        self.assertEqual(prices.count(), 1)
+        self.assertPrice(prices[0], date(2025, 7, 1), None, 15)
+
+    def test_case_adjacent_different_price_is_kept(self):
+        """Case 18: New interval touches neighbours with other prices"""
+        Price.objects.create(product=self.product, price=10, start_date=date(2025, 7, 1), end_date=date(2025, 7, 10))
+        Price.objects.create(product=self.product, price=15, start_date=date(2025, 7, 21), end_date=None)
+        validated_data = {
+            "product": self.product,
+            "start_date": date(2025, 7, 11),
+            "end_date": date(2025, 7, 20),
+            "price": 12,
+        }
+        new_price = resolve_overlapping_prices(validated_data)
+        Price.objects.create(**new_price)
+
+        prices = Price.objects.filter(product=self.product).order_by("start_date")
+        self.assertEqual(prices.count(), 3)
+        self.assertPrice(prices[0], date(2025, 7, 1), date(2025, 7, 10), 10)
+        self.assertPrice(prices[1], date(2025, 7, 11), date(2025, 7, 20), 12)
+        self.assertPrice(prices[2], date(2025, 7, 21), None, 15)
+
+    def test_case_adjacent_and_overlapping_same_price(self):
+        """Case 19: New interval touches a same-price neighbour and overlaps the start of another"""
+        Price.objects.create(product=self.product, price=15, start_date=date(2025, 7, 1), end_date=date(2025, 7, 9))
+        Price.objects.create(product=self.product, price=15, start_date=date(2025, 7, 12), end_date=date(2025, 7, 20))
+        validated_data = {
+            "product": self.product,
+            "start_date": date(2025, 7, 10),
+            "end_date": date(2025, 7, 15),
+            "price": 15,
+        }
+        new_price = resolve_overlapping_prices(validated_data)
+        Price.objects.create(**new_price)
+
+        prices = Price.objects.filter(product=self.product)
+        self.assertEqual(prices.count(), 1)
+        self.assertPrice(prices[0], date(2025, 7, 1), date(2025, 7, 20), 15)
+
 
 class AverageByCategoryTestCase(APITestCase):
     def setUp(self):
@@ -498,3 +600,1794 @@ class BulkPriceCreateTestCase(APITestCase):
         response = self.client.post(self.url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("category", response.data["detail"])
+
+
+class PerformanceMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.category = Category.objects.create(name="Electronics")
+        Product.objects.create(name="Phone", category=self.category, sku="PH1")
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("product-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response["Server-Timing"]
+        for name in ("db;dur=", "view;dur=", "render;dur=", "total;dur="):
+            self.assertIn(name, timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* queries"')
+
+    def test_metrics_endpoint_exposes_route_histograms(self):
+        self.client.get(reverse("product-list"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn('http_request_duration_seconds_bucket{route="product-list",method="GET",le="+Inf"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{route="product-list",method="GET"} 1', body)
+        self.assertIn('http_request_db_queries_total{route="product-list"}', body)
+
+
+class MultiprocessMetricsTestCase(SimpleTestCase):
+    def test_metrics_of_all_processes_are_merged(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        metrics = MetricsRegistry(buckets=(0.1, 1.0), directory=directory)
+        metrics.describe("jobs_total", "counter", "Jobs run.")
+        metrics.add_collector(lambda: [("busy", 1)])
+        # Recorded before the fork: the workers inherit it but must not count it again.
+        metrics.inc("jobs_total", (("kind", "import"),))
+
+        def work(count):
+            for _ in range(count):
+                metrics.inc("jobs_total", (("kind", "import"),))
+                metrics.observe("job_seconds", (), 0.5)
+
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=work, args=(count,)) for count in (2, 3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([worker.exitcode for worker in workers], [0, 0])
+
+        body = metrics.render()
+        self.assertIn('jobs_total{kind="import"} 6', body)
+        self.assertIn('job_seconds_bucket{le="0.1"} 0', body)
+        self.assertIn('job_seconds_bucket{le="1.0"} 5', body)
+        self.assertIn("job_seconds_sum 2.5", body)
+        self.assertIn("job_seconds_count 5", body)
+        # Per-process values of workers that have exited are dropped.
+        self.assertEqual(re.findall(r"^busy.*$", body, re.MULTILINE), [f'busy{{pid="{os.getpid()}"}} 1'])
+
+
+class CompressionMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        Product.objects.bulk_create(
+            Product(name=f"Phone {i}", category=category, sku=f"PH{i}", description="A phone. " * 20) for i in range(20)
+        )
+        schema.clear_cache()
+        self.addCleanup(schema.clear_cache)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_large_response_is_gzipped(self):
+        plain = self.client.get(reverse("product-list"))
+        response = self.client.get(reverse("product-list"), HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+    def test_small_and_refused_responses_are_not_compressed(self):
+        small = self.client.get(
+            reverse("product-detail", args=[Product.objects.first().pk]), HTTP_ACCEPT_ENCODING="gzip"
+        )
+        refused = self.client.get(reverse("product-list"), HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertNotIn("Content-Encoding", small)
+        self.assertNotIn("Content-Encoding", refused)
+
+    @override_settings(COMPRESSION={"MIN_SIZE": 0})
+    def test_streaming_response_is_not_compressed_by_default(self):
+        factory = RequestFactory()
+        streaming = StreamingHttpResponse(iter([b"a" * 2000]), content_type="application/x-ndjson")
+        middleware = CompressionMiddleware(lambda request: streaming)
+        response = middleware(factory.get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(b"".join(response.streaming_content), b"a" * 2000)
+
+    @override_settings(COMPRESSION={"MIN_SIZE": 0, "STREAMING": True})
+    def test_streaming_response_is_compressed_per_chunk_when_enabled(self):
+        factory = RequestFactory()
+        streaming = StreamingHttpResponse(iter([b"a" * 2000, b"b" * 2000]), content_type="application/x-ndjson")
+        middleware = CompressionMiddleware(lambda request: streaming)
+        response = middleware(factory.get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), b"a" * 2000 + b"b" * 2000)
+
+    def test_payload_with_etag_is_compressed_once(self):
+        url = reverse("schema-json", kwargs={"format": ".json"})
+        with mock.patch("shop.middleware.compress_string", wraps=compress_string) as compress:
+            first = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            revalidated = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first["Content-Encoding"], "gzip")
+        self.assertTrue(first["ETag"].startswith("W/"))
+        self.assertEqual(first.content, second.content)
+        self.assertIn("/products/{id}/average-price/", json.loads(gzip.decompress(first.content))["paths"])
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_gzip_output_is_randomly_padded(self):
+        lengths = {len(self.client.get(reverse("product-list"), HTTP_ACCEPT_ENCODING="gzip").content) for _ in range(5)}
+        self.assertGreater(len(lengths), 1)
+
+    def test_pages_carrying_a_csrf_token_are_not_compressed(self):
+        response = self.client.get("/admin/login/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b"csrfmiddlewaretoken", response.content)
+        self.assertNotIn("Content-Encoding", response)
+
+        def view(request):
+            get_token(request)
+            return JsonResponse({"data": "x" * 4000})
+
+        response = CompressionMiddleware(view)(RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertNotIn("Content-Encoding", response)
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_is_preferred_when_available(self):
+        response = self.client.get(reverse("product-list"), HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertIn(b"Phone 0", brotli.decompress(response.content))
+
+
+# Maximum number of queries per endpoint as (base, per_row). Endpoints whose cost must not depend on the
+# dataset size have per_row == 0; bulk-create-by-category resolves prices product by product, so its budget
+# grows linearly with the number of products in the category and nothing else. Every price or product
+# written also appends one change log entry (one insert per row, or per batch for bulk writes).
+QUERY_BUDGETS = {
+    "product-list": (2, 0),
+    "product-list-filtered": (2, 0),
+    "product-detail": (1, 0),
+    "product-list-expanded": (3, 0),
+    "product-list-sparse": (2, 0),
+    "product-detail-expanded": (2, 0),
+    "product-create": (4, 0),
+    "price-create": (7, 0),
+    "price-bulk-create-by-category": (6, 8),
+    "price-bulk-close": (5, 0),
+    "product-average-price": (2, 0),
+    "product-price-at": (2, 0),
+    "product-bulk-upsert": (6, 0),
+    "product-search": (1, 0),
+    "price-average-by-category": (2, 0),
+    "price-analytics-by-category": (2, 0),
+    "price-statistics": (1, 0),
+    "change-list": (5, 0),
+}
+DATASET_SIZES = (3, 30)
+
+
+class QueryBudgetMixin:
+    def assertQueryBudget(self, name, rows, request):
+        base, per_row = QUERY_BUDGETS[name]
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertLess(response.status_code, 400, response.data)
+        queries = "\n".join(query["sql"] for query in context.captured_queries)
+        self.assertLessEqual(
+            len(context), base + per_row * rows, f"{name} exceeded its query budget at {rows} rows:\n{queries}"
+        )
+        return len(context)
+
+    def assertQueryBudgetAcrossSizes(self, name, make_request):
+        counts = [self.assertQueryBudget(name, rows, make_request(self.build_catalog(rows))) for rows in DATASET_SIZES]
+        if not QUERY_BUDGETS[name][1]:
+            self.assertEqual(len(set(counts)), 1, f"{name} query count grows with row count: {counts}")
+
+    def build_catalog(self, rows):
+        category = Category.objects.create(name=f"Budget {rows}")
+        products = Product.objects.bulk_create(
+            Product(name=f"Product {rows}-{i}", category=category, sku=f"B{rows}-{i}", description="x")
+            for i in range(rows)
+        )
+        Price.objects.bulk_create(
+            Price(product=product, price=Decimal(10 + i), start_date=date(2025, 1, 1 + i % 28), end_date=None)
+            for i, product in enumerate(products)
+        )
+        Price.objects.bulk_create(
+            Price(
+                product=products[0],
+                price=Decimal(i + 1),
+                start_date=date(2020, 1, 1) + timedelta(days=7 * i),
+                end_date=date(2020, 1, 1) + timedelta(days=7 * i + 6),
+            )
+            for i in range(rows)
+        )
+        return category, products
+
+
+# The throttle's category size lookups are cached across requests, so they are not part of any endpoint's budget.
+@override_settings(COST_THROTTLE={**settings.COST_THROTTLE, "ENABLED": False})
+class QueryBudgetTestCase(QueryBudgetMixin, APITestCase):
+    def test_product_list(self):
+        self.assertQueryBudgetAcrossSizes(
+            "product-list", lambda catalog: lambda: self.client.get(reverse("product-list"))
+        )
+
+    def test_product_list_filtered_by_price(self):
+        def make_request(catalog):
+            params = {"category": catalog[0].name, "min_price": "10", "price_date": "2025-06-01", "ordering": "-price"}
+            return lambda: self.client.get(reverse("product-list"), params)
+
+        self.assertQueryBudgetAcrossSizes("product-list-filtered", make_request)
+
+    def test_product_detail(self):
+        self.assertQueryBudgetAcrossSizes(
+            "product-detail",
+            lambda catalog: lambda: self.client.get(reverse("product-detail", args=[catalog[1][0].id])),
+        )
+
+    def test_product_list_expanded(self):
+        self.assertQueryBudgetAcrossSizes(
+            "product-list-expanded",
+            lambda catalog: lambda: self.client.get(reverse("product-list"), {"expand": "prices"}),
+        )
+
+    def test_product_list_sparse(self):
+        self.assertQueryBudgetAcrossSizes(
+            "product-list-sparse",
+            lambda catalog: lambda: self.client.get(reverse("product-list"), {"fields": "id,sku,name"}),
+        )
+
+    def test_product_detail_expanded(self):
+        def make_request(catalog):
+            url = reverse("product-detail", args=[catalog[1][0].id])
+            return lambda: self.client.get(url, {"expand": "prices", "prices_from": "2025-01-01"})
+
+        self.assertQueryBudgetAcrossSizes("product-detail-expanded", make_request)
+
+    def test_product_create(self):
+        def make_request(catalog):
+            category, products = catalog
+            data = {"name": "New", "sku": f"NEW-{len(products)}", "category": category.name}
+            return lambda: self.client.post(reverse("product-list"), data, format="json")
+
+        self.assertQueryBudgetAcrossSizes("product-create", make_request)
+
+    def test_price_create(self):
+        def make_request(catalog):
+            data = {"product": catalog[1][0].id, "price": "5.00", "start_date": "2019-01-01", "end_date": "2019-02-01"}
+            return lambda: self.client.post(reverse("price-list"), data, format="json")
+
+        self.assertQueryBudgetAcrossSizes("price-create", make_request)
+
+    def test_bulk_create_by_category(self):
+        def make_request(catalog):
+            data = {"category_id": catalog[0].id, "price": "9.99", "start_date": "2026-01-01"}
+            return lambda: self.client.post(reverse("price-bulk-create-by-category"), data, format="json")
+
+        self.assertQueryBudgetAcrossSizes("price-bulk-create-by-category", make_request)
+
+    def test_bulk_close(self):
+        def make_request(catalog):
+            data = {"category_id": catalog[0].id, "date": "2025-01-15"}
+            return lambda: self.client.post(reverse("price-bulk-close"), data, format="json")
+
+        self.assertQueryBudgetAcrossSizes("price-bulk-close", make_request)
+
+    def test_product_average_price(self):
+        def make_request(catalog):
+            url = reverse("product-average-price", args=[catalog[1][0].id])
+            params = {"start_date": "2019-01-01", "end_date": "2026-01-01", "group_by": "month"}
+            return lambda: self.client.get(url, params)
+
+        self.assertQueryBudgetAcrossSizes("product-average-price", make_request)
+
+    def test_product_bulk_upsert(self):
+        def make_request(catalog):
+            category, products = catalog
+            items = [{"sku": product.sku, "name": "Renamed", "category": category.name} for product in products]
+            items += [{"sku": f"NEW-{i}-{len(products)}", "name": "New", "category": category.name} for i in range(3)]
+            return lambda: self.client.post(reverse("product-bulk-upsert"), {"products": items}, format="json")
+
+        self.assertQueryBudgetAcrossSizes("product-bulk-upsert", make_request)
+
+    def test_product_search(self):
+        self.assertQueryBudgetAcrossSizes(
+            "product-search", lambda catalog: lambda: self.client.get(reverse("product-search"), {"q": "Product"})
+        )
+
+    def test_product_price_at(self):
+        def make_request(catalog):
+            url = reverse("product-price-at", args=[catalog[1][0].id])
+            return lambda: self.client.get(url, {"date": "2020-01-10"})
+
+        self.assertQueryBudgetAcrossSizes("product-price-at", make_request)
+
+    def test_average_by_category(self):
+        def make_request(catalog):
+            params = {"category": catalog[0].name, "start_date": "2019-01-01", "end_date": "2026-01-01"}
+            return lambda: self.client.get(reverse("price-average-by-category"), params)
+
+        self.assertQueryBudgetAcrossSizes("price-average-by-category", make_request)
+
+    def test_analytics_by_category(self):
+        def make_request(catalog):
+            params = {"category": catalog[0].name, "start_date": "2019-01-01", "end_date": "2026-01-01"}
+            return lambda: self.client.get(reverse("price-analytics-by-category"), {**params, "bucket": "month"})
+
+        self.assertQueryBudgetAcrossSizes("price-analytics-by-category", make_request)
+
+    def test_price_statistics(self):
+        def make_request(catalog):
+            params = {"start_date": "2019-01-01", "end_date": "2026-01-01", "group_by": ["category", "month"]}
+            return lambda: self.client.get(reverse("price-statistics"), params)
+
+        self.assertQueryBudgetAcrossSizes("price-statistics", make_request)
+
+    def test_change_feed(self):
+        def make_request(catalog):
+            record_changes(product_entry(product, ChangeLogEntry.UPDATED) for product in catalog[1])
+            return lambda: self.client.get(reverse("change-list"), {"since": 0, "limit": 10_000})
+
+        self.assertQueryBudgetAcrossSizes("change-list", make_request)
+
+
+class BenchCommandTestCase(TestCase):
+    def test_bench_reports_percentiles_and_saves_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            out = StringIO()
+            call_command("bench", repeat=2, sizes=[5], scenario=["resolve", "bulk"], save_baseline=path, stdout=out)
+            with open(path) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        self.assertEqual(
+            set(baseline),
+            {"resolve/overlaps=0", "resolve/overlaps=1", "resolve/overlaps=10", "bulk-category/products=5"},
+        )
+        for result in baseline.values():
+            self.assertEqual(set(result), {"runs", "ops_per_sec", "p50_ms", "p95_ms", "p99_ms"})
+        self.assertIn("resolve/overlaps=10", out.getvalue())
+        self.assertFalse(Category.objects.exists())
+
+    def test_bench_fails_on_regression(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            with open(path, "w") as baseline_file:
+                json.dump({"resolve/overlaps=0": {"p50_ms": 0.000001}}, baseline_file)
+            with self.assertRaisesMessage(CommandError, "resolve/overlaps=0"):
+                call_command("bench", repeat=2, scenario=["resolve/overlaps=0"], baseline=path, stdout=StringIO())
+
+
+class ConcurrentPriceWritesTestCase(TransactionTestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Concurrency")
+        self.product = Product.objects.create(name="Shared", category=self.category, sku="SH1")
+        self.other = Product.objects.create(name="Other", category=self.category, sku="OT1")
+
+    def write_price(self, product, price, start, end):
+        serializer = PriceSerializer(data={"product": product.id, "price": price, "start_date": start, "end_date": end})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    def start_thread(self, target, errors):
+        def run():
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_concurrent_writes_to_same_product_never_overlap(self):
+        writers = 8
+        barrier = threading.Barrier(writers)
+
+        def writer(n):
+            def run():
+                barrier.wait()
+                for i in range(6):
+                    start = date(2025, 1, 1) + timedelta(days=(n * 7 + i * 5) % 60)
+                    end = None if n == i == 0 else start + timedelta(days=10)
+                    self.write_price(self.product, Decimal(n * 10 + i + 1), start, end)
+
+            return run
+
+        errors = []
+        for thread in [self.start_thread(writer(n), errors) for n in range(writers)]:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        prices = list(Price.objects.filter(product=self.product).order_by("start_date"))
+        self.assertGreater(len(prices), 1)
+        for previous, current in zip(prices, prices[1:]):
+            self.assertIsNotNone(previous.end_date)
+            self.assertLess(previous.end_date, current.start_date)
+
+    def test_lock_on_one_product_does_not_block_other_products(self):
+        locked, release, errors = threading.Event(), threading.Event(), []
+
+        def hold_lock():
+            with transaction.atomic():
+                lock_products([self.product.pk])
+                locked.set()
+                release.wait(10)
+
+        holder = self.start_thread(hold_lock, errors)
+        try:
+            self.assertTrue(locked.wait(10))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = '2s'")
+                self.write_price(self.other, "10.00", date(2025, 1, 1), None)
+            with self.assertRaises(OperationalError), transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = '200ms'")
+                self.write_price(self.product, "20.00", date(2025, 1, 1), None)
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Price.objects.filter(product=self.other).count(), 1)
+        self.assertFalse(Price.objects.filter(product=self.product).exists())
+
+
+@override_settings(PRICE_BULK_PARALLEL={"CHUNK_SIZE": 10, "WORKERS": 3, "EXECUTOR": "thread"})
+class ParallelBulkPriceCreateTestCase(TransactionTestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Bulk")
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", category=self.category, sku=f"BK{i}") for i in range(25)
+        )
+        Price.objects.bulk_create(
+            Price(product=product, price=Decimal("5.00"), start_date=date(2025, 1, 1)) for product in self.products
+        )
+        self.url = reverse("price-bulk-create-by-category")
+        self.data = {"category_id": self.category.id, "price": "7.50", "start_date": "2025-06-01", "parallel": True}
+
+    def assertRepriced(self):
+        for product in self.products:
+            prices = Price.objects.filter(product=product).order_by("start_date")
+            self.assertEqual(prices.count(), 2)
+            self.assertPrice(prices[0], date(2025, 1, 1), date(2025, 5, 31), Decimal("5.00"))
+            self.assertPrice(prices[1], date(2025, 6, 1), None, Decimal("7.50"))
+
+    def assertPrice(self, price, start, end, value):
+        self.assertEqual((price.start_date, price.end_date, price.price), (start, end, value))
+
+    def test_parallel_run_processes_all_chunks(self):
+        response = self.client.post(self.url, self.data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data["status"], "completed")
+        self.assertEqual(response.data["total_chunks"], 3)
+        self.assertEqual(response.data["processed_products"], 25)
+        self.assertRepriced()
+
+    def test_failed_chunk_is_resumable(self):
+        failing_id = self.products[12].id
+        resolve = chunked.resolve_overlapping_prices
+
+        def fail_once(price_data, lock=True):
+            if price_data["product"].id == failing_id:
+                raise RuntimeError("worker crashed")
+            return resolve(price_data, lock=lock)
+
+        with mock.patch.object(chunked, "resolve_overlapping_prices", side_effect=fail_once):
+            response = self.client.post(self.url, self.data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(response.data["failed_chunks"], 1)
+        self.assertEqual(response.data["processed_products"], 15)
+        self.assertEqual(response.data["failed"][0]["error"], "worker crashed")
+        self.assertEqual(Price.objects.filter(product=self.products[12]).count(), 1)
+
+        response = self.client.post(reverse("price-run-resume", args=[response.data["id"]]))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data["processed_products"], 25)
+        self.assertEqual(response.data["failed"], [])
+        self.assertRepriced()
+
+    def test_run_left_running_by_a_dead_executor_is_resumable(self):
+        run = chunked.plan_price_run(self.category.id, Decimal("7.50"), date(2025, 6, 1), None)
+        chunked.process_price_chunk(run.chunks.order_by("pk").first().pk)
+        # The executor died after one chunk: nothing will ever move the run out of RUNNING.
+        PriceBulkRun.objects.filter(pk=run.pk).update(status=PriceBulkRun.RUNNING)
+
+        response = self.client.post(reverse("price-run-resume", args=[run.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data["status"], "completed")
+        self.assertEqual(response.data["processed_products"], 25)
+        self.assertRepriced()
+
+    def test_concurrent_resumes_process_each_chunk_once(self):
+        run = chunked.plan_price_run(self.category.id, Decimal("7.50"), date(2025, 6, 1), None)
+        PriceBulkRun.objects.filter(pk=run.pk).update(status=PriceBulkRun.FAILED)
+        both_started = threading.Barrier(2, timeout=5)
+        execute = chunked.execute_price_run
+        responses = []
+
+        def execute_together(run, **kwargs):
+            both_started.wait()
+            return execute(run, **kwargs)
+
+        def resume():
+            try:
+                responses.append(self.client.post(reverse("price-run-resume", args=[run.pk])).status_code)
+            finally:
+                connection.close()
+
+        with mock.patch("products.views.execute_price_run", side_effect=execute_together):
+            threads = [threading.Thread(target=resume) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(responses, [status.HTTP_201_CREATED] * 2)
+        self.assertEqual(PriceBulkRun.objects.get(pk=run.pk).status, PriceBulkRun.COMPLETED)
+        self.assertRepriced()
+
+
+@override_settings(PRICE_BULK_PARALLEL={"CHUNK_SIZE": 4, "WORKERS": 2, "EXECUTOR": "thread"})
+class BackgroundJobTestCase(TransactionTestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Background")
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", category=self.category, sku=f"BG{i}") for i in range(10)
+        )
+        self.url = reverse("price-bulk-create-by-category")
+        self.data = {"category_id": self.category.id, "price": "3.00", "start_date": "2025-06-01", "background": True}
+
+    def test_bulk_create_returns_202_and_worker_completes_job(self):
+        response = self.client.post(self.url, self.data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], Job.QUEUED)
+        self.assertTrue(response["Location"].endswith(reverse("job-detail", args=[response.data["id"]])))
+        self.assertFalse(Price.objects.exists())
+
+        call_command("run_worker", burst=True, stdout=StringIO())
+
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["status"], Job.SUCCEEDED, job["error"])
+        self.assertEqual((job["progress_done"], job["progress_total"]), (10, 10))
+        self.assertEqual(job["result"]["processed_products"], 10)
+        self.assertIsNotNone(job["run_seconds"])
+        self.assertEqual(Price.objects.filter(product__category=self.category).count(), 10)
+
+    def test_job_errors_are_reported(self):
+        empty = Category.objects.create(name="Empty")
+        response = self.client.post(self.url, {**self.data, "category_id": empty.id}, format="json")
+
+        call_command("run_worker", burst=True, stdout=StringIO())
+
+        job = Job.objects.get(pk=response.data["id"])
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("No products found in this category.", job.error)
+
+    def test_crashed_jobs_are_retried_until_attempts_run_out(self):
+        stale = timezone.now() - timedelta(minutes=5)
+        retried = Job.objects.create(
+            kind="prices.bulk_create_by_category", status=Job.RUNNING, attempts=1, heartbeat_at=stale
+        )
+        exhausted = Job.objects.create(
+            kind="prices.bulk_create_by_category", status=Job.RUNNING, attempts=3, heartbeat_at=stale
+        )
+        alive = Job.objects.create(
+            kind="prices.bulk_create_by_category", status=Job.RUNNING, attempts=1, heartbeat_at=timezone.now()
+        )
+
+        self.assertEqual(requeue_stale_jobs(stale_after=60), 2)
+
+        for job in (retried, exhausted, alive):
+            job.refresh_from_db()
+        self.assertEqual(retried.status, Job.QUEUED)
+        self.assertEqual(exhausted.status, Job.FAILED)
+        self.assertEqual(alive.status, Job.RUNNING)
+
+
+class SchemaTestCase(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.schema_dir = Path(directory.name)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=self.schema_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema.clear_cache()
+        self.addCleanup(schema.clear_cache)
+
+    def test_schema_is_generated_once_and_served_with_etag(self):
+        url = reverse("schema-json", kwargs={"format": ".json"})
+        with mock.patch.object(schema, "generate_schema", wraps=schema.generate_schema) as generate:
+            first = self.client.get(url)
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+            yaml = self.client.get(reverse("schema-json", kwargs={"format": ".yaml"}))
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn("/products/{id}/average-price/", json.loads(first.content)["paths"])
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(yaml.status_code, status.HTTP_200_OK)
+        self.assertEqual(yaml["Content-Type"], "application/yaml")
+
+    def test_schema_is_served_from_generated_file(self):
+        call_command("generate_schema", stdout=StringIO())
+        self.assertTrue((self.schema_dir / "openapi.yaml").exists())
+        (self.schema_dir / "openapi.json").write_bytes(b'{"swagger": "2.0"}')
+
+        with mock.patch.object(schema, "generate_schema") as generate:
+            response = self.client.get(reverse("schema-json", kwargs={"format": ".json"}))
+
+        generate.assert_not_called()
+        self.assertEqual(response.content, b'{"swagger": "2.0"}')
+
+    def test_documentation_pages(self):
+        for name in ("schema-swagger-ui", "schema-redoc"):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertContains(response, reverse("schema-json", kwargs={"format": ".json"}))
+
+    def test_api_request_path_does_not_import_drf_yasg(self):
+        code = (
+            "import sys, django; django.setup(); import shop.urls, products.views; "
+            "print(sorted(name for name in sys.modules if name.startswith('drf_yasg.')))"
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "shop.settings"}
+        output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "[]")
+
+
+class StartupTestCase(TestCase):
+    def test_import_time_is_reported(self):
+        # Wall-clock time depends on the machine; the budget itself is covered by the test below.
+        out = StringIO()
+        call_command("check_import_time", runs=1, budget_ms=float("inf"), stdout=out)
+        self.assertIn("shop.wsgi imports in", out.getvalue())
+
+    def test_import_time_over_budget_fails(self):
+        with self.assertRaisesMessage(CommandError, "budget 0 ms"):
+            call_command("check_import_time", runs=1, budget_ms=0, stdout=StringIO())
+
+    def test_admin_and_docs_are_loaded_lazily(self):
+        code = (
+            "import sys, shop.wsgi; "
+            "print(sorted(name for name in ('django.contrib.auth.admin', 'drf_yasg.views') if name in sys.modules))"
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "shop.settings"}
+        output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "[]")
+
+        response = self.client.get("/admin/")
+        self.assertRedirects(response, f"{reverse('admin:login')}?next={reverse('admin:index')}")
+
+    def test_reverse_does_not_load_admin(self):
+        # django.contrib.admin itself is imported as an installed app; its URLconf and autodiscover must wait.
+        code = (
+            "import sys, django; django.setup(); "
+            "from django.urls import reverse; reverse('job-detail', args=[1]); reverse('api-root'); "
+            "print(sorted(name for name in ('shop.admin_urls', 'django.contrib.auth.admin') if name in sys.modules))"
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "shop.settings"}
+        output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "[]")
+
+
+@override_settings(PRICE_TIMELINE_CACHE={"ENABLED": True, "MAX_PRODUCTS": 10_000})
+class PriceTimelineTestCase(APITransactionTestCase):
+    def setUp(self):
+        timeline_cache.clear()
+        self.category = Category.objects.create(name="Appliances")
+        self.product = Product.objects.create(name="Fridge", category=self.category, sku="FR1")
+        for price, start, end in (
+            ("300.00", date(2025, 6, 1), date(2025, 6, 10)),
+            ("400.00", date(2025, 6, 11), date(2025, 6, 20)),
+            ("350.50", date(2025, 7, 1), None),
+        ):
+            Price.objects.create(product=self.product, price=Decimal(price), start_date=start, end_date=end)
+
+    def test_price_at_and_weighted_average_match_a_day_by_day_scan(self):
+        timeline = PriceTimeline(
+            Price.objects.filter(product=self.product).values_list("start_date", "end_date", "price")
+        )
+        daily = {}
+        for day in (date(2025, 5, 31) + timedelta(days=n) for n in range(60)):
+            price = timeline.price_at(day)
+            expected = Price.objects.filter(product=self.product, start_date__lte=day).exclude(end_date__lt=day).first()
+            self.assertEqual(price, expected.price if expected else None, day)
+            daily[day] = price
+
+        for start, end in ((date(2025, 6, 5), date(2025, 7, 3)), (date(2025, 6, 12), date(2025, 6, 14))):
+            prices = [price for day, price in daily.items() if start <= day <= end and price is not None]
+            self.assertEqual(timeline.weighted_average(start, end), sum(prices) / len(prices))
+        self.assertIsNone(timeline.weighted_average(date(2025, 6, 21), date(2025, 6, 30)))
+
+    def test_cached_average_matches_database(self):
+        url = reverse("product-average-price", args=[self.product.id])
+        for group_by in ("week", "month"):
+            params = {"start_date": "2025-06-05", "end_date": "2025-07-31", "group_by": group_by}
+            with override_settings(PRICE_TIMELINE_CACHE={"ENABLED": False, "MAX_PRODUCTS": 10_000}):
+                expected = self.client.get(url, params).data
+            self.assertEqual(self.client.get(url, params).data, expected)
+
+    def test_weighted_average_by_month(self):
+        url = reverse("product-average-price", args=[self.product.id])
+        params = {"start_date": "2025-06-01", "end_date": "2025-07-10", "group_by": "month", "weighted": "true"}
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [
+                {"period": date(2025, 6, 1), "average_price": Decimal("350.00")},
+                {"period": date(2025, 7, 1), "average_price": Decimal("350.50")},
+            ],
+        )
+
+    def test_price_at_is_served_from_cache_and_invalidated_on_write(self):
+        url = reverse("product-price-at", args=[self.product.id])
+        self.assertEqual(self.client.get(url, {"date": "2025-06-15"}).data["price"], Decimal("400.00"))
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.client.get(url, {"date": "2025-06-25"}).data["price"])
+
+        self.client.post(
+            reverse("price-list"),
+            {"product": self.product.id, "price": "1.00", "start_date": "2025-06-21", "end_date": "2025-06-30"},
+            format="json",
+        )
+        self.assertEqual(self.client.get(url, {"date": "2025-06-25"}).data["price"], Decimal("1.00"))
+
+    @mock.patch.object(timeline_cache, "max_products", 2)
+    def test_cache_is_bounded_and_reports_memory(self):
+        for i in range(3):
+            product = Product.objects.create(name=f"Extra {i}", category=self.category, sku=f"EX{i}")
+            self.client.get(reverse("product-price-at", args=[product.id]), {"date": "2025-06-01"})
+        stats = timeline_cache.stats()
+        self.assertEqual(stats["products"], 2)
+        self.assertGreater(stats["bytes_per_product"], 0)
+        self.assertIn("price_timeline_cache_bytes_per_product ", self.client.get(reverse("metrics")).content.decode())
+
+
+class CategoryAnalyticsTestCase(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Electronics")
+        self.phone = Product.objects.create(name="Phone", category=self.category, sku="PH1")
+        self.tablet = Product.objects.create(name="Tablet", category=self.category, sku="TB1")
+        self.segments = [
+            (self.phone, "100.00", date(2024, 1, 1), date(2024, 1, 20)),
+            (self.phone, "120.00", date(2024, 1, 21), date(2024, 2, 10)),
+            (self.phone, "90.00", date(2024, 3, 1), None),
+            (self.tablet, "200.00", date(2023, 12, 1), date(2024, 2, 15)),
+        ]
+        for product, price, start, end in self.segments:
+            Price.objects.create(product=product, price=Decimal(price), start_date=start, end_date=end)
+
+    def daily_prices(self, start, end, product=None):
+        prices = []
+        for product_, price, segment_start, segment_end in self.segments:
+            first, last = max(start, segment_start), min(end, segment_end or end)
+            if product in (None, product_) and first <= last:
+                prices += [Decimal(price)] * ((last - first).days + 1)
+        return prices
+
+    def test_prices_near_the_column_maximum(self):
+        product = Product.objects.create(name="Yacht", category=self.category, sku="YA1")
+        Price.objects.create(
+            product=product, price=Decimal("99999999.99"), start_date=date(2024, 1, 1), end_date=date(2024, 1, 31)
+        )
+        params = {
+            "category": "Electronics",
+            "start_date": "2024-01-01",
+            "end_date": "2024-01-31",
+            "per_product": "true",
+        }
+        response = self.client.get(reverse("price-analytics-by-category"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["buckets"][0]["max_price"], 99999999.99)
+        yacht = next(entry for entry in response.data["products"] if entry["product"] == product.pk)
+        self.assertEqual(yacht["buckets"][0]["average_price"], 99999999.99)
+
+    def test_inverted_legacy_segments_are_ignored(self):
+        params = {"category": "Electronics", "start_date": "2024-01-01", "end_date": "2024-03-31", "bucket": "month"}
+        expected = self.client.get(reverse("price-analytics-by-category"), {**params, "per_product": "true"}).data
+        # Written without the resolver, like the historical imports.
+        Price.objects.bulk_create(
+            [
+                Price(product=self.phone, price=Decimal("1"), start_date=date(2024, 3, 10), end_date=date(2024, 1, 5)),
+                Price(product=self.phone, price=Decimal("1"), start_date=date(2024, 2, 20), end_date=date(2024, 2, 10)),
+            ]
+        )
+        response = self.client.get(reverse("price-analytics-by-category"), {**params, "per_product": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, expected)
+
+    def test_monthly_statistics_match_a_day_by_day_scan(self):
+        params = {"category": "Electronics", "start_date": "2024-01-10", "end_date": "2024-03-15", "bucket": "month"}
+        response = self.client.get(reverse("price-analytics-by-category"), {**params, "per_product": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        buckets = response.data["buckets"]
+        self.assertEqual(
+            [(entry["start_date"], entry["end_date"]) for entry in buckets],
+            [
+                (date(2024, 1, 10), date(2024, 1, 31)),
+                (date(2024, 2, 1), date(2024, 2, 29)),
+                (date(2024, 3, 1), date(2024, 3, 15)),
+            ],
+        )
+        for entry in buckets:
+            prices = self.daily_prices(entry["start_date"], entry["end_date"])
+            mean = sum(prices) / len(prices)
+            variance = sum((price - mean) ** 2 for price in prices) / len(prices)
+            self.assertAlmostEqual(entry["average_price"], float(mean), places=2)
+            self.assertEqual((entry["min_price"], entry["max_price"]), (float(min(prices)), float(max(prices))))
+            self.assertAlmostEqual(entry["volatility"], float(variance.sqrt()), places=3)
+        self.assertEqual([entry["products"] for entry in buckets], [2, 2, 1])
+
+        phone = next(entry for entry in response.data["products"] if entry["product"] == self.phone.id)
+        january = self.daily_prices(date(2024, 1, 10), date(2024, 1, 31), self.phone)
+        self.assertAlmostEqual(phone["buckets"][0]["average_price"], float(sum(january) / len(january)), places=2)
+        self.assertEqual(len(phone["buckets"]), 3)
+
+    def test_whole_window_and_unknown_category(self):
+        url = reverse("price-analytics-by-category")
+        params = {"category": "Electronics", "start_date": "2024-01-01", "end_date": "2024-01-31"}
+        (bucket,) = self.client.get(url, params).data["buckets"]
+        self.assertEqual((bucket["min_price"], bucket["max_price"]), (100.0, 200.0))
+        response = self.client.get(url, {**params, "category": "Missing"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PriceStatisticsTestCase(APITestCase):
+    def setUp(self):
+        self.prices = {"Electronics": [10, 20, 30, 45, 100], "Garden": [5, 7]}
+        for name, prices in self.prices.items():
+            category = Category.objects.create(name=name)
+            for i, price in enumerate(prices):
+                product = Product.objects.create(name=f"{name} {i}", category=category, sku=f"{name}-{i}")
+                start = date(2024, 1 + i % 2, 10)
+                Price.objects.create(product=product, price=Decimal(price), start_date=start, end_date=None)
+
+    def get(self, **params):
+        response = self.client.get(
+            reverse("price-statistics"), {"start_date": "2024-01-01", "end_date": "2024-12-31", **params}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def assertDistribution(self, row, prices):
+        import numpy as np
+
+        self.assertEqual(row["count"], len(prices))
+        self.assertEqual((row["min_price"], row["max_price"]), (min(prices), max(prices)))
+        for name, percentile in (("p10", 10), ("median", 50), ("p90", 90)):
+            self.assertAlmostEqual(row[name], np.percentile(prices, percentile), places=2)
+        self.assertAlmostEqual(float(row["stddev"]), np.std(prices, ddof=1), places=2)
+
+    def test_grouped_by_category(self):
+        rows = self.get(group_by="category")
+        self.assertEqual([row["category"] for row in rows], ["Electronics", "Garden"])
+        for row in rows:
+            self.assertDistribution(row, self.prices[row["category"]])
+
+    def test_grouped_by_category_and_month(self):
+        rows = self.get(group_by=["category", "month"], category="Electronics")
+        self.assertEqual(
+            [(row["category"], row["period"]) for row in rows],
+            [("Electronics", date(2024, 1, 1)), ("Electronics", date(2024, 2, 1))],
+        )
+        self.assertDistribution(rows[0], [10, 30, 100])
+        self.assertDistribution(rows[1], [20, 45])
+
+    def test_ungrouped_and_empty(self):
+        (row,) = self.get()
+        self.assertDistribution(row, self.prices["Electronics"] + self.prices["Garden"])
+        self.assertEqual(self.get(category="Missing"), [])
+
+    def test_week_and_month_are_exclusive(self):
+        response = self.client.get(
+            reverse("price-statistics"),
+            {"start_date": "2024-01-01", "end_date": "2024-12-31", "group_by": ["week", "month"]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductBulkUpsertTestCase(APITestCase):
+    def setUp(self):
+        self.electronics = Category.objects.create(name="Electronics")
+        self.books = Category.objects.create(name="Books")
+        self.phone = Product.objects.create(name="Phone", category=self.electronics, sku="PH1", description="Old")
+        self.url = reverse("product-bulk-upsert")
+
+    def test_creates_updates_and_reports_each_item(self):
+        items = [
+            {"sku": "PH1", "name": "Phone 2", "category": "Books", "description": "New"},
+            {"sku": "BK1", "name": "Novel", "category": "Books"},
+            {"sku": "BK2", "name": "Atlas", "category": "Maps"},
+            {"sku": "BK1", "name": "Novel again", "category": "Books"},
+            {"name": "No SKU", "category": "Books"},
+        ]
+        with self.settings(PRODUCT_BULK_UPSERT={"BATCH_SIZE": 1, "MAX_ITEMS": 10}):
+            response = self.client.post(self.url, {"products": items}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["created"], response.data["updated"], response.data["error"]), (1, 1, 3))
+
+        results = response.data["results"]
+        self.assertEqual([result["status"] for result in results], ["updated", "created", "error", "error", "error"])
+        self.assertEqual(results[0]["id"], self.phone.id)
+        self.assertIn("category", results[2]["errors"])
+        self.assertIn("sku", results[3]["errors"])
+        self.assertIn("sku", results[4]["errors"])
+
+        self.phone.refresh_from_db()
+        self.assertEqual((self.phone.name, self.phone.category, self.phone.description), ("Phone 2", self.books, "New"))
+        self.assertEqual(Product.objects.get(pk=results[1]["id"]).name, "Novel")
+        self.assertFalse(Product.objects.filter(sku="BK2").exists())
+
+    def test_values_survive_the_staging_copy(self):
+        items = [
+            {"sku": "TAB\t1", "name": "Back\\slash \\N", "category": "Books", "description": "Line\nbreak\r\nend"},
+            {"sku": "EMPTY", "name": "Empty", "category": "Books", "description": ""},
+            {"sku": "NULL", "name": "Null", "category": "Books", "description": None},
+        ]
+        response = self.client.post(self.url, {"products": items}, format="json")
+        self.assertEqual(response.data["created"], 3, response.data)
+        self.assertEqual(
+            {(product.sku, product.name, product.description) for product in Product.objects.exclude(pk=self.phone.pk)},
+            {("TAB\t1", "Back\\slash \\N", "Line\nbreak\r\nend"), ("EMPTY", "Empty", ""), ("NULL", "Null", None)},
+        )
+
+    def test_rejects_oversized_requests(self):
+        items = [{"sku": f"S{i}", "name": "Item", "category": "Books"} for i in range(3)]
+        with self.settings(PRODUCT_BULK_UPSERT={"BATCH_SIZE": 1000, "MAX_ITEMS": 2}):
+            response = self.client.post(self.url, {"products": items}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Product.objects.filter(sku="S0").exists())
+
+    def test_background_import(self):
+        items = [{"sku": f"S{i}", "name": "Item", "category": "Books"} for i in range(3)] + [{"sku": "X"}]
+        response = self.client.post(self.url, {"products": items, "background": True}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Product.objects.filter(sku="S0").exists())
+
+        with mock.patch("products.utils.jobs.heartbeat"):
+            call_command("run_worker", burst=True, stdout=StringIO())
+        job = Job.objects.get(pk=response.data["id"])
+        self.assertEqual(job.status, Job.SUCCEEDED, job.error)
+        self.assertEqual((job.result["created"], job.result["error"]), (3, 1))
+        self.assertEqual(job.result["errors"][0]["index"], 3)
+        self.assertEqual((job.progress_done, job.progress_total), (4, 4))
+
+
+class ProductSearchTestCase(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Audio")
+        self.speaker = Product.objects.create(
+            name="Wireless Speaker", category=category, sku="AUD-100", description="Portable bluetooth speaker"
+        )
+        self.headphones = Product.objects.create(
+            name="Studio Headphones", category=category, sku="AUD-200", description="Closed back, great for speakers"
+        )
+        Product.objects.create(name="Turntable", category=category, sku="VIN-300", description="Plays vinyl records")
+
+    def search(self, **params):
+        response = self.client.get(reverse("product-search"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def test_ranked_name_sku_and_description_matches(self):
+        results = self.search(q="wireles speaker")["results"]
+        self.assertEqual(results[0]["id"], self.speaker.id)
+        self.assertNotIn("search_vector", results[0])
+        self.assertEqual(results[0]["category"], "Audio")
+
+        self.assertEqual([product["sku"] for product in self.search(q="aud-2")["results"]], ["AUD-200"])
+        self.assertEqual([product["name"] for product in self.search(q="vinyl")["results"]], ["Turntable"])
+        self.assertEqual(self.search(q="zzzz")["results"], [])
+
+    def test_cursor_pagination(self):
+        first = self.search(q="aud", limit=1)
+        self.assertEqual(len(first["results"]), 1)
+        self.assertIsNotNone(first["next"])
+        second = self.client.get(first["next"]).data
+        self.assertEqual(len(second["results"]), 1)
+        self.assertEqual({first["results"][0]["id"], second["results"][0]["id"]}, {self.speaker.id, self.headphones.id})
+        self.assertIsNone(second["next"])
+
+    def test_cursor_pages_through_distinct_ranks(self):
+        # Similarities such as 1/3 are not exact in float4, so the cursor must not round-trip the rank lossily.
+        category = Category.objects.first()
+        expected = {
+            Product.objects.create(
+                name=f"Gadget {i}", category=category, sku=f"GD-{i}", description="phone " * i + "case " * (6 - i)
+            ).id
+            for i in range(1, 7)
+        }
+        seen = []
+        page = self.search(q="phone", limit=1)
+        while True:
+            seen.extend(product["id"] for product in page["results"])
+            if not page["next"]:
+                break
+            page = self.client.get(page["next"]).data
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), expected)
+        ranks = list(search_products("phone").order_by("-rank", "-id").values_list("rank", flat=True))
+        self.assertEqual(len(set(ranks)), len(ranks), "the product names should give distinct ranks")
+
+    @mock.patch("products.utils.search.SEARCH_CANDIDATES", 2)
+    def test_candidates_are_bounded_per_kind_of_match(self):
+        category = Category.objects.first()
+        for i in range(5):
+            Product.objects.create(name=f"Cable {i}", category=category, sku=f"CBL-{i}", description="copper wire")
+        for text in ("cable", "cbl-", "copper"):
+            self.assertEqual(len(self.search(q=text)["results"]), 2, text)
+
+    def test_query_is_required(self):
+        response = self.client.get(reverse("product-search"), {"q": "a"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductListFilterTestCase(APITestCase):
+    def setUp(self):
+        self.electronics = Category.objects.create(name="Electronics")
+        books = Category.objects.create(name="Books")
+        self.products = {}
+        for sku, category, prices in (
+            (
+                "E1",
+                self.electronics,
+                [("100.00", date(2025, 1, 1), date(2025, 5, 31)), ("80.00", date(2025, 6, 1), None)],
+            ),
+            ("E2", self.electronics, [("50.00", date(2025, 1, 1), None)]),
+            ("E3", self.electronics, [("80.00", date(2025, 6, 1), None)]),
+            ("E4", self.electronics, []),
+            ("B1", books, [("20.00", date(2025, 1, 1), None)]),
+        ):
+            product = Product.objects.create(name=sku, category=category, sku=sku)
+            self.products[sku] = product
+            for price, start, end in prices:
+                Price.objects.create(product=product, price=Decimal(price), start_date=start, end_date=end)
+
+    def list_skus(self, **params):
+        response = self.client.get(reverse("product-list"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [product["sku"] for product in response.data["results"]]
+
+    def test_price_date_defaults_to_the_local_date(self):
+        with mock.patch("django.utils.timezone.localdate", return_value=date(2025, 3, 1)):
+            self.assertEqual(self.list_skus(category="Electronics", min_price="60"), ["E1"])
+        with mock.patch("django.utils.timezone.localdate", return_value=date(2025, 7, 1)):
+            self.assertEqual(self.list_skus(category="Electronics", min_price="60"), ["E1", "E3"])
+
+    def test_category_and_price_range_on_a_date(self):
+        self.assertEqual(self.list_skus(category="Electronics"), ["E1", "E2", "E3", "E4"])
+        params = {"category": "Electronics", "price_date": "2025-03-01"}
+        self.assertEqual(self.list_skus(**params, min_price="60"), ["E1"])
+        self.assertEqual(self.list_skus(**params, max_price="60"), ["E2"])
+        self.assertEqual(self.list_skus(category="Electronics", price_date="2025-07-01", min_price="60"), ["E1", "E3"])
+
+    def test_ordering_by_price_is_stable_and_shows_the_price(self):
+        response = self.client.get(reverse("product-list"), {"price_date": "2025-07-01", "ordering": "price"})
+        results = response.data["results"]
+        self.assertEqual([product["sku"] for product in results], ["B1", "E2", "E1", "E3", "E4"])
+        self.assertEqual([product["current_price"] for product in results], [20, 50, 80, 80, None])
+        self.assertEqual(self.list_skus(price_date="2025-07-01", ordering="-price"), ["E3", "E1", "E2", "B1", "E4"])
+        self.assertNotIn("current_price", self.client.get(reverse("product-list")).data["results"][0])
+
+    def test_invalid_filters(self):
+        response = self.client.get(reverse("product-list"), {"min_price": "10", "max_price": "5"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("product-list"), {"ordering": "name"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductExpandPricesTestCase(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        self.phone = Product.objects.create(name="Phone", category=category, sku="PH1")
+        self.tablet = Product.objects.create(name="Tablet", category=category, sku="TB1")
+        for price, start, end in (
+            ("100.00", date(2025, 1, 1), date(2025, 5, 31)),
+            ("80.00", date(2025, 6, 1), date(2025, 8, 31)),
+            ("90.00", date(2025, 9, 1), None),
+        ):
+            Price.objects.create(product=self.phone, price=Decimal(price), start_date=start, end_date=end)
+
+    def test_detail_embeds_price_segments(self):
+        response = self.client.get(reverse("product-detail", args=[self.phone.pk]), {"expand": "prices"})
+        self.assertEqual(
+            response.data["prices"],
+            [
+                {"price": Decimal("100.00"), "start_date": "2025-01-01", "end_date": "2025-05-31"},
+                {"price": Decimal("80.00"), "start_date": "2025-06-01", "end_date": "2025-08-31"},
+                {"price": Decimal("90.00"), "start_date": "2025-09-01", "end_date": None},
+            ],
+        )
+        self.assertNotIn("prices", self.client.get(reverse("product-detail", args=[self.phone.pk])).data)
+
+    def test_list_embeds_segments_in_window(self):
+        params = {"expand": "prices", "prices_from": "2025-06-15", "prices_to": "2025-09-01"}
+        results = self.client.get(reverse("product-list"), params).data["results"]
+        self.assertEqual(
+            [[segment["start_date"] for segment in product["prices"]] for product in results],
+            [["2025-06-01", "2025-09-01"], []],
+        )
+        params = {"expand": "prices", "prices_from": "2025-10-01"}
+        results = self.client.get(reverse("product-list"), params).data["results"]
+        self.assertEqual([segment["price"] for segment in results[0]["prices"]], [Decimal("90.00")])
+
+    def test_invalid_expand_options(self):
+        url = reverse("product-list")
+        self.assertEqual(self.client.get(url, {"expand": "category"}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"expand": "prices", "prices_from": "2025-02-01", "prices_to": "2025-01-01"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Phone", category=self.category, sku="PH1", description="A long description. " * 50
+        )
+        Price.objects.create(product=self.product, price=10, start_date=date(2025, 1, 1))
+
+    def test_product_list_loads_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("product-list"), {"fields": "id,sku,name"})
+        self.assertEqual(response.data["results"], [{"id": self.product.pk, "sku": "PH1", "name": "Phone"}])
+        sql = context.captured_queries[-1]["sql"]
+        self.assertNotIn("description", sql)
+        self.assertNotIn("JOIN", sql)
+
+    def test_related_slug_and_annotations(self):
+        params = {"fields": "sku,category,current_price", "price_date": "2025-06-01"}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("product-list"), params)
+        self.assertEqual(
+            response.data["results"], [{"sku": "PH1", "category": "Electronics", "current_price": Decimal("10.00")}]
+        )
+        self.assertNotIn("description", context.captured_queries[-1]["sql"])
+
+        detail = self.client.get(reverse("product-detail", args=[self.product.pk]), {"fields": "name"})
+        self.assertEqual(detail.data, {"name": "Phone"})
+        expanded = self.client.get(
+            reverse("product-detail", args=[self.product.pk]), {"fields": "name,prices", "expand": "prices"}
+        )
+        self.assertEqual(len(expanded.data["prices"]), 1)
+
+    def test_category_and_price_endpoints(self):
+        response = self.client.get(reverse("category-list"), {"fields": "name"})
+        self.assertEqual(response.data["results"], [{"name": "Electronics"}])
+
+        data = {"product": self.product.pk, "price": "12.00", "start_date": "2025-03-01"}
+        response = self.client.post(reverse("price-list") + "?fields=id,price", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(set(response.data), {"id", "price"})
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse("product-list"), {"fields": "id,secret"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["fields"], ["Unknown field(s): secret."])
+        data = {"product": self.product.pk, "price": "12.00", "start_date": "2025-03-01"}
+        response = self.client.post(reverse("price-list") + "?fields=secret", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Price.objects.count(), 1)
+
+
+class ChangeFeedTestCase(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Electronics")
+        self.url = reverse("change-list")
+
+    def feed(self, since=0, limit=None):
+        params = {"since": since, **({"limit": limit} if limit else {})}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_price_and_product_changes_in_order(self):
+        product = self.client.post(
+            reverse("product-list"), {"name": "Phone", "sku": "PH1", "category": self.category.name}, format="json"
+        ).data
+        price = {"product": product["id"], "price": "10.00", "start_date": "2025-01-01", "end_date": "2025-12-31"}
+        self.client.post(reverse("price-list"), price, format="json")
+        # Splits the first price: it is deleted and its two remaining parts are recreated around the new one.
+        price = {**price, "price": "12.00", "start_date": "2025-06-01", "end_date": "2025-06-30"}
+        self.client.post(reverse("price-list"), price, format="json")
+
+        data = self.feed()
+        changes = [(change["model"], change["action"]) for change in data["changes"]]
+        self.assertEqual(changes[:3], [("product", "created"), ("price", "created"), ("price", "deleted")])
+        self.assertEqual(changes[3:].count(("price", "created")), 3)
+        self.assertEqual([change["seq"] for change in data["changes"]], list(range(1, len(changes) + 1)))
+        self.assertEqual(data["changes"][0]["data"]["sku"], "PH1")
+        self.assertEqual(
+            data["changes"][2]["data"], {"price": "10.00", "start_date": "2025-01-01", "end_date": "2025-12-31"}
+        )
+        self.assertEqual(data["next_since"], len(changes))
+        self.assertFalse(data["has_more"])
+        self.assertEqual(self.feed(since=data["next_since"])["changes"], [])
+
+    def test_pages_follow_since_cursor(self):
+        for i in range(5):
+            Product.objects.create(name=f"Phone {i}", sku=f"PH{i}", category=self.category)
+
+        first = self.feed(limit=2)
+        second = self.feed(since=first["next_since"], limit=2)
+        third = self.feed(since=second["next_since"], limit=2)
+
+        self.assertTrue(first["has_more"])
+        self.assertTrue(second["has_more"])
+        self.assertFalse(third["has_more"])
+        skus = [change["data"]["sku"] for page in (first, second, third) for change in page["changes"]]
+        self.assertEqual(skus, [f"PH{i}" for i in range(5)])
+
+    def test_bulk_upsert_is_logged(self):
+        Product.objects.create(name="Phone", sku="PH1", category=self.category)
+        items = [
+            {"sku": "PH1", "name": "Renamed", "category": self.category.name},
+            {"sku": "PH2", "name": "New", "category": self.category.name},
+        ]
+        self.client.post(reverse("product-bulk-upsert"), {"products": items}, format="json")
+
+        changes = self.feed()["changes"][1:]
+        self.assertEqual(
+            [(change["action"], change["data"]["name"]) for change in changes],
+            [("updated", "Renamed"), ("created", "New")],
+        )
+
+    def test_invalid_parameters(self):
+        response = self.client.get(self.url, {"since": -1, "limit": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"since", "limit"})
+
+
+class ChangeFeedOrderingTestCase(APITransactionTestCase):
+    def test_entry_committed_late_is_not_skipped(self):
+        category = Category.objects.create(name="Electronics")
+        written, release = threading.Event(), threading.Event()
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    Product.objects.create(name="Slow", sku="SLOW", category=category)
+                    written.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=slow_writer)
+        thread.start()
+        written.wait(10)
+        Product.objects.create(name="Fast", sku="FAST", category=category)
+        first = self.client.get(reverse("change-list"), {"since": 0}).data
+        release.set()
+        thread.join()
+        second = self.client.get(reverse("change-list"), {"since": first["next_since"]}).data
+
+        self.assertEqual([change["data"]["sku"] for change in first["changes"]], ["FAST"])
+        self.assertEqual([change["data"]["sku"] for change in second["changes"]], ["SLOW"])
+        self.assertGreater(second["changes"][0]["seq"], first["next_since"])
+
+
+class InvalidationBusTestCase(TransactionTestCase):
+    def setUp(self):
+        self.options = {**settings.INVALIDATION_BUS, "ENABLED": True, "POLL_INTERVAL": 0.1, "MAX_IDS": 3}
+        settings_override = override_settings(INVALIDATION_BUS=self.options)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(bus.stop)
+        self.category = Category.objects.create(name="Electronics")
+        self.products = [Product.objects.create(name=f"P{i}", sku=f"P{i}", category=self.category) for i in range(3)]
+
+    def listen(self):
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.autocommit = True
+        self.addCleanup(listener.close)
+        listener.cursor().execute(f"LISTEN {self.options['CHANNEL']}")
+        return listener
+
+    def received(self, listener):
+        select.select([listener], [], [], 1)
+        listener.poll()
+        messages = [json.loads(notify.payload) for notify in listener.notifies]
+        listener.notifies.clear()
+        return messages
+
+    def test_writes_are_sent_once_per_transaction_after_commit(self):
+        listener = self.listen()
+        with transaction.atomic():
+            for product in self.products[:2]:
+                Price.objects.create(product=product, price=Decimal("10.00"), start_date=date(2025, 1, 1))
+            listener.poll()
+            self.assertEqual(listener.notifies, [])
+
+        messages = self.received(listener)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]["origin"], process_origin())
+        self.assertEqual(messages[0]["changes"], {"product": [product.pk for product in self.products[:2]]})
+
+        with self.assertRaises(ValueError), transaction.atomic():
+            Price.objects.create(product=self.products[0], price=Decimal("11.00"), start_date=date(2026, 1, 1))
+            raise ValueError
+        self.assertEqual(self.received(listener), [])
+
+    def test_too_many_ids_invalidate_everything(self):
+        listener = self.listen()
+        bus.invalidate("product", range(1, 10))
+        self.assertEqual(self.received(listener)[0]["changes"], {"product": None})
+
+    def test_listener_evicts_entries_written_by_other_processes(self):
+        product = self.products[0]
+        evicted = threading.Event()
+        handler = mock.Mock(side_effect=lambda ids: ids and evicted.set())
+        bus.register("product", handler)
+        self.addCleanup(bus.handlers["product"].remove, handler)
+        bus.ensure_started()
+        self.assertTrue(bus.listening.wait(5))
+        timeline_cache.put(product.pk, PriceTimeline([]), timeline_cache.generation)
+
+        with connection.cursor() as cursor:
+            # A notification from this process is skipped: its caches were already updated by the writer.
+            own = {"origin": process_origin(), "changes": {"product": [product.pk]}}
+            other = {"origin": "other-node:1", "changes": {"product": [product.pk]}}
+            for message in (own, other):
+                cursor.execute("SELECT pg_notify(%s, %s)", [self.options["CHANNEL"], json.dumps(message)])
+
+        self.assertTrue(evicted.wait(5))
+        handler.assert_has_calls([mock.call(None), mock.call({product.pk})])
+        self.assertEqual(handler.call_count, 2)
+        self.assertIsNone(timeline_cache.get(product.pk))
+
+
+class CostThrottleTestCase(APITestCase):
+    def setUp(self):
+        options = {
+            **settings.COST_THROTTLE,
+            "CLIENT_CAPACITY": 10,
+            "CLIENT_RATE": 1,
+            "GLOBAL_CAPACITY": 15,
+            "GLOBAL_RATE": 0.1,
+        }
+        settings_override = override_settings(COST_THROTTLE=options)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name="Electronics")
+        Product.objects.bulk_create(
+            Product(name=f"Phone {i}", sku=f"PH{i}", category=self.category) for i in range(200)
+        )
+
+    def average_by_category(self, start_date, **extra):
+        params = {"category": self.category.name, "start_date": start_date, "end_date": "2025-12-31"}
+        return self.client.get(reverse("price-average-by-category"), params, **extra)
+
+    def test_cheap_requests_are_charged_one_token(self):
+        # The client bucket counts spent tokens per 10 second period and gives them back during the next one.
+        with mock.patch("products.throttling.time.time", return_value=3000.0) as clock:
+            for _ in range(10):
+                self.assertEqual(self.client.get(reverse("category-list")).status_code, status.HTTP_200_OK)
+            response = self.client.get(reverse("category-list"))
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response["Retry-After"], "11")
+
+            clock.return_value = 3010.0
+            response = self.client.get(reverse("category-list"))
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response["Retry-After"], "1")
+            clock.return_value = 3011.0
+            self.assertEqual(self.client.get(reverse("category-list")).status_code, status.HTTP_200_OK)
+
+    def test_cost_grows_with_date_range_and_category_size(self):
+        # A month of a 200 product category costs about 1.2 tokens, five years about 11 (capped at 10).
+        for _ in range(8):
+            self.assertEqual(self.average_by_category("2025-12-01").status_code, status.HTTP_200_OK)
+        cache.clear()
+        self.assertEqual(self.average_by_category("2021-01-01").status_code, status.HTTP_200_OK)
+        response = self.average_by_category("2021-01-01")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreaterEqual(int(response["Retry-After"]), 9)
+
+    def test_global_budget_is_shared_by_all_clients(self):
+        for i in range(15):
+            address = f"10.0.0.{i % 3}"
+            self.assertEqual(
+                self.client.get(reverse("category-list"), REMOTE_ADDR=address).status_code, status.HTTP_200_OK
+            )
+        response = self.client.get(reverse("category-list"), REMOTE_ADDR="10.0.0.99")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class CostThrottleConcurrencyTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @override_settings(
+        COST_THROTTLE={
+            **settings.COST_THROTTLE,
+            "CLIENT_CAPACITY": 10,
+            "CLIENT_RATE": 1e-6,
+            "GLOBAL_CAPACITY": 5,
+            "GLOBAL_RATE": 1e-6,
+        }
+    )
+    def test_concurrent_clients_share_the_global_bucket(self):
+        # Barely refilling buckets: of 12 concurrent one-token requests from 4 clients exactly 5 fit globally.
+        results = []
+        start = threading.Barrier(12)
+
+        def request(client):
+            throttle = CostThrottle()
+            start.wait()
+            allowed = throttle.allow_request(
+                SimpleNamespace(user=AnonymousUser(), META={"REMOTE_ADDR": f"10.0.0.{client}"}), None
+            )
+            results.append((client, allowed, throttle.wait()))
+
+        threads = [threading.Thread(target=request, args=(i % 4,)) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed for _, allowed, _ in results), 5)
+        self.assertTrue(all(wait > 0 for _, allowed, wait in results if not allowed))
+
+        # Client buckets are charged only for the requests that were let through.
+        window = int(time.time() // (10 / 1e-6))
+        for client in range(4):
+            self.assertEqual(
+                cache.get(f"throttle:cost:ip:10.0.0.{client}:{window}"),
+                sum(allowed for other, allowed, _ in results if other == client) * 1000,
+            )
+
+
+class QueryTimeoutTestCase(TransactionTestCase):
+    def setUp(self):
+        registry.reset()
+        self.options = {**settings.QUERY_TIMEOUTS, "ROUTES": {"price-list": {"LOCK": 100}}, "RETRY_AFTER": 7}
+        settings_override = override_settings(QUERY_TIMEOUTS=self.options)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(name="Phone", category=self.category, sku="PH1")
+
+    def hold_product_lock(self):
+        locked, release = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with transaction.atomic():
+                    lock_products([self.product.pk])
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        locked.wait(10)
+
+    def assertTimedOut(self, response, route, reason):
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertIn(
+            f'http_request_timeouts_total{{route="{route}",reason="{reason}"}} 1',
+            self.client.get(reverse("metrics")).content.decode(),
+        )
+
+    def test_route_timeouts_are_applied_per_transaction(self):
+        self.options["ROUTES"] = {"product-list": {"STATEMENT": 1234}}
+        request = RequestFactory().get(reverse("product-list"))
+        request.resolver_match = resolve(request.path)
+
+        def show_timeouts(cursor):
+            cursor.execute("SELECT current_setting('statement_timeout'), current_setting('lock_timeout')")
+            return cursor.fetchone()
+
+        with connection.execute_wrapper(QueryTimeouts(request)), connection.cursor() as cursor:
+            autocommit = show_timeouts(cursor)
+            with transaction.atomic():
+                cursor.execute("SELECT 1")
+                in_transaction = show_timeouts(cursor)
+        self.assertEqual(autocommit, ("1234ms", "3s"))
+        self.assertEqual(in_transaction, ("1234ms", "3s"))
+        with connection.cursor() as cursor:
+            self.assertEqual(show_timeouts(cursor), ("0", "0"))
+
+    def test_statement_timeout_returns_503(self):
+        self.options["ROUTES"] = {"product-detail": {"STATEMENT": 50}}
+        slow = Product.objects.extra(where=["pg_sleep(1) IS NOT NULL"])
+        with mock.patch("products.views.ProductViewSet.get_queryset", return_value=slow):
+            response = self.client.get(reverse("product-detail", args=[self.product.pk]))
+        self.assertTimedOut(response, "product-detail", "statement_timeout")
+
+    def test_lock_timeout_returns_503(self):
+        self.hold_product_lock()
+        data = {"product": self.product.pk, "price": "5.00", "start_date": "2025-01-01"}
+        response = self.client.post(reverse("price-list"), data, content_type="application/json")
+        self.assertTimedOut(response, "price-list", "lock_timeout")
+
+    def test_bulk_create_by_category_timeout_is_not_a_500(self):
+        self.options["ROUTES"] = {"price-bulk-create-by-category": {"LOCK": 100}}
+        self.hold_product_lock()
+        data = {"category_id": self.category.pk, "price": "5.00", "start_date": "2025-01-01"}
+        response = self.client.post(reverse("price-bulk-create-by-category"), data, content_type="application/json")
+        self.assertTimedOut(response, "price-bulk-create-by-category", "lock_timeout")
+        self.assertFalse(Price.objects.exists())
+
+
+class CompactPricesTestCase(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(name="Phone", category=category, sku="PH1")
+        self.other = Product.objects.create(name="Tablet", category=category, sku="TB1")
+        segments = [
+            (self.product, 15, date(2025, 7, 1), date(2025, 7, 10)),
+            (self.product, 15, date(2025, 7, 11), date(2025, 7, 20)),
+            (self.product, 15, date(2025, 7, 21), None),
+            (self.product, 10, date(2025, 6, 1), date(2025, 6, 30)),
+            (self.other, 10, date(2025, 7, 1), date(2025, 7, 10)),
+            (self.other, 12, date(2025, 7, 11), date(2025, 7, 20)),
+            (self.other, 12, date(2025, 7, 22), None),
+        ]
+        # bulk_create bypasses the resolver, like data written before it coalesced neighbours.
+        Price.objects.bulk_create(
+            Price(product=product, price=price, start_date=start, end_date=end)
+            for product, price, start, end in segments
+        )
+
+    def segments(self, product):
+        return list(product.prices.order_by("start_date").values_list("start_date", "end_date", "price"))
+
+    def test_compacts_back_to_back_equal_prices(self):
+        out = StringIO()
+        with mock.patch.object(bus, "invalidate") as invalidate:
+            call_command("compact_prices", batch_size=1, stdout=out)
+
+        self.assertIn("Removed 2 price row(s) from 1 product(s) in 2 batch(es).", out.getvalue())
+        self.assertEqual(
+            self.segments(self.product),
+            [(date(2025, 6, 1), date(2025, 6, 30), Decimal("10.00")), (date(2025, 7, 1), None, Decimal("15.00"))],
+        )
+        self.assertEqual(len(self.segments(self.other)), 3)
+        changes = ChangeLogEntry.objects.filter(model=ChangeLogEntry.PRICE).order_by("action", "object_id")
+        self.assertEqual([change.action for change in changes], ["deleted", "deleted", "updated"])
+        self.assertEqual(changes[2].data, {"price": "15.00", "start_date": "2025-07-01", "end_date": None})
+        invalidate.assert_any_call("product", {self.product.pk})
+
+    def test_merged_rows_are_recorded_in_the_history(self):
+        call_command("compact_prices", stdout=StringIO())
+        history = PriceChangeHistory.objects.order_by("start_date").values_list(
+            "product_id", "old_price", "start_date", "end_date"
+        )
+        self.assertEqual(
+            list(history),
+            [
+                (self.product.pk, Decimal("15.00"), date(2025, 7, 1), date(2025, 7, 10)),
+                (self.product.pk, Decimal("15.00"), date(2025, 7, 11), date(2025, 7, 20)),
+                (self.product.pk, Decimal("15.00"), date(2025, 7, 21), None),
+            ],
+        )
+
+    def test_dry_run_only_counts(self):
+        out = StringIO()
+        call_command("compact_prices", dry_run=True, stdout=out)
+        self.assertIn("Would remove 2 price row(s) from 1 product(s) in 1 batch(es).", out.getvalue())
+        self.assertEqual(Price.objects.count(), 7)
+
+
+class CatalogSnapshotTestCase(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        snapshots = override_settings(CATALOG_SNAPSHOTS={"DIR": self.directory, "CHUNK_SIZE": 2, "KEEP": 2})
+        snapshots.enable()
+        self.addCleanup(snapshots.disable)
+        category = Category.objects.create(name="Electronics")
+        products = [Product.objects.create(name=f"Phone {i}", category=category, sku=f"PH{i}") for i in range(3)]
+        Price.objects.create(product=products[0], price=10, start_date=date(2025, 7, 1), end_date=date(2025, 7, 10))
+        Price.objects.create(product=products[0], price=12, start_date=date(2025, 7, 11))
+        Price.objects.create(product=products[1], price=20, start_date=date(2025, 7, 1))
+        call_command("snapshot_catalog", "--date", "2025-07-05", stdout=StringIO())
+        self.url = reverse("snapshot-file", args=["catalog-2025-07-05.ndjson.gz"])
+
+    def test_default_date_is_the_local_date(self):
+        with mock.patch("django.utils.timezone.localdate", return_value=date(2025, 7, 9)):
+            call_command("snapshot_catalog", stdout=StringIO())
+        self.assertTrue((self.directory / "catalog-2025-07-09.ndjson.gz").exists())
+
+    def test_snapshot_contains_price_active_on_date(self):
+        with gzip.open(self.directory / "catalog-2025-07-05.ndjson.gz") as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual([record["sku"] for record in records], ["PH0", "PH1", "PH2"])
+        self.assertEqual([record["price"] for record in records], ["10.00", "20.00", None])
+        self.assertEqual(records[0]["category"], "Electronics")
+
+    def test_index_lists_snapshots_and_keeps_the_newest(self):
+        call_command("snapshot_catalog", "--date", "2025-07-15", stdout=StringIO())
+        call_command("snapshot_catalog", "--date", "2025-07-20", stdout=StringIO())
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("snapshot-index"))
+        snapshots = json.loads(b"".join(response.streaming_content))["snapshots"]
+        self.assertEqual([snapshot["date"] for snapshot in snapshots], ["2025-07-20", "2025-07-15"])
+        self.assertEqual(snapshots[0]["products"], 3)
+        self.assertFalse((self.directory / "catalog-2025-07-05.ndjson.gz").exists())
+
+    def test_snapshot_is_served_with_validators(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        content = b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(content, (self.directory / "catalog-2025-07-05.ndjson.gz").read_bytes())
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_requests(self):
+        content = (self.directory / "catalog-2025-07-05.ndjson.gz").read_bytes()
+        partial = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(partial.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(partial["Content-Range"], f"bytes 10-19/{len(content)}")
+        self.assertEqual(b"".join(partial.streaming_content), content[10:20])
+
+        suffix = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(suffix.streaming_content), content[-5:])
+
+        stale = self.client.get(self.url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f"bytes={len(content)}-")
+        self.assertEqual(unsatisfiable.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(unsatisfiable["Content-Range"], f"bytes */{len(content)}")
+
+    def test_unknown_snapshot_is_not_found(self):
+        self.assertEqual(self.client.get(reverse("snapshot-file", args=["..secret"])).status_code, 404)
+        missing = reverse("snapshot-file", args=["catalog-2024-01-01.ndjson.gz"])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class CheckPricesTestCase(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        self.broken = Product.objects.create(name="Phone", category=category, sku="PH1")
+        self.clean = Product.objects.create(name="Tablet", category=category, sku="TB1")
+        segments = [
+            (self.broken, 10, date(2025, 1, 1), date(2025, 12, 31)),
+            (self.broken, 12, date(2025, 3, 1), date(2025, 3, 31)),
+            (self.broken, 14, date(2025, 6, 1), date(2025, 6, 30)),
+            (self.broken, 16, date(2025, 5, 10), date(2025, 5, 1)),
+            (self.broken, 20, date(2026, 1, 1), None),
+            (self.broken, 22, date(2026, 6, 1), None),
+            (self.clean, 10, date(2025, 1, 1), date(2025, 6, 30)),
+            (self.clean, 12, date(2025, 7, 1), None),
+        ]
+        # Written without the resolver, like the historical imports.
+        Price.objects.bulk_create(
+            Price(product=product, price=price, start_date=start, end_date=end)
+            for product, price, start, end in segments
+        )
+
+    def segments(self, product):
+        return list(product.prices.order_by("start_date").values_list("price", "start_date", "end_date"))
+
+    def test_reports_issues_without_changing_prices(self):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "Found 4 price issue(s) in 1 product(s)"):
+            call_command("check_prices", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split(":")[0] for line in lines], ["overlap", "inverted", "overlap", "open_ended"])
+        self.assertTrue(all(f"product {self.broken.pk}," in line for line in lines))
+        self.assertEqual(Price.objects.count(), 8)
+
+    def test_repair_rewrites_timeline(self):
+        out = StringIO()
+        with mock.patch.object(bus, "invalidate") as invalidate:
+            call_command("check_prices", "--repair", stdout=out)
+
+        self.assertIn("1 deleted, 2 updated, 2 created", out.getvalue())
+        self.assertEqual(
+            self.segments(self.broken),
+            [
+                (Decimal("10.00"), date(2025, 1, 1), date(2025, 2, 28)),
+                (Decimal("12.00"), date(2025, 3, 1), date(2025, 3, 31)),
+                (Decimal("10.00"), date(2025, 4, 1), date(2025, 5, 31)),
+                (Decimal("14.00"), date(2025, 6, 1), date(2025, 6, 30)),
+                (Decimal("10.00"), date(2025, 7, 1), date(2025, 12, 31)),
+                (Decimal("20.00"), date(2026, 1, 1), date(2026, 5, 31)),
+                (Decimal("22.00"), date(2026, 6, 1), None),
+            ],
+        )
+        self.assertEqual(len(self.segments(self.clean)), 2)
+        self.assertEqual(PriceChangeHistory.objects.filter(product=self.broken).count(), 3)
+        actions = ChangeLogEntry.objects.filter(model=ChangeLogEntry.PRICE).values_list("action", flat=True)
+        self.assertEqual(sorted(actions), ["created", "created", "deleted", "updated", "updated"])
+        invalidate.assert_any_call("product", {self.broken.pk})
+
+        out = StringIO()
+        call_command("check_prices", stdout=out)
+        self.assertIn("No price issues found.", out.getvalue())
+
+
+class BulkClosePriceTestCase(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Electronics")
+        other = Category.objects.create(name="Books")
+        self.phone = Product.objects.create(name="Phone", category=self.category, sku="PH1")
+        self.tablet = Product.objects.create(name="Tablet", category=self.category, sku="TB1")
+        self.book = Product.objects.create(name="Book", category=other, sku="BK1")
+        for product in (self.phone, self.tablet, self.book):
+            Price.objects.create(product=product, price=10, start_date=date(2025, 1, 1), end_date=date(2025, 3, 31))
+            Price.objects.create(product=product, price=12, start_date=date(2025, 4, 1), end_date=None)
+        Price.objects.filter(product=self.phone, price=12).update(end_date=date(2025, 7, 31))
+        Price.objects.create(product=self.phone, price=15, start_date=date(2025, 8, 1), end_date=None)
+        ChangeLogEntry.objects.all().delete()
+        self.url = reverse("price-bulk-close")
+
+    def segments(self, product):
+        return list(product.prices.order_by("start_date").values_list("price", "start_date", "end_date"))
+
+    def test_closes_category_prices(self):
+        with mock.patch.object(bus, "invalidate") as invalidate:
+            response = self.client.post(
+                self.url, {"category_id": self.category.id, "date": "2025-06-01"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"date": date(2025, 6, 1), "products": 2, "closed": 2, "deleted": 1})
+        self.assertEqual(
+            self.segments(self.phone),
+            [
+                (Decimal("10.00"), date(2025, 1, 1), date(2025, 3, 31)),
+                (Decimal("12.00"), date(2025, 4, 1), date(2025, 5, 31)),
+            ],
+        )
+        self.assertEqual(self.segments(self.book)[-1], (Decimal("12.00"), date(2025, 4, 1), None))
+        history = PriceChangeHistory.objects.filter(product=self.phone).order_by("start_date")
+        self.assertEqual([(row.old_price, row.end_date) for row in history], [(12, date(2025, 7, 31)), (15, None)])
+        self.assertEqual(PriceChangeHistory.objects.count(), 3)
+        actions = ChangeLogEntry.objects.values_list("product_id", "action").order_by("product_id", "action")
+        self.assertEqual(
+            list(actions), [(self.phone.pk, "deleted"), (self.phone.pk, "updated"), (self.tablet.pk, "updated")]
+        )
+        invalidate.assert_called_once_with("product", {self.phone.pk, self.tablet.pk})
+
+    def test_closes_given_products(self):
+        response = self.client.post(
+            self.url, {"product_ids": [self.tablet.pk, self.book.pk], "date": "2025-02-01"}, format="json"
+        )
+
+        self.assertEqual(response.data["products"], 2)
+        self.assertEqual(response.data["closed"], 2)
+        self.assertEqual(response.data["deleted"], 2)
+        self.assertEqual(self.segments(self.book), [(Decimal("10.00"), date(2025, 1, 1), date(2025, 1, 31))])
+        self.assertEqual(len(self.segments(self.phone)), 3)
+
+    def test_requires_exactly_one_scope(self):
+        both = self.client.post(
+            self.url,
+            {"category_id": self.category.id, "product_ids": [self.phone.pk], "date": "2025-06-01"},
+            format="json",
+        )
+        neither = self.client.post(self.url, {"date": "2025-06-01"}, format="json")
+        missing = self.client.post(self.url, {"category_id": 999, "date": "2025-06-01"}, format="json")
+        self.assertEqual(both.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(neither.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(missing.data["category_id"], ["Category does not exist."])
@@ -0,0 +1,212 @@
+import hashlib
+import math
+import time
+from datetime import date
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from rest_framework.throttling import BaseThrottle
+
+from .models import Product
+
+# One cost unit is roughly one product-year of prices to scan.
+DAYS_PER_UNIT = 365
+PRODUCTS_PER_UNIT = 100
+GRANULARITY = {"week": 4, "month": 2, "quarter": 1, "year": 1}
+# Writes hold row locks and produce WAL, so a written row costs more than a read one.
+WRITE_FACTOR = 5
+
+
+def parse_days(params) -> int:
+    try:
+        start_date = date.fromisoformat(params["start_date"])
+        end_date = date.fromisoformat(params["end_date"])
+    except (KeyError, TypeError, ValueError):
+        return 1
+    return max((end_date - start_date).days + 1, 1)
+
+
+def category_size(name: Optional[str] = None, category_id=None) -> int:
+    """Products in a category (all products when neither is given), cached so only the first estimate queries."""
+    if category_id is not None:
+        key = f"throttle:category-size:id:{category_id}"
+    else:
+        key = f"throttle:category-size:name:{hashlib.sha256((name or '').encode()).hexdigest()}"
+    size = cache.get(key)
+    if size is None:
+        products = Product.objects.all()
+        if category_id is not None:
+            products = products.filter(category_id=category_id)
+        elif name is not None:
+            products = products.filter(category__name=name)
+        size = products.count()
+        cache.set(key, size, settings.COST_THROTTLE["CATEGORY_SIZE_TIMEOUT"])
+    return size
+
+
+def scan_cost(days: int, products: int, granularity: int = 1) -> float:
+    return 1 + days / DAYS_PER_UNIT * products / PRODUCTS_PER_UNIT * granularity
+
+
+def average_by_category_cost(request) -> float:
+    params = request.query_params
+    return scan_cost(parse_days(params), category_size(params.get("category")))
+
+
+def analytics_by_category_cost(request) -> float:
+    params = request.query_params
+    granularity = GRANULARITY.get(params.get("bucket"), 1) * (2 if params.get("per_product") == "true" else 1)
+    return scan_cost(parse_days(params), category_size(params.get("category")), granularity)
+
+
+def statistics_cost(request) -> float:
+    params = request.query_params
+    granularity = max([GRANULARITY.get(group, 1) for group in params.getlist("group_by")] or [1])
+    return scan_cost(parse_days(params), category_size(params.get("category")), granularity)
+
+
+def average_price_cost(request) -> float:
+    params = request.query_params
+    return scan_cost(parse_days(params), 1, GRANULARITY.get(params.get("group_by"), 1))
+
+
+def bulk_create_by_category_cost(request) -> float:
+    try:
+        category_id = int(request.data.get("category_id"))
+    except (AttributeError, TypeError, ValueError):
+        return 1
+    return 1 + category_size(category_id=category_id) / PRODUCTS_PER_UNIT * WRITE_FACTOR
+
+
+def bulk_close_cost(request) -> float:
+    product_ids = request.data.get("product_ids") if hasattr(request.data, "get") else None
+    if isinstance(product_ids, list):
+        return 1 + len(product_ids) / PRODUCTS_PER_UNIT * WRITE_FACTOR
+    return bulk_create_by_category_cost(request)
+
+
+def bulk_upsert_cost(request) -> float:
+    products = request.data.get("products") if hasattr(request.data, "get") else None
+    return 1 + (len(products) if isinstance(products, list) else 0) / PRODUCTS_PER_UNIT * WRITE_FACTOR
+
+
+# Estimated cost per view action; every other request costs one token.
+COST_ESTIMATORS = {
+    "average_by_category": average_by_category_cost,
+    "analytics_by_category": analytics_by_category_cost,
+    "statistics": statistics_cost,
+    "average_price": average_price_cost,
+    "bulk_create_by_category": bulk_create_by_category_cost,
+    "bulk_upsert": bulk_upsert_cost,
+    "bulk_close": bulk_close_cost,
+}
+
+
+# Tokens are counted in thousandths, so fractional costs can be charged with the cache's integer incr.
+SCALE = 1000
+
+
+class TokenBucket:
+    """
+    A bucket of ``capacity`` tokens refilling at ``rate`` per second, kept in a cache shared by all workers
+    as one spent-token counter per refill period (``capacity / rate`` seconds). Tokens spent in the previous
+    period are given back continuously over the current one, which approximates a token bucket with nothing
+    but atomic ``add``, ``incr`` and ``decr``: concurrent charges are never lost and no lock is held.
+    """
+
+    def __init__(self, store, key: str, capacity: float, rate: float):
+        self.store = store
+        self.key = key
+        self.capacity = capacity * SCALE
+        self.period = capacity / rate
+        self.charged = None
+
+    def charge(self, cost: float, now: float) -> float:
+        """Take ``cost`` (capped at the capacity) and return 0, or give it back and return the seconds to wait."""
+        window, elapsed = divmod(now / self.period, 1)
+        current, previous = f"{self.key}:{int(window)}", f"{self.key}:{int(window) - 1}"
+        amount = round(min(cost * SCALE, self.capacity))
+        spent = self.incr(current, amount)
+        carried = (self.store.get(previous) or 0) * (1 - elapsed)
+        excess = carried + spent - self.capacity
+        if excess <= 0:
+            self.charged = (current, amount)
+            return 0
+        self.store.decr(current, amount)
+        if carried >= excess:
+            # The previous period's tokens come back fast enough.
+            return excess / carried * (1 - elapsed) * self.period
+        # Otherwise the tokens other requests spent in this period have to come back too, once it is the
+        # previous one.
+        return (1 - elapsed + (spent - self.capacity) / (spent - amount)) * self.period
+
+    def incr(self, key: str, amount: int) -> int:
+        # Counters are kept for two periods: the one they count and the next, which reads them as previous.
+        timeout = math.ceil(2 * self.period) + 1
+        self.store.add(key, 0, timeout)
+        try:
+            return self.store.incr(key, amount)
+        except ValueError:
+            # The counter expired between add and incr.
+            self.store.add(key, 0, timeout)
+            return self.store.incr(key, amount)
+
+    def refund(self) -> None:
+        if self.charged:
+            try:
+                self.store.decr(*self.charged)
+            except ValueError:
+                pass
+            self.charged = None
+
+
+class CostThrottle(BaseThrottle):
+    """
+    Charges every request its estimated cost (date range width, grouping granularity, category or batch
+    size) against a per-client and a global token bucket, so a few expensive sweeps are limited as much
+    as many cheap requests. A request is let through only when both buckets hold enough tokens: the client
+    bucket is charged first and refunded when the global one is empty. The limits hold across workers only
+    when ``COST_THROTTLE["CACHE"]`` is a cache they share whose ``incr`` is atomic (Redis or Memcached).
+    """
+
+    def __init__(self):
+        self.options = settings.COST_THROTTLE
+        self.duration = None
+
+    def get_cost(self, request, view) -> float:
+        estimator = COST_ESTIMATORS.get(getattr(view, "action", None))
+        return estimator(request) if estimator else 1
+
+    def get_client(self, request) -> str:
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view) -> bool:
+        if not self.options["ENABLED"]:
+            return True
+        cost = self.get_cost(request, view)
+        store = caches[self.options["CACHE"]]
+        now = time.time()
+        buckets = [
+            TokenBucket(
+                store,
+                f"throttle:cost:{self.get_client(request)}",
+                self.options["CLIENT_CAPACITY"],
+                self.options["CLIENT_RATE"],
+            ),
+            TokenBucket(store, "throttle:cost:global", self.options["GLOBAL_CAPACITY"], self.options["GLOBAL_RATE"]),
+        ]
+        self.duration = None
+        for index, bucket in enumerate(buckets):
+            wait = bucket.charge(cost, now)
+            if wait:
+                for charged in buckets[:index]:
+                    charged.refund()
+                self.duration = max(wait, 1e-3)
+                return False
+        return True
+
+    def wait(self) -> Optional[float]:
+        return self.duration
@@ -1,13 +1,27 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CategoryViewSet, PriceViewSet, ProductViewSet
+from .views import (
+    CategoryViewSet,
+    ChangeViewSet,
+    JobViewSet,
+    PriceBulkRunViewSet,
+    PriceViewSet,
+    ProductViewSet,
+    snapshot_file,
+    snapshot_index,
+)
 
 router = DefaultRouter()
 router.register("products", ProductViewSet, basename="product")
 router.register("categories", CategoryViewSet, basename="category")
 router.register("prices", PriceViewSet, basename="price")
+router.register("price-runs", PriceBulkRunViewSet, basename="price-run")
+router.register("jobs", JobViewSet, basename="job")
+router.register("changes", ChangeViewSet, basename="change")
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("snapshots/", snapshot_index, name="snapshot-index"),
+    path("snapshots/<str:name>", snapshot_file, name="snapshot-file"),
 ]
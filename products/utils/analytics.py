@@ -0,0 +1,183 @@
+from datetime import date, timedelta
+from typing import List, Optional
+
+import numpy as np
+from django.db import connection
+from django.db.models import BigIntegerField, F, Func, IntegerField, Q, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+
+from products.models import Price
+
+BUCKET_UNITS = {"week": "W", "month": "M", "quarter": "M", "year": "Y"}
+
+
+class DaysSince(Func):
+    """Whole days from ``origin`` to a date expression, computed by Postgres as an integer."""
+
+    template = "(%(expressions)s - %(origin)s)"
+    output_field = IntegerField()
+
+    def __init__(self, expression, origin: date):
+        super().__init__(expression)
+        self.origin = origin
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(compiler, connection, origin="%s::date", **extra_context)
+        return sql, (*params, self.origin)
+
+
+class CategorySegments:
+    """Price segments of one category clipped to a window, as columns of day offsets from the window start."""
+
+    __slots__ = ("product_ids", "starts", "ends", "prices")
+
+    def __init__(self, product_ids, starts, ends, prices):
+        self.product_ids = product_ids
+        self.starts = starts
+        self.ends = ends
+        self.prices = prices
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+
+def load_category_segments(category_id: int, start_date: date, end_date: date) -> CategorySegments:
+    # Postgres returns plain integers (day offsets and cents), so the rows are read straight from the cursor
+    # into one integer matrix without building any date, Decimal or model objects.
+    segments = (
+        Price.objects.filter(
+            Q(start_date__lte=end_date),
+            Q(end_date__gte=start_date) | Q(end_date__isnull=True),
+            # Legacy segments ending before they start cover no day (see check_prices).
+            Q(end_date__gte=F("start_date")) | Q(end_date__isnull=True),
+            product__category_id=category_id,
+        )
+        .annotate(
+            start=DaysSince(Greatest("start_date", Value(start_date)), start_date),
+            end=DaysSince(Least(Coalesce("end_date", Value(end_date)), Value(end_date)), start_date),
+            # Prices go up to 99,999,999.99, more cents than an int4 holds.
+            cents=Cast(F("price") * 100, BigIntegerField()),
+        )
+        .values_list("product_id", "start", "end", "cents")
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(*segments.query.sql_with_params())
+        columns = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 4).T
+    return CategorySegments(columns[0], columns[1], columns[2], columns[3] / 100)
+
+
+def bucket_edges(start_date: date, end_date: date, bucket: Optional[str]) -> np.ndarray:
+    """
+    Day offsets where each bucket starts, plus one past the last day. Buckets follow the calendar
+    (weeks start on Monday) and the first and last ones are clipped to the window.
+    """
+    days = (end_date - start_date).days + 1
+    if bucket is None:
+        return np.array([0, days], dtype=np.int64)
+    origin = np.datetime64(start_date, "D")
+    if bucket == "week":
+        first = np.datetime64(start_date - timedelta(days=start_date.weekday()), "D")
+        starts = np.arange(first, np.datetime64(end_date, "D") + 1, 7)
+    else:
+        unit = BUCKET_UNITS[bucket]
+        step = 3 if bucket == "quarter" else 1
+        first = np.datetime64(start_date, unit)
+        if bucket == "quarter":
+            first -= first.astype(np.int64) % 3
+        starts = np.arange(first, np.datetime64(end_date, unit) + 1, step).astype("datetime64[D]")
+    offsets = np.maximum((starts - origin).astype(np.int64), 0)
+    return np.append(offsets, days)
+
+
+def category_statistics(segments: CategorySegments, edges: np.ndarray, per_product: bool = False) -> dict:
+    """
+    Time-weighted statistics per bucket. Every segment is split into one piece per bucket it overlaps,
+    weighted by the number of days of the overlap; all sums are then ``np.bincount`` calls over the pieces.
+    ``volatility`` is the time-weighted standard deviation of the price over all priced product-days.
+    """
+    buckets = len(edges) - 1
+    first = np.searchsorted(edges, segments.starts, side="right") - 1
+    last = np.searchsorted(edges, segments.ends, side="right") - 1
+    spans = last - first + 1
+    segment = np.repeat(np.arange(len(segments)), spans)
+    bucket = np.repeat(first, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+
+    days = (
+        np.minimum(segments.ends[segment], edges[bucket + 1] - 1)
+        - np.maximum(segments.starts[segment], edges[bucket])
+        + 1
+    )
+    prices = segments.prices[segment]
+
+    products, product_index = np.unique(segments.product_ids[segment], return_inverse=True)
+    product_keys = product_index * buckets + bucket
+
+    result = {"buckets": bucket_statistics(bucket, days, prices, buckets)}
+    result["buckets"]["products"] = np.bincount(np.unique(product_keys) % buckets, minlength=buckets)
+    if per_product:
+        stats = bucket_statistics(product_keys, days, prices, len(products) * buckets)
+        result["products"] = products
+        result["product_buckets"] = {name: values.reshape(len(products), buckets) for name, values in stats.items()}
+    return result
+
+
+def bucket_statistics(keys: np.ndarray, days: np.ndarray, prices: np.ndarray, size: int) -> dict:
+    priced_days = np.bincount(keys, weights=days, minlength=size)
+    weighted = np.bincount(keys, weights=prices * days, minlength=size)
+    squares = np.bincount(keys, weights=prices * prices * days, minlength=size)
+    minimum = np.full(size, np.inf)
+    maximum = np.full(size, -np.inf)
+    np.minimum.at(minimum, keys, prices)
+    np.maximum.at(maximum, keys, prices)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = weighted / priced_days
+        variance = np.maximum(squares / priced_days - average * average, 0)
+    return {
+        "priced_days": priced_days,
+        "average": average,
+        "min": minimum,
+        "max": maximum,
+        "volatility": np.sqrt(variance),
+    }
+
+
+def serialize_buckets(stats: dict, edges: np.ndarray, start_date: date, index=()) -> List[dict]:
+    result = []
+    for b in range(len(edges) - 1):
+        key = index + (b,)
+        if not stats["priced_days"][key]:
+            continue
+        entry = {
+            "start_date": start_date + timedelta(days=int(edges[b])),
+            "end_date": start_date + timedelta(days=int(edges[b + 1]) - 1),
+            "average_price": round(float(stats["average"][key]), 2),
+            "min_price": round(float(stats["min"][key]), 2),
+            "max_price": round(float(stats["max"][key]), 2),
+            "volatility": round(float(stats["volatility"][key]), 4),
+        }
+        if "products" in stats:
+            entry["products"] = int(stats["products"][key])
+        result.append(entry)
+    return result
+
+
+def get_category_analytics(category, start_date: date, end_date: date, bucket: Optional[str], per_product: bool):
+    segments = load_category_segments(category.pk, start_date, end_date)
+    edges = bucket_edges(start_date, end_date, bucket)
+    stats = category_statistics(segments, edges, per_product)
+    data = {
+        "category": category.name,
+        "start_date": start_date,
+        "end_date": end_date,
+        "bucket": bucket,
+        "buckets": serialize_buckets(stats["buckets"], edges, start_date),
+    }
+    if per_product:
+        data["products"] = [
+            {
+                "product": int(product_id),
+                "buckets": serialize_buckets(stats["product_buckets"], edges, start_date, (i,)),
+            }
+            for i, product_id in enumerate(stats["products"])
+        ]
+    return data
@@ -6,6 +6,7 @@ from rest_framework import status
 from rest_framework.response import Response
 
 from products.models import Category, Price
+from products.utils.timeline import average_by_period, cache_enabled, get_timeline, weighted_average_by_period
 
 
 def get_average_by_category(category_name, start_date, end_date):
@@ -31,7 +32,14 @@ def get_average_by_category(category_name, start_date, end_date):
     )
 
 
-def get_average_by_product(product, start_date, end_date, group_by):
+def get_average_by_product(product, start_date, end_date, group_by, weighted=False):
+    if weighted:
+        timeline = get_timeline(product.pk)
+        return Response(weighted_average_by_period(timeline, start_date, end_date, group_by))
+    if cache_enabled():
+        timeline = get_timeline(product.pk)
+        return Response(average_by_period(timeline, start_date, end_date, group_by))
+
     prices = Price.objects.filter(
         Q(start_date__lte=end_date),
         Q(end_date__gte=start_date) | Q(end_date__isnull=True),
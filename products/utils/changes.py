@@ -0,0 +1,78 @@
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from products.models import ChangeLogEntry, Price, Product
+
+# Key of the advisory lock that serializes ``sequence_changes`` across processes.
+SEQUENCER_LOCK = 0x70726963
+
+FEED_FIELDS = ("seq", "model", "action", "object_id", "product_id", "data", "created_at")
+
+SEQUENCE_SQL = """
+UPDATE {table} AS entry
+SET seq = last.seq + pending.position
+FROM (
+    SELECT id, row_number() OVER (ORDER BY id) AS position
+    FROM {table}
+    WHERE seq IS NULL
+    ORDER BY id
+    LIMIT %s
+) AS pending, (SELECT COALESCE(MAX(seq), 0) AS seq FROM {table}) AS last
+WHERE entry.id = pending.id
+"""
+
+
+def price_entry(price: Price, action: str) -> ChangeLogEntry:
+    return ChangeLogEntry(
+        model=ChangeLogEntry.PRICE,
+        action=action,
+        object_id=price.pk,
+        product_id=price.product_id,
+        data={"price": price.price, "start_date": price.start_date, "end_date": price.end_date},
+    )
+
+
+def product_entry(product: Product, action: str) -> ChangeLogEntry:
+    return ChangeLogEntry(
+        model=ChangeLogEntry.PRODUCT,
+        action=action,
+        object_id=product.pk,
+        product_id=product.pk,
+        data={
+            "sku": product.sku,
+            "name": product.name,
+            "category_id": product.category_id,
+            "description": product.description,
+        },
+    )
+
+
+def record_changes(entries: Iterable[ChangeLogEntry]) -> None:
+    """For writes that bypass model signals (``bulk_create``, ``update()``, raw SQL)."""
+    ChangeLogEntry.objects.bulk_create(entries)
+
+
+def sequence_changes(batch_size: Optional[int] = None) -> int:
+    """
+    Number the committed entries that have no ``seq`` yet, continuing from the highest one, and return
+    how many were numbered. Runs are serialized by an advisory lock; the lock is taken in its own statement
+    so ``MAX(seq)`` is read after the previous run has committed. When another process holds the lock,
+    nothing is done: its entries become visible as soon as it commits.
+    """
+    batch_size = batch_size or settings.CHANGE_FEED["SEQUENCE_BATCH_SIZE"]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", [SEQUENCER_LOCK])
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute(SEQUENCE_SQL.format(table=ChangeLogEntry._meta.db_table), [batch_size])
+        return cursor.rowcount
+
+
+def get_changes(since: int, limit: int) -> dict:
+    sequence_changes()
+    entries = list(ChangeLogEntry.objects.filter(seq__gt=since).order_by("seq").values(*FEED_FIELDS)[: limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return {"changes": entries, "next_since": entries[-1]["seq"] if entries else since, "has_more": has_more}
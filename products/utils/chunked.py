@@ -0,0 +1,121 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Optional
+
+import django
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Count, Q, QuerySet, Sum
+from django.utils import timezone
+
+from products.models import Price, PriceBulkChunk, PriceBulkRun, Product
+from products.utils.pricing import resolve_overlapping_prices
+
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+def plan_price_run(
+    category_id: int, price: Decimal, start_date: date, end_date: Optional[date], chunk_size: Optional[int] = None
+) -> PriceBulkRun:
+    """
+    Split the products of a category into id-range chunks. Each chunk is later resolved and committed
+    in its own transaction together with its ``completed`` marker, so a run that fails or is interrupted
+    can be resumed by processing only the chunks that are not completed yet.
+    """
+    chunk_size = chunk_size or settings.PRICE_BULK_PARALLEL["CHUNK_SIZE"]
+    product_ids = list(Product.objects.filter(category_id=category_id).order_by("pk").values_list("pk", flat=True))
+    with transaction.atomic():
+        run = PriceBulkRun.objects.create(
+            category_id=category_id, price=price, start_date=start_date, end_date=end_date, chunk_size=chunk_size
+        )
+        PriceBulkChunk.objects.bulk_create(
+            PriceBulkChunk(
+                run=run,
+                first_product_id=product_ids[offset],
+                last_product_id=product_ids[min(offset + chunk_size, len(product_ids)) - 1],
+                product_count=min(chunk_size, len(product_ids) - offset),
+            )
+            for offset in range(0, len(product_ids), chunk_size)
+        )
+    return run
+
+
+def execute_price_run(
+    run: PriceBulkRun,
+    workers: Optional[int] = None,
+    executor: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> PriceBulkRun:
+    if connection.in_atomic_block:
+        raise RuntimeError("Chunked price runs commit per chunk and cannot run inside a transaction.")
+    workers = workers or settings.PRICE_BULK_PARALLEL["WORKERS"]
+    executor = executor or settings.PRICE_BULK_PARALLEL["EXECUTOR"]
+
+    chunk_ids = list(run.chunks.exclude(status=PriceBulkRun.COMPLETED).order_by("pk").values_list("pk", flat=True))
+    PriceBulkRun.objects.filter(pk=run.pk).update(status=PriceBulkRun.RUNNING, finished_at=None)
+    if executor == "process":
+        # Forked workers must not share the parent's database sockets.
+        connections.close_all()
+
+    pool_options = {"initializer": init_process_worker} if executor == "process" else {}
+    with EXECUTORS[executor](max_workers=workers, **pool_options) as pool:
+        for future in as_completed([pool.submit(process_price_chunk, chunk_id) for chunk_id in chunk_ids]):
+            processed = future.result()
+            if processed and progress:
+                progress(processed)
+
+    # Concurrent executions of a run (two resumes, or a resume of a run whose executor died) need no lock of
+    # their own: each chunk is claimed under its row lock and processed once. The outcome is read from the
+    # chunks rather than from this execution's results, so whichever execution finishes last records it.
+    failed = run.chunks.exclude(status=PriceBulkRun.COMPLETED).exists()
+    PriceBulkRun.objects.filter(pk=run.pk).update(
+        status=PriceBulkRun.FAILED if failed else PriceBulkRun.COMPLETED, finished_at=timezone.now()
+    )
+    run.refresh_from_db()
+    return run
+
+
+def runs_with_progress() -> QuerySet[PriceBulkRun]:
+    completed, failed = Q(chunks__status=PriceBulkRun.COMPLETED), Q(chunks__status=PriceBulkRun.FAILED)
+    return PriceBulkRun.objects.annotate(
+        total_chunks=Count("chunks"),
+        completed_chunks=Count("chunks", filter=completed),
+        failed_chunks=Count("chunks", filter=failed),
+        total_products=Sum("chunks__product_count", default=0),
+        processed_products=Sum("chunks__product_count", filter=completed, default=0),
+    ).order_by("-pk")
+
+
+def init_process_worker() -> None:
+    django.setup()
+
+
+def process_price_chunk(chunk_id: int) -> Optional[int]:
+    try:
+        with transaction.atomic():
+            chunk = PriceBulkChunk.objects.select_for_update().select_related("run").get(pk=chunk_id)
+            if chunk.status == PriceBulkRun.COMPLETED:
+                return 0
+            run = chunk.run
+            products = Product.objects.select_for_update().filter(
+                category_id=run.category_id, pk__range=(chunk.first_product_id, chunk.last_product_id)
+            )
+            for product in products.order_by("pk"):
+                price_data = {
+                    "product": product,
+                    "price": run.price,
+                    "start_date": run.start_date,
+                    "end_date": run.end_date,
+                }
+                Price.objects.create(**resolve_overlapping_prices(price_data, lock=False))
+            chunk.status = PriceBulkRun.COMPLETED
+            chunk.error = ""
+            chunk.completed_at = timezone.now()
+            chunk.save(update_fields=["status", "error", "completed_at"])
+        return chunk.product_count
+    except Exception as e:
+        PriceBulkChunk.objects.filter(pk=chunk_id).update(status=PriceBulkRun.FAILED, error=str(e))
+        return None
+    finally:
+        connection.close()
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+from typing import List, Optional
+
+from django.db import connection
+
+from products.models import ChangeLogEntry, Price, PriceChangeHistory, Product
+from shop.invalidation import invalidate_products
+
+# Segments still active on the closing date: the ones starting before it end the day before, the ones
+# starting on or after it are deleted. All data-modifying CTEs see the rows as they were before the
+# statement, so the history keeps the old values of both.
+CLOSE_SQL = """
+WITH targets AS (
+    SELECT price.id
+    FROM {price} AS price JOIN {product} AS product ON product.id = price.product_id
+    WHERE {scope} AND (price.end_date IS NULL OR price.end_date >= %(day)s)
+), history AS (
+    INSERT INTO {history} (product_id, old_price, start_date, end_date, changed_at)
+    SELECT price.product_id, price.price, price.start_date, price.end_date, NOW()
+    FROM {price} AS price JOIN targets USING (id)
+), removed AS (
+    DELETE FROM {price} AS price
+    USING targets
+    WHERE price.id = targets.id AND price.start_date >= %(day)s
+    RETURNING price.id, price.product_id, price.price, price.start_date, price.end_date
+), closed AS (
+    UPDATE {price} AS price
+    SET end_date = %(end)s
+    FROM targets
+    WHERE price.id = targets.id AND price.start_date < %(day)s
+    RETURNING price.id, price.product_id, price.price, price.start_date, price.end_date
+), changes AS (
+    SELECT %(deleted)s AS action, * FROM removed
+    UNION ALL
+    SELECT %(updated)s, * FROM closed
+)
+INSERT INTO {changelog} (model, action, object_id, product_id, data, created_at)
+SELECT %(model)s, action, id, product_id,
+    jsonb_build_object('price', price::text, 'start_date', start_date, 'end_date', end_date), NOW()
+FROM changes
+RETURNING product_id, action
+"""
+
+
+def close_prices(day: date, category_id: Optional[int] = None, product_ids: Optional[List[int]] = None) -> dict:
+    """
+    End every price of a category, or of the given products, on the day before ``day``: no price is
+    active from ``day`` on. Runs as one statement after locking the products like a price write; the
+    caller provides the transaction.
+    """
+    products = Product.objects.select_for_update().order_by("pk")
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+        scope, params = "product.category_id = %(scope)s", {"scope": category_id}
+    else:
+        products = products.filter(pk__in=product_ids)
+        scope, params = "product.id = ANY(%(scope)s)", {"scope": list(product_ids)}
+    list(products.values_list("pk", flat=True))
+
+    tables = {
+        "price": Price._meta.db_table,
+        "product": Product._meta.db_table,
+        "history": PriceChangeHistory._meta.db_table,
+        "changelog": ChangeLogEntry._meta.db_table,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CLOSE_SQL.format(scope=scope, **tables),
+            {
+                **params,
+                "day": day,
+                "end": day - timedelta(days=1),
+                "deleted": ChangeLogEntry.DELETED,
+                "updated": ChangeLogEntry.UPDATED,
+                "model": ChangeLogEntry.PRICE,
+            },
+        )
+        rows = cursor.fetchall()
+    changed = {product_id for product_id, _ in rows}
+    invalidate_products(changed)
+    return {
+        "products": len(changed),
+        "closed": sum(action == ChangeLogEntry.UPDATED for _, action in rows),
+        "deleted": sum(action == ChangeLogEntry.DELETED for _, action in rows),
+    }
@@ -0,0 +1,121 @@
+from typing import Callable, List, Optional
+
+from django.db import connection, transaction
+
+from products.models import ChangeLogEntry, Price, PriceChangeHistory, Product
+from shop.invalidation import invalidate_products
+
+# Segments of a product ordered by start date form islands of back-to-back rows with the same price;
+# each island with more than one row is collapsed into its first row, which takes the island's last end date.
+ISLANDS_SQL = """
+WITH ordered AS (
+    SELECT id, product_id, start_date,
+        CASE WHEN LAG(price) OVER w = price AND LAG(end_date) OVER w = start_date - 1 THEN 0 ELSE 1 END AS new_island
+    FROM {price}
+    WHERE product_id = ANY(%s)
+    WINDOW w AS (PARTITION BY product_id ORDER BY start_date)
+), numbered AS (
+    SELECT id, product_id, start_date,
+        SUM(new_island) OVER (PARTITION BY product_id ORDER BY start_date) AS island
+    FROM ordered
+), islands AS (
+    SELECT product_id, island, (ARRAY_AGG(id ORDER BY start_date))[1] AS keep_id
+    FROM numbered
+    GROUP BY product_id, island
+    HAVING COUNT(*) > 1
+), merged AS (
+    SELECT numbered.id, numbered.product_id, islands.keep_id
+    FROM numbered JOIN islands USING (product_id, island)
+)
+"""
+
+COUNT_SQL = ISLANDS_SQL + "SELECT COUNT(DISTINCT product_id), COUNT(*) FROM merged WHERE id <> keep_id"
+
+# Deletes the merged rows, extends the kept ones and records both in the price history and the change feed,
+# in one statement. The history CTE sees the rows as they were before the statement, so it keeps their old values.
+COMPACT_SQL = (
+    ISLANDS_SQL
+    + """
+, history AS (
+    INSERT INTO {history} (product_id, old_price, start_date, end_date, changed_at)
+    SELECT price.product_id, price.price, price.start_date, price.end_date, NOW()
+    FROM {price} AS price JOIN merged USING (id)
+), removed AS (
+    DELETE FROM {price} AS price
+    USING merged
+    WHERE price.id = merged.id AND merged.id <> merged.keep_id
+    RETURNING price.id, price.product_id, price.price, price.start_date, price.end_date, merged.keep_id
+), last_end AS (
+    SELECT DISTINCT ON (keep_id) keep_id, end_date
+    FROM removed
+    ORDER BY keep_id, start_date DESC
+), kept AS (
+    UPDATE {price} AS price
+    SET end_date = last_end.end_date
+    FROM last_end
+    WHERE price.id = last_end.keep_id
+    RETURNING price.id, price.product_id, price.price, price.start_date, price.end_date
+), changes AS (
+    SELECT %s AS action, id, product_id, price, start_date, end_date FROM removed
+    UNION ALL
+    SELECT %s, id, product_id, price, start_date, end_date FROM kept
+)
+INSERT INTO {changelog} (model, action, object_id, product_id, data, created_at)
+SELECT %s, action, id, product_id,
+    jsonb_build_object('price', price::text, 'start_date', start_date, 'end_date', end_date), NOW()
+FROM changes
+RETURNING product_id, action
+"""
+)
+
+
+def compact_product_prices(product_ids: List[int]) -> dict:
+    """Coalesce the prices of the given products; the caller holds their row locks."""
+    tables = {
+        "price": Price._meta.db_table,
+        "history": PriceChangeHistory._meta.db_table,
+        "changelog": ChangeLogEntry._meta.db_table,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            COMPACT_SQL.format(**tables),
+            [product_ids, ChangeLogEntry.DELETED, ChangeLogEntry.UPDATED, ChangeLogEntry.PRICE],
+        )
+        rows = cursor.fetchall()
+    compacted = {product_id for product_id, _ in rows}
+    invalidate_products(compacted)
+    return {"products": len(compacted), "removed": sum(action == ChangeLogEntry.DELETED for _, action in rows)}
+
+
+def count_removable(product_ids: List[int]) -> dict:
+    tables = {"price": Price._meta.db_table}
+    with connection.cursor() as cursor:
+        cursor.execute(COUNT_SQL.format(**tables), [product_ids])
+        products, removed = cursor.fetchone()
+    return {"products": products, "removed": removed}
+
+
+def compact_prices(batch_size: int, dry_run: bool = False, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Coalesce back-to-back equal-price segments of every product, ``batch_size`` products per transaction.
+    Each batch locks its products like a price write does, so it never races with the resolver.
+    """
+    totals = {"batches": 0, "products": 0, "removed": 0}
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            product_ids = list(
+                Product.objects.select_for_update()
+                .filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not product_ids:
+                return totals
+            result = count_removable(product_ids) if dry_run else compact_product_prices(product_ids)
+        last_id = product_ids[-1]
+        totals["batches"] += 1
+        totals["products"] += result["products"]
+        totals["removed"] += result["removed"]
+        if progress:
+            progress(totals)
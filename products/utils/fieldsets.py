@@ -0,0 +1,44 @@
+from typing import Iterable, List, Optional
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def parse_fields(value: Optional[str], serializer: serializers.Serializer) -> Optional[List[str]]:
+    """The field names of a ``?fields=a,b`` parameter, or ``None`` when it is absent or empty."""
+    fields = [name.strip() for name in (value or "").split(",") if name.strip()]
+    if not fields:
+        return None
+    unknown = sorted(set(fields) - set(serializer.fields))
+    if unknown:
+        raise ValidationError({"fields": [f"Unknown field(s): {', '.join(unknown)}."]})
+    return fields
+
+
+def only_fields(queryset: QuerySet, serializer: serializers.Serializer, fields: Iterable[str]) -> QuerySet:
+    """
+    Load only the columns the requested serializer fields read, and join a related model only when one of
+    its columns is needed. Fields that are not model fields (annotations, prefetched lists) are left alone.
+    """
+    opts = queryset.model._meta
+    columns = {opts.pk.name}
+    related = set()
+    for name in fields:
+        field = serializer.fields[name]
+        try:
+            model_field = opts.get_field(field.source.split(".")[0])
+        except FieldDoesNotExist:
+            continue
+        if not model_field.concrete:
+            continue
+        columns.add(model_field.name)
+        if model_field.many_to_one and isinstance(field, serializers.SlugRelatedField):
+            columns.add(f"{model_field.name}__{field.slug_field}")
+            related.add(model_field.name)
+    queryset = queryset.select_related(None)
+    # select_related() without arguments would follow every foreign key.
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
@@ -0,0 +1,61 @@
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from django.db.models import F, FilteredRelation, Prefetch, Q, QuerySet
+from django.utils import timezone
+
+from products.models import Price, Product
+
+ORDERINGS = {
+    "price": (F("current_price").asc(nulls_last=True), "id"),
+    "-price": (F("current_price").desc(nulls_last=True), "-id"),
+    "id": ("id",),
+    "-id": ("-id",),
+}
+
+
+def with_price_at(queryset: QuerySet[Product], day: date) -> QuerySet[Product]:
+    """
+    Annotate ``current_price``: the price active on ``day``. Prices of a product never overlap, so the
+    join adds at most one row per product and is answered by the (product, start_date, end_date) index.
+    """
+    active = Q(prices__start_date__lte=day) & (Q(prices__end_date__gte=day) | Q(prices__end_date__isnull=True))
+    return queryset.annotate(active_price=FilteredRelation("prices", condition=active)).annotate(
+        current_price=F("active_price__price")
+    )
+
+
+def prefetch_prices(
+    queryset: QuerySet[Product], start_date: Optional[date] = None, end_date: Optional[date] = None
+) -> QuerySet[Product]:
+    """
+    Load the price segments overlapping ``[start_date, end_date]`` (unbounded when omitted) into
+    ``price_segments``, ordered by start date: one query for all the products of a page.
+    """
+    prices = Price.objects.only("product_id", "price", "start_date", "end_date").order_by("start_date")
+    if start_date is not None:
+        prices = prices.filter(Q(end_date__gte=start_date) | Q(end_date__isnull=True))
+    if end_date is not None:
+        prices = prices.filter(start_date__lte=end_date)
+    return queryset.prefetch_related(Prefetch("prices", queryset=prices, to_attr="price_segments"))
+
+
+def filter_products(
+    queryset: QuerySet[Product],
+    category: Optional[str] = None,
+    price_date: Optional[date] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    ordering: str = "id",
+) -> QuerySet[Product]:
+    if category is not None:
+        queryset = queryset.filter(category__name=category)
+    if price_date is not None or min_price is not None or max_price is not None or ordering in ("price", "-price"):
+        queryset = with_price_at(queryset, price_date or timezone.localdate())
+    if min_price is not None:
+        queryset = queryset.filter(current_price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(current_price__lte=max_price)
+    # Every ordering ends with the primary key, so pages stay stable when prices are equal.
+    return queryset.order_by(*ORDERINGS[ordering])
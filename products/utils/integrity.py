@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Callable, Iterator, List, Optional
+
+from django.db import connection, transaction
+
+from products.models import ChangeLogEntry, Price, PriceChangeHistory
+from products.utils.changes import price_entry, record_changes
+from products.utils.pricing import lock_products
+from shop.invalidation import invalidate_products
+
+INVERTED = "inverted"
+OPEN_ENDED = "open_ended"
+OVERLAP = "overlap"
+
+# Every segment is compared with the furthest end date of all segments starting before it (infinity for an
+# open-ended one) rather than only with the previous row's, so a segment nested in a long earlier one is
+# found too. Inverted segments cover no day and are left out of the comparison.
+SCAN_SQL = """
+SELECT issue, product_id, id, price, start_date, end_date
+FROM (
+    SELECT id, product_id, price, start_date, end_date,
+        CASE
+            WHEN end_date < start_date THEN %s
+            WHEN end_date IS NULL AND COUNT(*) FILTER (WHERE end_date IS NULL) OVER earlier > 0 THEN %s
+            WHEN MAX(CASE WHEN end_date IS NULL THEN 'infinity'::date WHEN end_date >= start_date THEN end_date END)
+                OVER earlier >= start_date THEN %s
+        END AS issue
+    FROM {price}
+    WINDOW w AS (PARTITION BY product_id ORDER BY start_date, id),
+        earlier AS (w ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+) AS segments
+WHERE issue IS NOT NULL
+ORDER BY product_id, start_date, id
+"""
+
+
+@dataclass
+class Finding:
+    issue: str
+    product_id: int
+    price_id: int
+    price: Decimal
+    start_date: date
+    end_date: Optional[date]
+
+
+def scan_prices() -> Iterator[Finding]:
+    """
+    Yield every inverted segment, every open-ended segment after the first one of its product and every
+    other segment overlapping an earlier one, ordered by product. The whole table is checked by one
+    window-function query whose rows are streamed from a server-side cursor.
+    """
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(SCAN_SQL.format(price=Price._meta.db_table), [INVERTED, OPEN_ENDED, OVERLAP])
+        for row in cursor:
+            yield Finding(*row)
+
+
+def resolve_segments(prices: List[Price]) -> List[tuple]:
+    """
+    Replay the segments of a product in the order they were written (by id), each one overwriting the
+    days it covers like ``resolve_overlapping_prices`` does, and return the resulting non-overlapping
+    ``(price, start_date, end_date)`` pieces. Inverted segments cover no day and are dropped.
+    """
+    pieces = []
+    for price in sorted(prices, key=lambda price: price.pk):
+        start, end = price.start_date, price.end_date
+        if end is not None and end < start:
+            continue
+        remaining = []
+        for piece in pieces:
+            _, piece_start, piece_end = piece
+            if (end is not None and piece_start > end) or (piece_end is not None and piece_end < start):
+                remaining.append(piece)
+                continue
+            if piece_start < start:
+                remaining.append((piece[0], piece_start, start - timedelta(days=1)))
+            if end is not None and (piece_end is None or piece_end > end):
+                remaining.append((piece[0], end + timedelta(days=1), piece_end))
+        pieces = remaining + [(price, start, end)]
+    return sorted(pieces, key=lambda piece: piece[1])
+
+
+def repair_product_prices(product_ids: List[int]) -> dict:
+    """Rewrite the prices of the given products into a valid timeline; the caller holds their row locks."""
+    prices = list(Price.objects.filter(product_id__in=product_ids).order_by("pk"))
+    by_product = {}
+    for price in prices:
+        by_product.setdefault(price.product_id, []).append(price)
+
+    deleted, updated, created = [], [], []
+    for product_prices in by_product.values():
+        pieces = {}
+        for source, start, end in resolve_segments(product_prices):
+            pieces.setdefault(source.pk, []).append((start, end))
+        for price in product_prices:
+            ranges = pieces.get(price.pk)
+            if not ranges:
+                deleted.append(price)
+                continue
+            (start, end), *rest = ranges
+            if (start, end) != (price.start_date, price.end_date):
+                updated.append((price, start, end))
+            created.extend(
+                Price(product_id=price.product_id, price=price.price, start_date=start, end_date=end)
+                for start, end in rest
+            )
+
+    # Bulk writes send no model signals: the history and the change feed are written here.
+    PriceChangeHistory.objects.bulk_create(
+        PriceChangeHistory(
+            product_id=price.product_id, old_price=price.price, start_date=price.start_date, end_date=price.end_date
+        )
+        for price in deleted + [price for price, _, _ in updated]
+    )
+    if deleted:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Price._meta.db_table} WHERE id = ANY(%s)", [[price.pk for price in deleted]])
+    for price, start, end in updated:
+        price.start_date, price.end_date = start, end
+    Price.objects.bulk_update([price for price, _, _ in updated], ["start_date", "end_date"])
+    Price.objects.bulk_create(created)
+    record_changes(
+        [price_entry(price, ChangeLogEntry.DELETED) for price in deleted]
+        + [price_entry(price, ChangeLogEntry.UPDATED) for price, _, _ in updated]
+        + [price_entry(price, ChangeLogEntry.CREATED) for price in created]
+    )
+    changed = {price.product_id for price in deleted + created} | {price.product_id for price, _, _ in updated}
+    invalidate_products(changed)
+    return {"products": len(changed), "deleted": len(deleted), "updated": len(updated), "created": len(created)}
+
+
+def repair_prices(product_ids: List[int], batch_size: int, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Repair the given products, ``batch_size`` products per transaction, each batch locked like a price write."""
+    totals = {"batches": 0, "products": 0, "deleted": 0, "updated": 0, "created": 0}
+    product_ids = sorted(product_ids)
+    for offset in range(0, len(product_ids), batch_size):
+        batch = product_ids[offset : offset + batch_size]
+        with transaction.atomic():
+            lock_products(batch)
+            # Segments are read again under the lock: they may have changed since the scan.
+            result = repair_product_prices(batch)
+        totals["batches"] += 1
+        for key, value in result.items():
+            totals[key] += value
+        if progress:
+            progress(totals)
+    return totals
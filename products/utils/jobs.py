@@ -0,0 +1,153 @@
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from products.models import Job, PriceBulkRun
+from products.utils.chunked import execute_price_run, plan_price_run, runs_with_progress
+from products.utils.upsert import summarize_upsert, upsert_products
+
+HANDLERS = {}
+
+
+def register(kind):
+    def decorator(handler):
+        HANDLERS[kind] = handler
+        return handler
+
+    return decorator
+
+
+def enqueue(kind: str, payload: dict) -> Job:
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(kind=kind, payload=payload, max_attempts=settings.JOBS["MAX_ATTEMPTS"])
+
+
+class JobProgress:
+    def __init__(self, job: Job):
+        self.job = job
+
+    def set_total(self, total: int, done: int = 0) -> None:
+        Job.objects.filter(pk=self.job.pk).update(progress_total=total, progress_done=done, heartbeat_at=timezone.now())
+
+    def advance(self, amount: int) -> None:
+        Job.objects.filter(pk=self.job.pk).update(
+            progress_done=F("progress_done") + amount, heartbeat_at=timezone.now()
+        )
+
+    def save_payload(self) -> None:
+        Job.objects.filter(pk=self.job.pk).update(payload=self.job.payload)
+
+
+def claim_job(worker: str):
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED).order_by("created_at").first()
+        if job is None:
+            return None
+        now = timezone.now()
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.worker = worker
+        job.started_at = job.heartbeat_at = now
+        job.error = ""
+        job.save(update_fields=["status", "attempts", "worker", "started_at", "heartbeat_at", "error"])
+    return job
+
+
+def requeue_stale_jobs(stale_after: float) -> int:
+    """
+    Jobs whose worker stopped sending heartbeats (crash, OOM kill, deploy) are queued again,
+    or failed once they have used all of their attempts.
+    """
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=timezone.now() - timedelta(seconds=stale_after))
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, error="Worker stopped responding.", finished_at=timezone.now()
+    )
+    return failed + stale.update(status=Job.QUEUED, worker="")
+
+
+def heartbeat(job: Job, stop: threading.Event, interval: float) -> None:
+    try:
+        while not stop.wait(interval):
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def run_job(job: Job) -> Job:
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(job, stop, settings.JOBS["HEARTBEAT_INTERVAL"]), daemon=True)
+    beat.start()
+    try:
+        result = HANDLERS[job.kind](job.payload, JobProgress(job))
+        fields = {"status": Job.SUCCEEDED, "result": result}
+    except Exception as e:
+        fields = {"status": Job.FAILED, "error": "".join(traceback.format_exception_only(e)).strip()}
+    finally:
+        stop.set()
+        beat.join()
+    Job.objects.filter(pk=job.pk).update(finished_at=timezone.now(), **fields)
+    job.refresh_from_db()
+    return job
+
+
+def run_worker(poll_interval: float, stale_after: float, burst: bool = False, log=None) -> int:
+    """Process queued jobs until stopped; with ``burst`` exit as soon as the queue is empty."""
+    name = f"{socket.gethostname()}:{threading.get_native_id()}"
+    processed = 0
+    while True:
+        requeue_stale_jobs(stale_after)
+        job = claim_job(name)
+        if job is None:
+            if burst:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        job = run_job(job)
+        processed += 1
+        if log:
+            log(f"Job {job.pk} ({job.kind}) {job.status}")
+
+
+@register("prices.bulk_create_by_category")
+def bulk_create_by_category(payload: dict, progress: JobProgress) -> dict:
+    # The run id is stored on the job before any chunk is processed, so a retry after a crash
+    # resumes the same run instead of starting over.
+    if payload.get("run_id"):
+        run = PriceBulkRun.objects.get(pk=payload["run_id"])
+    else:
+        run = plan_price_run(
+            payload["category_id"],
+            Decimal(payload["price"]),
+            parse_date(payload["start_date"]),
+            parse_date(payload["end_date"]) if payload.get("end_date") else None,
+        )
+        if not run.chunks.exists():
+            run.delete()
+            raise ValueError("No products found in this category.")
+        payload["run_id"] = run.pk
+        progress.save_payload()
+
+    summary = runs_with_progress().get(pk=run.pk)
+    progress.set_total(summary.total_products, summary.processed_products)
+    run = execute_price_run(run, progress=progress.advance)
+    summary = runs_with_progress().get(pk=run.pk)
+    if run.status != PriceBulkRun.COMPLETED:
+        raise RuntimeError(f"{summary.failed_chunks} of {summary.total_chunks} chunks failed in price run {run.pk}.")
+    return {"run_id": run.pk, "processed_products": summary.processed_products}
+
+
+@register("products.bulk_upsert")
+def bulk_upsert_products(payload: dict, progress: JobProgress) -> dict:
+    progress.set_total(len(payload["products"]))
+    results = upsert_products(payload["products"], progress=progress.advance)
+    return {**summarize_upsert(results), "errors": [result for result in results if result["status"] == "error"]}
@@ -29,16 +29,41 @@ def get_overlapping_prices(
         ).order_by("end_date")
 
 
-def resolve_overlapping_prices(validated_data: dict) -> dict:
+def lock_products(product_ids) -> None:
+    """
+    Serialize price writes per product: the row lock is held until the surrounding transaction ends,
+    so writers for the same product queue up while writers for other products run in parallel.
+    Products are locked in id order to avoid deadlocks between writers touching several products.
+    """
+    list(Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk").values_list("pk", flat=True))
+
+
+def resolve_overlapping_prices(validated_data: dict, lock: bool = True) -> dict:
     product = validated_data["product"]
     new_start = validated_data["start_date"]
     new_end = validated_data.get("end_date")
     new_price = validated_data["price"]
 
-    overlapping_prices = get_overlapping_prices(product, new_start, new_end)
+    if lock:
+        lock_products([product.pk])
+    # One day wider on each side, so the same scan also returns the segments touching the new one.
+    candidates = get_overlapping_prices(
+        product, new_start - timedelta(days=1), new_end + timedelta(days=1) if new_end else None
+    )
 
-    for price in overlapping_prices:
+    for price in candidates:
         old_start, old_end, old_price = price.start_date, price.end_date, price.price
+
+        if is_adjacent(new_start, new_end, old_start, old_end):
+            # Touching neighbours are coalesced with the new segment when they have the same price.
+            if old_price == new_price:
+                price.delete()
+                if old_end is not None and old_end < new_start:
+                    validated_data["start_date"] = old_start
+                else:
+                    validated_data["end_date"] = old_end
+            continue
+
         price.delete()
 
         if is_fully_overwritten(new_start, new_end, old_start, old_end):
@@ -56,7 +81,7 @@ def resolve_overlapping_prices(validated_data: dict) -> dict:
 
         if is_overlaps_start(new_start, new_end, old_start, old_end):
             if old_price == new_price:
-                validated_data["start_date"] = min(new_start, old_start)
+                validated_data["start_date"] = min(validated_data["start_date"], old_start)
                 validated_data["end_date"] = old_end
             else:
                 create_segment(product, old_price, new_end + timedelta(days=1), old_end)
@@ -82,6 +107,12 @@ def create_segment(product, price: Decimal, start: date, end: Optional[date]) ->
         )
 
 
+def is_adjacent(new_start: date, new_end: Optional[date], old_start: date, old_end: Optional[date]) -> bool:
+    return old_end == new_start - timedelta(days=1) or (
+        new_end is not None and old_start == new_end + timedelta(days=1)
+    )
+
+
 def is_fully_overwritten(new_start: date, new_end: Optional[date], old_start: date, old_end: Optional[date]) -> bool:
     return new_start <= old_start and (new_end is None or old_end is None or new_end >= old_end)
 
@@ -0,0 +1,46 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, FloatField, QuerySet
+from django.db.models.functions import Cast, Greatest, Upper
+
+from products.models import SEARCH_CONFIG, Product
+
+# Matches taken from each index before ranking: at least one page of the largest size.
+SEARCH_CANDIDATES = 100
+
+
+def search_products(text: str) -> QuerySet[Product]:
+    """
+    Products whose name contains a word similar to ``text``, whose SKU contains ``text``, or whose
+    description matches it as a full-text query. Each condition is a separate branch of a ``UNION`` so
+    that every branch is answered by its own GIN index on ``Product`` (the expressions here must stay
+    identical to the indexed ones). Each branch stops after ``SEARCH_CANDIDATES`` matches and only those
+    are ranked: a word found in a large part of the catalog would otherwise have every one of its rows read
+    and ranked to return a page of 20, so such queries rank the first candidates found, not every match.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+    products = Product.objects.annotate(sku_upper=Upper("sku"))
+    matches = (
+        products.filter(name__trigram_word_similar=text)
+        .values("pk")[:SEARCH_CANDIDATES]
+        .union(
+            products.filter(sku_upper__contains=text.upper()).values("pk")[:SEARCH_CANDIDATES],
+            products.filter(search_vector=query).values("pk")[:SEARCH_CANDIDATES],
+        )
+    )
+    return (
+        products.select_related("category")
+        .defer("search_vector")
+        .filter(pk__in=matches)
+        .annotate(
+            # The rank is the pagination cursor: as float4 it would not survive the round trip through a
+            # Python float exactly, and rows at page boundaries would be repeated or skipped.
+            rank=Cast(
+                Greatest(
+                    TrigramWordSimilarity(text, "name"),
+                    TrigramWordSimilarity(text.upper(), "sku_upper"),
+                    SearchRank(F("search_vector"), query),
+                ),
+                FloatField(),
+            ),
+        )
+    )
@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from products.models import Product
+from products.utils.filters import with_price_at
+
+SNAPSHOT_NAME = re.compile(r"^catalog-\d{4}-\d{2}-\d{2}\.ndjson\.gz$")
+INDEX_NAME = "index.json"
+SNAPSHOT_FIELDS = ("id", "sku", "name", "category", "description", "price")
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def snapshot_dir() -> Path:
+    return Path(settings.CATALOG_SNAPSHOTS["DIR"])
+
+
+def snapshot_name(day: date) -> str:
+    return f"catalog-{day.isoformat()}.ndjson.gz"
+
+
+class HashingWriter:
+    """File wrapper that hashes and counts the (compressed) bytes written through it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+
+def write_snapshot(day: date, directory: Optional[Path] = None, chunk_size: Optional[int] = None) -> dict:
+    """
+    Write every product with its category and the price active on ``day`` as gzip NDJSON, one product per
+    line in id order. Rows are streamed from one server-side cursor, so memory use does not depend on the
+    catalog size; the file is written under a temporary name and renamed once complete.
+    """
+    directory = directory or snapshot_dir()
+    chunk_size = chunk_size or settings.CATALOG_SNAPSHOTS["CHUNK_SIZE"]
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / snapshot_name(day)
+    temporary = path.with_name(f".{path.name}.tmp")
+    rows = (
+        with_price_at(Product.objects.all(), day)
+        .order_by("id")
+        .values_list("id", "sku", "name", "category__name", "description", "current_price")
+    )
+    products = 0
+    try:
+        with open(temporary, "wb") as file:
+            writer = HashingWriter(file)
+            with gzip.GzipFile(fileobj=writer, mode="wb", mtime=0) as archive, transaction.atomic():
+                # Inside a transaction the cursor streams; in autocommit Postgres would materialize it WITH HOLD.
+                lines = []
+                for row in rows.iterator(chunk_size=chunk_size):
+                    record = dict(zip(SNAPSHOT_FIELDS, row))
+                    if record["price"] is not None:
+                        record["price"] = str(record["price"])
+                    lines.append(json.dumps(record, ensure_ascii=False).encode())
+                    if len(lines) == chunk_size:
+                        archive.write(b"\n".join(lines) + b"\n")
+                        products += len(lines)
+                        lines = []
+                if lines:
+                    archive.write(b"\n".join(lines) + b"\n")
+                    products += len(lines)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+    os.replace(temporary, path)
+    entry = {
+        "date": day.isoformat(),
+        "file": path.name,
+        "products": products,
+        "bytes": writer.size,
+        "sha256": writer.sha256.hexdigest(),
+        "created_at": timezone.now().isoformat(),
+    }
+    update_index(directory, entry)
+    return entry
+
+
+def read_index(directory: Path) -> list:
+    try:
+        return json.loads((directory / INDEX_NAME).read_text())["snapshots"]
+    except FileNotFoundError:
+        return []
+
+
+def update_index(directory: Path, entry: dict) -> None:
+    """Add ``entry`` to the index, newest first, and delete snapshots beyond the ``KEEP`` most recent."""
+    snapshots = [snapshot for snapshot in read_index(directory) if snapshot["date"] != entry["date"]] + [entry]
+    snapshots.sort(key=lambda snapshot: snapshot["date"], reverse=True)
+    keep = settings.CATALOG_SNAPSHOTS["KEEP"]
+    for expired in snapshots[keep:]:
+        (directory / expired["file"]).unlink(missing_ok=True)
+    temporary = directory / f".{INDEX_NAME}.tmp"
+    temporary.write_text(json.dumps({"snapshots": snapshots[:keep]}, indent=2))
+    os.replace(temporary, directory / INDEX_NAME)
+
+
+def parse_range(header: str, size: int):
+    """
+    ``(start, end)`` of a single ``bytes=`` range, ``None`` when the header should be ignored (malformed or
+    several ranges: the whole file is sent) or ``False`` when the range is not satisfiable.
+    """
+    match = BYTE_RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else False
+    start, end = int(first), int(last) if last else size - 1
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def read_range(path: Path, start: int, length: int):
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(READ_BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+def serve_file(request, path: Path, content_type: str, attachment: bool = False):
+    """Serve a file straight from disk with ``ETag``/``Last-Modified`` validation and single byte ranges."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise Http404("Snapshot not found.")
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        byte_range = parse_range(request.headers.get("Range", ""), stat.st_size)
+        if request.headers.get("If-Range", etag) != etag:
+            byte_range = None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+        elif byte_range is None:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                read_range(path, start, end - start + 1), content_type=content_type, status=206
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(end - start + 1)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Accept-Ranges"] = "bytes"
+    if attachment:
+        response["Content-Disposition"] = f'attachment; filename="{path.name}"'
+    return response
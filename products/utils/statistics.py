@@ -0,0 +1,64 @@
+from django.db.models import Aggregate, Avg, Count, F, FloatField, Max, Min, Q, StdDev
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from products.models import Price
+
+PERCENTILES = {"p10": 0.1, "median": 0.5, "p90": 0.9}
+PERIODS = {"week": TruncWeek, "month": TruncMonth}
+
+
+class PercentileCont(Aggregate):
+    """Postgres ordered-set aggregate: the continuous (interpolated) percentile of the expression."""
+
+    function = "PERCENTILE_CONT"
+    name = "PercentileCont"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile: float, **extra):
+        if not 0 <= percentile <= 1:
+            raise ValueError("percentile must be between 0 and 1.")
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def get_price_statistics(start_date, end_date, group_by=(), category_name=None):
+    """
+    Distribution of the prices active in the window, grouped by category and/or the week or month
+    the price starts in. Everything is aggregated by Postgres in one grouped query.
+    """
+    prices = Price.objects.filter(
+        Q(start_date__lte=end_date),
+        Q(end_date__gte=start_date) | Q(end_date__isnull=True),
+    )
+    if category_name is not None:
+        prices = prices.filter(product__category__name=category_name)
+
+    groups = []
+    if "category" in group_by:
+        prices = prices.annotate(category=F("product__category__name"))
+        groups.append("category")
+    for period, trunc in PERIODS.items():
+        if period in group_by:
+            prices = prices.annotate(period=trunc("start_date"))
+            groups.append("period")
+
+    aggregates = {
+        "count": Count("id"),
+        "min_price": Min("price"),
+        "max_price": Max("price"),
+        "average_price": Avg("price"),
+        "stddev": StdDev("price", sample=True),
+        **{name: PercentileCont("price", percentile) for name, percentile in PERCENTILES.items()},
+    }
+    if groups:
+        rows = prices.values(*groups).annotate(**aggregates).order_by(*groups)
+    else:
+        rows = [prices.aggregate(**aggregates)]
+    return [
+        {
+            key: round(value, 2) if key in aggregates and key != "count" and value is not None else value
+            for key, value in row.items()
+        }
+        for row in rows
+        if row["count"]
+    ]
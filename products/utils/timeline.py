@@ -0,0 +1,226 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from products.models import Price
+from shop.invalidation import bus
+from shop.metrics import registry
+
+OPEN_END = date.max.toordinal()
+
+
+class PriceTimeline:
+    """
+    The price history of one product packed into parallel arrays of day ordinals and integer cents.
+    Segments never overlap, so both ``starts`` and ``ends`` are sorted and can be searched with ``bisect``.
+    ``weights`` and ``days`` hold prefix sums of ``cents * length`` and ``length`` over the closed segments,
+    which turns a time-weighted average into two partial edge segments plus one subtraction.
+    """
+
+    __slots__ = ("starts", "ends", "cents", "weights", "days")
+
+    def __init__(self, segments: Iterable[Tuple[date, Optional[date], Decimal]]):
+        self.starts, self.ends, self.cents = array("l"), array("l"), array("q")
+        self.weights, self.days = array("q", [0]), array("q", [0])
+        for start_date, end_date, price in segments:
+            start, end, cents = start_date.toordinal(), (end_date or date.max).toordinal(), int(price * 100)
+            length = end - start + 1 if end != OPEN_END else 0
+            self.starts.append(start)
+            self.ends.append(end)
+            self.cents.append(cents)
+            self.weights.append(self.weights[-1] + cents * length)
+            self.days.append(self.days[-1] + length)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, slot)) for slot in self.__slots__)
+
+    def price_at(self, day: date) -> Optional[Decimal]:
+        ordinal = day.toordinal()
+        index = bisect_right(self.starts, ordinal) - 1
+        if index < 0 or self.ends[index] < ordinal:
+            return None
+        return Decimal(self.cents[index]).scaleb(-2)
+
+    def overlapping(self, start_date: date, end_date: date) -> range:
+        return range(bisect_left(self.ends, start_date.toordinal()), bisect_right(self.starts, end_date.toordinal()))
+
+    def segments_between(self, start_date: date, end_date: date) -> List[Tuple[date, Decimal]]:
+        return [
+            (date.fromordinal(self.starts[i]), Decimal(self.cents[i]).scaleb(-2))
+            for i in self.overlapping(start_date, end_date)
+        ]
+
+    def weighted_average(self, start_date: date, end_date: date) -> Optional[Decimal]:
+        """Average price per priced day in ``[start_date, end_date]``; days without a price are not counted."""
+        overlapping = self.overlapping(start_date, end_date)
+        if not overlapping:
+            return None
+        start, end = start_date.toordinal(), end_date.toordinal()
+        first, last = overlapping.start, overlapping.stop - 1
+        weight, days = 0, 0
+        for i in {first, last}:
+            length = min(self.ends[i], end) - max(self.starts[i], start) + 1
+            weight += self.cents[i] * length
+            days += length
+        if last > first + 1:
+            weight += self.weights[last] - self.weights[first + 1]
+            days += self.days[last] - self.days[first + 1]
+        return Decimal(weight) / days / 100
+
+
+def period_start(day: date, group_by: str) -> date:
+    if group_by == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(day: date, group_by: str) -> date:
+    if group_by == "week":
+        return day + timedelta(days=7)
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def average_by_period(timeline: PriceTimeline, start_date: date, end_date: date, group_by: str) -> List[dict]:
+    """Same result as the ``TruncWeek``/``TruncMonth`` query: segments are grouped by the period they start in."""
+    grouped = {}
+    for start, price in timeline.segments_between(start_date, end_date):
+        grouped.setdefault(period_start(start, group_by), []).append(price)
+    return [
+        {"period": period, "average_price": round(sum(prices) / len(prices), 2)}
+        for period, prices in sorted(grouped.items())
+    ]
+
+
+def weighted_average_by_period(timeline: PriceTimeline, start_date: date, end_date: date, group_by: str) -> List[dict]:
+    """Calendar periods clipped to the requested window, each averaged over the days it was priced."""
+    result = []
+    period = period_start(start_date, group_by)
+    while period <= end_date:
+        following = next_period(period, group_by)
+        average = timeline.weighted_average(max(period, start_date), min(following - timedelta(days=1), end_date))
+        if average is not None:
+            result.append({"period": period, "average_price": round(average, 2)})
+        period = following
+    return result
+
+
+class TimelineCache:
+    """
+    Per-process LRU of product timelines. ``invalidate`` bumps a generation counter, so a timeline
+    loaded from the database while a write was committing is not stored over the invalidation.
+    """
+
+    def __init__(self, max_products: int):
+        self.max_products = max_products
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, product_id: int) -> Optional[PriceTimeline]:
+        with self._lock:
+            timeline = self._entries.get(product_id)
+            if timeline is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(product_id)
+            self.hits += 1
+            return timeline
+
+    def put(self, product_id: int, timeline: PriceTimeline, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[product_id] = timeline
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_products:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, product_ids: Iterable[int]) -> None:
+        with self._lock:
+            self.generation += 1
+            for product_id in product_ids:
+                self._entries.pop(product_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            timelines = list(self._entries.values())
+            hits, misses = self.hits, self.misses
+        total_bytes = sum(timeline.nbytes for timeline in timelines)
+        return {
+            "products": len(timelines),
+            "segments": sum(len(timeline) for timeline in timelines),
+            "bytes": total_bytes,
+            "bytes_per_product": total_bytes / len(timelines) if timelines else 0,
+            "hits": hits,
+            "misses": misses,
+        }
+
+
+cache = TimelineCache(settings.PRICE_TIMELINE_CACHE["MAX_PRODUCTS"])
+
+
+def cache_enabled() -> bool:
+    return settings.PRICE_TIMELINE_CACHE["ENABLED"]
+
+
+def load_timeline(product_id: int) -> PriceTimeline:
+    segments = Price.objects.filter(product_id=product_id).order_by("start_date")
+    return PriceTimeline(segments.values_list("start_date", "end_date", "price"))
+
+
+def get_timeline(product_id: int) -> PriceTimeline:
+    # A transaction that has written prices sees rows other workers cannot, and may still roll back.
+    if not cache_enabled() or connection.run_on_commit:
+        return load_timeline(product_id)
+    bus.ensure_started()
+    timeline = cache.get(product_id)
+    if timeline is None:
+        generation = cache.generation
+        timeline = load_timeline(product_id)
+        cache.put(product_id, timeline, generation)
+    return timeline
+
+
+def invalidate_timelines(product_ids: Optional[set]) -> None:
+    if product_ids is None:
+        cache.clear()
+    else:
+        cache.invalidate(product_ids)
+
+
+def collect_cache_metrics():
+    stats = cache.stats()
+    yield "price_timeline_cache_products", stats["products"]
+    yield "price_timeline_cache_bytes", stats["bytes"]
+    yield "price_timeline_cache_bytes_per_product", stats["bytes_per_product"]
+    yield "price_timeline_cache_hits_total", stats["hits"]
+    yield "price_timeline_cache_misses_total", stats["misses"]
+
+
+registry.describe("price_timeline_cache_products", "gauge", "Product timelines held in this worker's cache.")
+registry.describe("price_timeline_cache_bytes", "gauge", "Approximate memory used by cached timelines.")
+registry.describe("price_timeline_cache_bytes_per_product", "gauge", "Average memory per cached product timeline.")
+registry.describe("price_timeline_cache_hits_total", "counter", "Timeline lookups served from the cache.")
+registry.describe("price_timeline_cache_misses_total", "counter", "Timeline lookups that loaded from the database.")
+registry.add_collector(collect_cache_metrics)
+bus.register("product", invalidate_timelines)
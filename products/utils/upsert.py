@@ -0,0 +1,130 @@
+import io
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from products.models import Category, ChangeLogEntry, Product
+from shop.invalidation import invalidate_products
+
+STAGING_TABLE = "product_upsert_staging"
+
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+STAGING_SQL = f"""
+CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} (
+    sku varchar(100) NOT NULL,
+    name varchar(255) NOT NULL,
+    category_id bigint NOT NULL,
+    description text
+) ON COMMIT DROP
+"""
+
+# The staged batch is moved out of the staging table and written by one statement, rows in SKU order so
+# concurrent imports lock them in the same order. ``xmax = 0`` holds only for rows the statement inserted,
+# which tells created from updated without reading the SKUs first; the change log is written from the
+# same RETURNING rows.
+UPSERT_SQL = """
+WITH staged AS (
+    DELETE FROM {staging} RETURNING *
+), written AS (
+    INSERT INTO {product} (sku, name, category_id, description)
+    SELECT sku, name, category_id, description FROM staged ORDER BY sku
+    ON CONFLICT (sku) DO UPDATE
+    SET name = EXCLUDED.name, category_id = EXCLUDED.category_id, description = EXCLUDED.description
+    RETURNING id, sku, name, category_id, description, xmax = 0 AS created
+), changes AS (
+    INSERT INTO {changelog} (model, action, object_id, product_id, data, created_at)
+    SELECT %(model)s, CASE WHEN created THEN %(created)s ELSE %(updated)s END, id, id,
+        jsonb_build_object('sku', sku, 'name', name, 'category_id', category_id, 'description', description), NOW()
+    FROM written
+)
+SELECT sku, id, category_id, created FROM written
+"""
+
+
+def copy_value(value) -> str:
+    """A value in the text format of ``COPY``, where ``\\N`` is NULL."""
+    return "\\N" if value is None else str(value).translate(COPY_ESCAPES)
+
+
+class ProductUpsertItemSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=100)
+    name = serializers.CharField(max_length=255)
+    category = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True, default=None)
+
+
+def upsert_products(
+    items: List[dict], batch_size: Optional[int] = None, progress: Optional[Callable[[int], None]] = None
+) -> List[dict]:
+    """
+    Create or update products by SKU. Items are validated one by one so a bad item only fails itself and
+    category names are resolved in a single query. Each batch of valid items is sent with ``COPY`` into a
+    temporary staging table and written from there by one ``INSERT ... ON CONFLICT (sku) DO UPDATE``
+    statement that also writes the change log, all in one transaction.
+    Returns one result per item, in the order of ``items``.
+    """
+    batch_size = batch_size or settings.PRODUCT_BULK_UPSERT["BATCH_SIZE"]
+    results = [
+        {"index": index, "sku": item.get("sku") if isinstance(item, dict) else None} for index, item in enumerate(items)
+    ]
+    # One serializer validates every item: building a serializer per item deep-copies its fields each time.
+    item_serializer = ProductUpsertItemSerializer()
+    valid = {}
+    for result, item in zip(results, items):
+        try:
+            data = item_serializer.run_validation(item)
+        except serializers.ValidationError as e:
+            result.update(status="error", errors=e.detail)
+            continue
+        if data["sku"] in valid:
+            result.update(status="error", errors={"sku": ["Duplicate SKU in request."]})
+        else:
+            valid[data["sku"]] = (result, data)
+
+    names = {data["category"] for _, data in valid.values()}
+    categories = {category.name: category for category in Category.objects.filter(name__in=names)}
+    products = []
+    for result, data in valid.values():
+        category = categories.get(data["category"])
+        if category is None:
+            result.update(status="error", errors={"category": ["Category does not exist."]})
+            continue
+        products.append((result, (data["sku"], data["name"], category.pk, data["description"])))
+
+    if progress:
+        progress(len(items) - len(products))
+    if not products:
+        return results
+    tables = {"product": Product._meta.db_table, "changelog": ChangeLogEntry._meta.db_table, "staging": STAGING_TABLE}
+    params = {
+        "model": ChangeLogEntry.PRODUCT,
+        "created": ChangeLogEntry.CREATED,
+        "updated": ChangeLogEntry.UPDATED,
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(STAGING_SQL)
+        for offset in range(0, len(products), batch_size):
+            batch = products[offset : offset + batch_size]
+            buffer = io.StringIO("".join("\t".join(map(copy_value, row)) + "\n" for _, row in batch))
+            cursor.copy_expert(f"COPY {STAGING_TABLE} FROM STDIN", buffer)
+            cursor.execute(UPSERT_SQL.format(**tables), params)
+            written = {sku: (pk, category_id, created) for sku, pk, category_id, created in cursor.fetchall()}
+            for result, row in batch:
+                pk, _, created = written[row[0]]
+                result.update(id=pk, status="created" if created else "updated")
+            invalidate_products(
+                [pk for pk, _, _ in written.values()], {category_id for _, category_id, _ in written.values()}
+            )
+            if progress:
+                progress(len(batch))
+    return results
+
+
+def summarize_upsert(results: List[dict]) -> dict:
+    summary = {"created": 0, "updated": 0, "error": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return summary
@@ -1,194 +1,198 @@
+from typing import List, Optional
+
 from django.db import transaction
-from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from django.http import Http404
+from django.views.decorators.http import require_safe
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from shop.middleware import timeout_reason
 
-from .models import Category, Product
+from .models import Category, Job, PriceBulkRun, Product
+from .pagination import ProductSearchPagination
 from .serializers import (
     AveragePriceByCategoryInputSerializer,
     AveragePriceByProductInputSerializer,
+    CategoryAnalyticsInputSerializer,
     CategorySerializer,
+    ChangeFeedInputSerializer,
+    JobSerializer,
+    PriceAtInputSerializer,
+    PriceBulkRunDetailSerializer,
+    PriceBulkRunSerializer,
+    PriceCloseSerializer,
     PriceForCategorySerializer,
     PriceSerializer,
+    PriceStatisticsInputSerializer,
+    ProductBulkUpsertSerializer,
+    ProductExpandSerializer,
+    ProductListFilterSerializer,
+    ProductListSerializer,
+    ProductListWithPricesSerializer,
+    ProductSearchInputSerializer,
+    ProductSearchSerializer,
     ProductSerializer,
+    ProductWithPricesSerializer,
 )
 from .utils.average import get_average_by_category, get_average_by_product
+from .utils.changes import get_changes
+from .utils.chunked import execute_price_run, runs_with_progress
+from .utils.fieldsets import only_fields, parse_fields
+from .utils.filters import filter_products, prefetch_prices
+from .utils.search import search_products
+from .utils.snapshots import INDEX_NAME, SNAPSHOT_NAME, serve_file, snapshot_dir
+from .utils.statistics import get_price_statistics
+from .utils.timeline import get_timeline
+from .utils.upsert import summarize_upsert
+
+
+class SparseFieldsViewMixin:
+    """
+    ``?fields=a,b`` on read actions: only those fields are serialized and only the columns they need are
+    loaded from the database.
+    """
+
+    sparse_actions = ("list", "retrieve")
+
+    def requested_fields(self, serializer_class) -> Optional[List[str]]:
+        if self.request is None:
+            return None
+        return parse_fields(self.request.query_params.get("fields"), serializer_class())
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.sparse_actions:
+            return queryset
+        serializer_class = self.get_serializer_class()
+        fields = self.requested_fields(serializer_class)
+        return queryset if fields is None else only_fields(queryset, serializer_class(), fields)
 
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_actions:
+            kwargs.setdefault("fields", self.requested_fields(self.get_serializer_class()))
+        return super().get_serializer(*args, **kwargs)
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+
+class ProductViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related("category").defer("search_vector")
     serializer_class = ProductSerializer
 
-    @swagger_auto_schema(
-        method="get",
-        manual_parameters=[
-            openapi.Parameter(
-                "start_date",
-                openapi.IN_QUERY,
-                type=openapi.TYPE_STRING,
-                format="date",
-                required=True,
-            ),
-            openapi.Parameter(
-                "end_date",
-                openapi.IN_QUERY,
-                type=openapi.TYPE_STRING,
-                format="date",
-                required=True,
-            ),
-            openapi.Parameter(
-                "group_by",
-                openapi.IN_QUERY,
-                type=openapi.TYPE_STRING,
-                enum=["week", "month"],
-                required=True,
-            ),
-        ],
-        responses={
-            200: openapi.Response(
-                description="Average price per period (week/month)",
-                schema=openapi.Schema(
-                    type=openapi.TYPE_ARRAY,
-                    items=openapi.Items(
-                        type=openapi.TYPE_OBJECT,
-                        properties={
-                            "period": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
-                            "average_price": openapi.Schema(type=openapi.TYPE_NUMBER, format="decimal"),
-                        },
-                        required=["period", "average_price"],
-                    ),
-                ),
-            ),
-            400: openapi.Response(
-                description="Validation error",
-                schema=openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        "field_name": openapi.Schema(
-                            type=openapi.TYPE_ARRAY,
-                            items=openapi.Items(type=openapi.TYPE_STRING),
-                        )
-                    },
-                ),
-            ),
-            404: openapi.Response(
-                description="Product not found",
-                schema=openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        "detail": openapi.Schema(type=openapi.TYPE_STRING),
-                    },
-                ),
-            ),
-        },
-    )
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.expand_prices():
+            options = self.expand_options()
+            queryset = prefetch_prices(queryset, options.get("prices_from"), options.get("prices_to"))
+        if self.action != "list":
+            return queryset
+        filters = ProductListFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        return filter_products(queryset, **filters.validated_data)
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return ProductListWithPricesSerializer if self.expand_prices() else ProductListSerializer
+        if self.expand_prices():
+            return ProductWithPricesSerializer
+        return ProductSerializer
+
+    def expand_options(self) -> dict:
+        if self.request is None:
+            # Schema generation introspects the view without a request.
+            return {}
+        if not hasattr(self, "_expand_options"):
+            options = ProductExpandSerializer(data=self.request.query_params)
+            options.is_valid(raise_exception=True)
+            self._expand_options = options.validated_data
+        return self._expand_options
+
+    def expand_prices(self) -> bool:
+        return self.action in ("list", "retrieve") and self.expand_options().get("expand") == "prices"
+
     @action(detail=True, methods=["get"], url_path="average-price")
     def average_price(self, request, pk=None):
         serializer = AveragePriceByProductInputSerializer(data=request.query_params)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        start_date = request.query_params.get("start_date")
-        end_date = request.query_params.get("end_date")
-        group_by = request.query_params.get("group_by")
         product = self.get_object()
-        return get_average_by_product(product, start_date=start_date, end_date=end_date, group_by=group_by)
+        return get_average_by_product(product, **serializer.validated_data)
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        serializer = ProductSearchInputSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        paginator = ProductSearchPagination()
+        page = paginator.paginate_queryset(search_products(serializer.validated_data["q"]), request, view=self)
+        return paginator.get_paginated_response(ProductSearchSerializer(page, many=True).data)
+
+    @action(detail=False, methods=["post"], url_path="bulk-upsert", url_name="bulk-upsert")
+    def bulk_upsert(self, request):
+        serializer = ProductBulkUpsertSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if serializer.validated_data["background"]:
+            return job_accepted_response(request, serializer.enqueue_upsert())
+        results = serializer.upsert()
+        return Response({**summarize_upsert(results), "results": results})
+
+    @action(detail=True, methods=["get"], url_path="price-at")
+    def price_at(self, request, pk=None):
+        serializer = PriceAtInputSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        product = self.get_object()
+        day = serializer.validated_data["date"]
+        return Response({"product": product.pk, "date": day, "price": get_timeline(product.pk).price_at(day)})
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+class CategoryViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = Category.objects.order_by("pk")
     serializer_class = CategorySerializer
 
 
-class PriceViewSet(viewsets.ViewSet):
-    @swagger_auto_schema(request_body=PriceSerializer, responses={201: PriceSerializer})
+class PriceViewSet(SparseFieldsViewMixin, viewsets.ViewSet):
     def create(self, request):
+        fields = self.requested_fields(PriceSerializer)
         serializer = PriceSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            price = serializer.save()
+            return Response(PriceSerializer(price, fields=fields).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @swagger_auto_schema(request_body=PriceForCategorySerializer, responses={201: PriceSerializer(many=True)})
     @action(detail=False, methods=["post"], url_path="bulk-create-by-category", url_name="bulk-create-by-category")
-    @transaction.atomic
     def bulk_create_by_category(self, request):
+        fields = self.requested_fields(PriceSerializer)
         serializer = PriceForCategorySerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if serializer.validated_data["background"]:
+            return job_accepted_response(request, serializer.enqueue_prices_for_category())
         try:
-            prices = serializer.create_prices_for_category()
-            return Response(PriceSerializer(prices, many=True).data, status=status.HTTP_201_CREATED)
+            if serializer.validated_data["parallel"]:
+                run = serializer.create_prices_for_category_in_chunks()
+                return bulk_run_response(run)
+            with transaction.atomic():
+                prices = serializer.create_prices_for_category()
+            return Response(PriceSerializer(prices, many=True, fields=fields).data, status=status.HTTP_201_CREATED)
         except ValidationError as e:
             return Response({"detail": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
+            if timeout_reason(e):
+                raise
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    @swagger_auto_schema(
-        method="get",
-        manual_parameters=[
-            openapi.Parameter(
-                "category",
-                openapi.IN_QUERY,
-                description="Category Name",
-                type=openapi.TYPE_STRING,
-                required=True,
-            ),
-            openapi.Parameter(
-                "start_date",
-                openapi.IN_QUERY,
-                description="Start date (YYYY-MM-DD)",
-                type=openapi.TYPE_STRING,
-                format="date",
-                required=True,
-            ),
-            openapi.Parameter(
-                "end_date",
-                openapi.IN_QUERY,
-                description="End date (YYYY-MM-DD)",
-                type=openapi.TYPE_STRING,
-                format="date",
-                required=True,
-            ),
-        ],
-        responses={
-            200: openapi.Response(
-                description="Average price response",
-                schema=openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        "category": openapi.Schema(type=openapi.TYPE_STRING),
-                        "start_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
-                        "end_date": openapi.Schema(type=openapi.TYPE_STRING, format="date"),
-                        "average_price": openapi.Schema(type=openapi.TYPE_NUMBER, format="decimal"),
-                    },
-                ),
-            ),
-            400: openapi.Response(
-                description="Validation error",
-                schema=openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        "field_name": openapi.Schema(
-                            type=openapi.TYPE_ARRAY,
-                            items=openapi.Items(type=openapi.TYPE_STRING),
-                        )
-                    },
-                ),
-            ),
-            404: openapi.Response(
-                description="Category not found",
-                schema=openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        "detail": openapi.Schema(type=openapi.TYPE_STRING),
-                    },
-                ),
-            ),
-        },
-    )
+    @action(detail=False, methods=["post"], url_path="bulk-close", url_name="bulk-close")
+    def bulk_close(self, request):
+        serializer = PriceCloseSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            result = serializer.close()
+        return Response({"date": serializer.validated_data["date"], **result})
+
     @action(detail=False, methods=["get"], url_path="average-by-category", url_name="average-by-category")
     def average_by_category(self, request):
         serializer = AveragePriceByCategoryInputSerializer(data=request.query_params)
@@ -200,3 +204,85 @@ class PriceViewSet(viewsets.ViewSet):
         end_date = serializer.validated_data["end_date"]
 
         return get_average_by_category(category_name, start_date, end_date)
+
+    @action(detail=False, methods=["get"])
+    def statistics(self, request):
+        serializer = PriceStatisticsInputSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        statistics = get_price_statistics(
+            data["start_date"], data["end_date"], data.get("group_by", set()), data.get("category")
+        )
+        return Response(statistics)
+
+    @action(detail=False, methods=["get"], url_path="analytics-by-category", url_name="analytics-by-category")
+    def analytics_by_category(self, request):
+        serializer = CategoryAnalyticsInputSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            category = Category.objects.get(name=data["category"])
+        except Category.DoesNotExist:
+            return Response({"detail": "Category not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        # NumPy is imported by the first analytics request rather than at startup.
+        from .utils.analytics import get_category_analytics
+
+        return Response(
+            get_category_analytics(
+                category, data["start_date"], data["end_date"], data.get("bucket"), data["per_product"]
+            )
+        )
+
+
+class PriceBulkRunViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = runs_with_progress()
+    serializer_class = PriceBulkRunSerializer
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return PriceBulkRunSerializer
+        return PriceBulkRunDetailSerializer
+
+    @action(detail=True, methods=["post"])
+    def resume(self, request, pk=None):
+        return bulk_run_response(execute_price_run(self.get_object()))
+
+
+def bulk_run_response(run):
+    data = PriceBulkRunDetailSerializer(runs_with_progress().get(pk=run.pk)).data
+    completed = run.status == PriceBulkRun.COMPLETED
+    return Response(data, status=status.HTTP_201_CREATED if completed else status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ChangeViewSet(viewsets.ViewSet):
+    def list(self, request):
+        serializer = ChangeFeedInputSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_changes(**serializer.validated_data))
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.order_by("-pk")
+    serializer_class = JobSerializer
+
+
+def job_accepted_response(request, job):
+    location = reverse("job-detail", args=[job.pk], request=request)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={"Location": location})
+
+
+# Catalog snapshots are plain Django views: they read files only, without authentication, throttling or the ORM.
+@require_safe
+def snapshot_index(request):
+    return serve_file(request, snapshot_dir() / INDEX_NAME, "application/json")
+
+
+@require_safe
+def snapshot_file(request, name):
+    if not SNAPSHOT_NAME.match(name):
+        raise Http404("Snapshot not found.")
+    return serve_file(request, snapshot_dir() / name, "application/gzip", attachment=True)
@@ -0,0 +1,8 @@
+from django.contrib import admin
+from django.urls import path
+
+admin.autodiscover()
+
+urlpatterns = [
+    path("", admin.site.urls),
+]
@@ -0,0 +1,161 @@
+import json
+import os
+import select
+import socket
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .metrics import registry
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD = 7999
+
+
+def process_origin() -> str:
+    # Computed on every call: workers forked from a preloaded master must not share the master's origin.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class InvalidationBatch:
+    """Ids invalidated by one transaction, published together once it commits."""
+
+    def __init__(self, bus: "InvalidationBus"):
+        self.bus = bus
+        self.ids = defaultdict(set)
+
+    def send(self) -> None:
+        self.bus.publish(self.ids)
+
+
+class InvalidationBus:
+    """
+    Keeps per-process caches coherent across workers and nodes. Writers call ``invalidate(kind, ids)``;
+    the ids of a transaction are applied to this process and sent with a single ``NOTIFY`` after it
+    commits. Every worker runs a listener thread on its own connection that applies the ids sent by the
+    other processes to the handlers registered for their kind. A handler receives a set of ids, or
+    ``None`` when everything of that kind must be dropped (too many ids to send, or notifications may
+    have been missed while the listener was reconnecting).
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, list] = defaultdict(list)
+        self.listening = threading.Event()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._pid = None
+
+    @property
+    def options(self) -> dict:
+        return settings.INVALIDATION_BUS
+
+    def register(self, kind: str, handler: Callable[[Optional[set]], None]) -> None:
+        self.handlers[kind].append(handler)
+
+    def dispatch(self, changes: Dict[str, Optional[Iterable[int]]]) -> None:
+        for kind, ids in changes.items():
+            for handler in self.handlers.get(kind, ()):
+                handler(None if ids is None else set(ids))
+
+    def invalidate(self, kind: str, ids: Iterable[int]) -> None:
+        if not connection.in_atomic_block:
+            self.publish({kind: set(ids)})
+            return
+        batch = getattr(self._local, "batch", None)
+        # A batch whose callback is no longer pending belongs to a transaction that has already ended.
+        if batch is None or not any(callback == batch.send for _, callback, _ in connection.run_on_commit):
+            batch = self._local.batch = InvalidationBatch(self)
+            transaction.on_commit(batch.send)
+        batch.ids[kind].update(ids)
+
+    def publish(self, changes: Dict[str, set]) -> None:
+        self.dispatch(changes)
+        if not self.options["ENABLED"]:
+            return
+        message = {kind: sorted(ids) if len(ids) <= self.options["MAX_IDS"] else None for kind, ids in changes.items()}
+        payload = json.dumps({"origin": process_origin(), "changes": message})
+        if len(payload.encode()) > MAX_PAYLOAD:
+            payload = json.dumps({"origin": process_origin(), "changes": dict.fromkeys(changes)})
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.options["CHANNEL"], payload])
+        registry.inc("invalidation_bus_sent_total", ())
+
+    def receive(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message["origin"] == process_origin():
+            return
+        self.dispatch(message["changes"])
+        registry.inc("invalidation_bus_received_total", ())
+
+    def ensure_started(self) -> None:
+        """Start this process' listener unless it is running; cheap enough to call before every cache read."""
+        if self._pid == os.getpid() or not self.options["ENABLED"]:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self.listening.clear()
+            self._thread = threading.Thread(target=self.listen, name="invalidation-bus", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stop.set()
+            if self._thread is not None and self._pid == os.getpid():
+                self._thread.join()
+            self._thread = self._pid = None
+            self.listening.clear()
+
+    def listen(self) -> None:
+        # psycopg2 is what Django uses for this database, so it is already imported by now.
+        import psycopg2
+        from psycopg2 import sql
+
+        stop = self._stop
+        while not stop.is_set():
+            listener = None
+            try:
+                listener = psycopg2.connect(**connection.get_connection_params())
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.options["CHANNEL"])))
+                # Whatever was cached before LISTEN took effect may have been changed without a notification.
+                self.dispatch(dict.fromkeys(self.handlers))
+                self.listening.set()
+                while not stop.is_set():
+                    if select.select([listener], [], [], self.options["POLL_INTERVAL"])[0]:
+                        listener.poll()
+                        while listener.notifies:
+                            self.receive(listener.notifies.pop(0).payload)
+            except Exception:
+                self.listening.clear()
+                registry.inc("invalidation_bus_errors_total", ())
+                stop.wait(self.options["RECONNECT_DELAY"])
+            finally:
+                if listener is not None:
+                    listener.close()
+
+
+bus = InvalidationBus()
+
+
+def invalidate_products(product_ids: Iterable[int], category_ids: Optional[Iterable[int]] = None) -> None:
+    """
+    For writes that bypass model signals (raw SQL, ``bulk_create``, ``update()``): invalidate the per-worker
+    caches of the products, and categories, they changed, as the signal handlers do for model saves.
+    """
+    bus.invalidate("product", product_ids)
+    if category_ids is not None:
+        bus.invalidate("category", category_ids)
+
+
+registry.describe("invalidation_bus_sent_total", "counter", "Invalidation notifications sent by this worker.")
+registry.describe("invalidation_bus_received_total", "counter", "Invalidation notifications from other workers.")
+registry.describe("invalidation_bus_errors_total", "counter", "Invalidation listener connection failures.")
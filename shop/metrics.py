@@ -0,0 +1,279 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# How often a process writes its collector values to its metrics file in multiprocess mode.
+COLLECT_INTERVAL = 5.0
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> int:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+        return index
+
+
+class MetricsFile:
+    """
+    The values of one process, in a file that other processes read while it is being written. Each value is
+    appended once as (key length, JSON key, padding, float64) and from then on updated in place through a
+    memory map, so recording costs no system call. The used size in the header is written after an entry is
+    complete, so a reader never sees half an entry.
+    """
+
+    HEADER = struct.Struct("<Q")
+    LENGTH = struct.Struct("<I")
+    VALUE = struct.Struct("<d")
+
+    def __init__(self, path: Path, size: int = 64 * 1024):
+        self.path = path
+        self.file = open(path, "a+b")
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), os.fstat(self.file.fileno()).st_size)
+        self.used = self.HEADER.unpack_from(self.map, 0)[0] or self.HEADER.size
+        # A file left by an earlier process with the same pid is continued, like its counters would be.
+        self.positions = {key: position for key, _, position in parse_entries(self.map, self.used)}
+
+    def write(self, key: tuple, value: float) -> None:
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = self.append(key)
+        self.VALUE.pack_into(self.map, position, value)
+
+    def append(self, key: tuple) -> int:
+        encoded = json.dumps(key).encode()
+        padding = -(self.LENGTH.size + len(encoded)) % 8
+        size = self.LENGTH.size + len(encoded) + padding + self.VALUE.size
+        while self.used + size > len(self.map):
+            self.map.close()
+            self.file.truncate(os.fstat(self.file.fileno()).st_size * 2)
+            self.map = mmap.mmap(self.file.fileno(), os.fstat(self.file.fileno()).st_size)
+        self.LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + self.LENGTH.size : self.used + self.LENGTH.size + len(encoded)] = encoded
+        position = self.used + size - self.VALUE.size
+        self.VALUE.pack_into(self.map, position, 0.0)
+        self.used += size
+        self.HEADER.pack_into(self.map, 0, self.used)
+        return position
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+
+def parse_entries(data, used: int):
+    """Yield ``(key, value, value position)`` for every complete entry of a metrics file."""
+    offset = MetricsFile.HEADER.size
+    while offset < used:
+        length = MetricsFile.LENGTH.unpack_from(data, offset)[0]
+        start = offset + MetricsFile.LENGTH.size
+        key = freeze(json.loads(bytes(data[start : start + length])))
+        position = start + length + (-(MetricsFile.LENGTH.size + length) % 8)
+        yield key, MetricsFile.VALUE.unpack_from(data, position)[0], position
+        offset = position + MetricsFile.VALUE.size
+
+
+def freeze(value):
+    """JSON arrays back to the tuples the key was written from."""
+    return tuple(map(freeze, value)) if isinstance(value, list) else value
+
+
+def read_metrics_file(path: Path):
+    data = path.read_bytes()
+    if len(data) < MetricsFile.HEADER.size:
+        return
+    for key, value, _ in parse_entries(data, MetricsFile.HEADER.unpack_from(data, 0)[0]):
+        yield key, value
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsRegistry:
+    """
+    Store of request metrics, rendered in the Prometheus text format. Without ``directory`` the metrics are
+    those of the current process. With it, every process also writes its values to ``<pid>.db`` in that
+    directory and ``render`` merges the files of all processes, so any worker answers a scrape for all of
+    them: counters and histograms are summed (including those of processes that have exited), collector
+    values are reported per live process with a ``pid`` label.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, directory=None):
+        self.buckets = tuple(sorted(buckets))
+        self.directory = Path(directory) if directory else None
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._collectors = []
+        self._file = None
+        self._file_pid = None
+        self._collected_at = 0.0
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        with self._lock:
+            file = self.file() if self.directory else None
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram(self.buckets)
+            index = histogram.observe(value)
+            if file:
+                if index < len(histogram.counts):
+                    file.write(("bucket", name, labels, index), histogram.counts[index])
+                file.write(("sum", name, labels), histogram.sum)
+                file.write(("count", name, labels), histogram.count)
+        if self.directory and time.monotonic() - self._collected_at > COLLECT_INTERVAL:
+            self.write_collected()
+
+    def inc(self, name: str, labels: tuple, amount: float = 1) -> None:
+        with self._lock:
+            file = self.file() if self.directory else None
+            value = self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+            if file:
+                file.write(("counter", name, labels), value)
+
+    def add_collector(self, collector) -> None:
+        """``collector()`` yields ``(name, value)`` pairs that are read every time the metrics are rendered."""
+        self._collectors.append(collector)
+
+    def file(self) -> MetricsFile:
+        # Forked workers inherit the registry of the process that imported the application; each of them
+        # starts its own file and does not count the parent's values again.
+        if self._file_pid != os.getpid():
+            self._histograms.clear()
+            self._counters.clear()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._file = MetricsFile(self.directory / f"{os.getpid()}.db")
+            self._file_pid = os.getpid()
+        return self._file
+
+    def write_collected(self) -> None:
+        self._collected_at = time.monotonic()
+        values = [(name, value) for collector in self._collectors for name, value in collector()]
+        with self._lock:
+            file = self.file()
+            for name, value in values:
+                file.write(("collected", name, ()), value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            if self._file_pid == os.getpid():
+                self._file.close()
+                self._file.path.unlink(missing_ok=True)
+            self._file = self._file_pid = None
+
+    def render(self) -> str:
+        if self.directory:
+            self.write_collected()
+            histograms, counters = self.merge()
+        else:
+            with self._lock:
+                histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+                counters = dict(self._counters)
+            for collector in self._collectors:
+                counters.update({(name, ()): value for name, value in collector()})
+
+        lines = []
+        for name in sorted({key[0] for key in histograms} | {key[0] for key in counters}):
+            kind, help_text = self._help.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def merge(self):
+        """The histograms and counters of all processes that wrote to ``directory``."""
+        histograms, counters = {}, {}
+        for path in sorted(self.directory.glob("*.db")):
+            pid = int(path.stem)
+            alive = process_alive(pid)
+            for (kind, name, labels, *index), value in read_metrics_file(path):
+                if kind == "counter":
+                    counters[(name, labels)] = counters.get((name, labels), 0) + as_number(value)
+                elif kind == "collected":
+                    if alive:
+                        counters[(name, labels + (("pid", pid),))] = as_number(value)
+                else:
+                    counts, total, count = histograms.get((name, labels), ([0] * len(self.buckets), 0.0, 0))
+                    if kind == "bucket":
+                        counts[index[0]] += int(value)
+                    elif kind == "sum":
+                        total += value
+                    else:
+                        count += int(value)
+                    histograms[(name, labels)] = (counts, total, count)
+        return histograms, counters
+
+
+def as_number(value: float):
+    # Values are stored as floats; whole numbers are rendered as integers, like the in-memory counters.
+    return int(value) if value.is_integer() else value
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry = MetricsRegistry(
+    getattr(settings, "PERFORMANCE_METRICS", {}).get("BUCKETS", DEFAULT_BUCKETS),
+    getattr(settings, "PERFORMANCE_METRICS", {}).get("MULTIPROCESS_DIR"),
+)
+registry.describe("http_request_duration_seconds", "histogram", "Total time spent handling the request.")
+registry.describe("http_request_db_duration_seconds", "histogram", "Time spent executing SQL queries.")
+registry.describe("http_request_db_queries_total", "counter", "Number of SQL queries executed.")
+registry.describe("http_requests_total", "counter", "Number of handled requests.")
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
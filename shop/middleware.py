@@ -0,0 +1,275 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, connection
+from django.http import JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE as TRANSACTION_IDLE
+
+from .metrics import registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class QueryTimer:
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class PerformanceMiddleware:
+    """
+    Records query count, DB time, view time and render time for every request,
+    exposes them in the ``Server-Timing`` header and feeds the ``/metrics`` histograms.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PERFORMANCE_METRICS", {}).get("ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._perf_view_start = request._perf_view_end = None
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        view_start = request._perf_view_start or start
+        view_end = request._perf_view_end or end
+        timings = {
+            "db": timer.duration,
+            "view": view_end - view_start,
+            "render": end - view_end if request._perf_view_end else 0.0,
+            "total": end - start,
+        }
+        response["Server-Timing"] = ", ".join(
+            [f'db;dur={timings["db"] * 1000:.2f};desc="{timer.count} queries"']
+            + [f"{name};dur={timings[name] * 1000:.2f}" for name in ("view", "render", "total")]
+        )
+        self.record(request, response, timer, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._perf_view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._perf_view_end = time.perf_counter()
+        return response
+
+    @staticmethod
+    def record(request, response, timer, timings):
+        match = getattr(request, "resolver_match", None)
+        route = (("route", match.view_name if match else "unmatched"),)
+        registry.observe("http_request_duration_seconds", route + (("method", request.method),), timings["total"])
+        registry.observe("http_request_db_duration_seconds", route, timings["db"])
+        registry.inc("http_request_db_queries_total", route, timer.count)
+        registry.inc("http_requests_total", route + (("method", request.method), ("status", response.status_code)))
+
+
+# SQLSTATE codes of a statement cancelled by statement_timeout and of a lock wait ended by lock_timeout.
+TIMEOUT_REASONS = {"57014": "statement_timeout", "55P03": "lock_timeout"}
+
+
+def timeout_reason(error: Exception):
+    """``"statement_timeout"`` or ``"lock_timeout"`` when the database error was caused by a timeout."""
+    if isinstance(error, OperationalError):
+        return TIMEOUT_REASONS.get(getattr(error.__cause__, "pgcode", None))
+    return None
+
+
+class QueryTimeouts:
+    """
+    Applies the route's ``statement_timeout`` and ``lock_timeout`` with ``SET LOCAL`` at the start of every
+    transaction. The settings are sent in the same round trip as the transaction's first statement:
+    Postgres runs a multi-statement query string as one transaction, which also covers autocommit queries.
+    """
+
+    __slots__ = ("request", "prefix")
+
+    def __init__(self, request):
+        self.request = request
+        self.prefix = None
+
+    def get_prefix(self) -> str:
+        match = getattr(self.request, "resolver_match", None)
+        options = settings.QUERY_TIMEOUTS
+        timeouts = {**options["DEFAULT"], **options["ROUTES"].get(match.view_name if match else None, {})}
+        return (
+            f"SET LOCAL statement_timeout = {int(timeouts['STATEMENT'])}; "
+            f"SET LOCAL lock_timeout = {int(timeouts['LOCK'])}; "
+        )
+
+    def __call__(self, execute, sql, params, many, context):
+        cursor = context["cursor"].cursor
+        # Server-side cursors wrap the query in DECLARE, which accepts a single statement only.
+        if getattr(cursor, "name", None) is None and cursor.connection.info.transaction_status == TRANSACTION_IDLE:
+            if self.prefix is None:
+                self.prefix = self.get_prefix()
+            sql = self.prefix + sql
+        return execute(sql, params, many, context)
+
+
+class QueryTimeoutMiddleware:
+    """Per-route query timeouts; a request cancelled by one gets a 503 with ``Retry-After`` instead of a 500."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERY_TIMEOUTS", {}).get("ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with connection.execute_wrapper(QueryTimeouts(request)):
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        reason = timeout_reason(exception)
+        if reason is None:
+            return None
+        match = getattr(request, "resolver_match", None)
+        registry.inc(
+            "http_request_timeouts_total", (("route", match.view_name if match else "unmatched"), ("reason", reason))
+        )
+        response = JsonResponse(
+            {"detail": "The request took too long and was cancelled. Retry later or narrow it down."},
+            status=503,
+        )
+        response["Retry-After"] = str(settings.QUERY_TIMEOUTS["RETRY_AFTER"])
+        return response
+
+
+registry.describe("http_request_timeouts_total", "counter", "Requests cancelled by a statement or lock timeout.")
+
+
+def accepted_encodings(header: str) -> set:
+    encodings = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip().removeprefix("q=") if params.strip().startswith("q=") else "1"
+        try:
+            if float(quality) > 0:
+                encodings.add(name.strip().lower())
+        except ValueError:
+            continue
+    return encodings
+
+
+def brotli_sequence(sequence, quality: int):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+# Already compressed payloads (catalog snapshots) would only grow.
+PRECOMPRESSED_TYPES = ("application/gzip",)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Django's ``GZipMiddleware``, whose gzip output is padded with a random number of bytes against BREACH,
+    extended with negotiated brotli (when the ``brotli`` package is installed) and a ``MIN_SIZE`` threshold.
+    Responses with a strong ETag always have the same content, so their compressed bytes are cached per
+    (ETag, encoding) and a hot payload is compressed only once. Streaming responses are compressed chunk by
+    chunk only when ``STREAMING`` is enabled. HTML pages and responses that use or set a CSRF token are
+    never compressed: they put a secret next to content the request controls, and BREACH recovers the
+    secret from compressed lengths.
+    """
+
+    def __init__(self, get_response):
+        self.options = getattr(settings, "COMPRESSION", {})
+        if not self.options.get("ENABLED", True):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_response(self, request, response):
+        if (
+            response.has_header("Content-Encoding")
+            or response.has_header("Content-Range")
+            or response.status_code == 304
+            or response.get("Content-Type", "").startswith(PRECOMPRESSED_TYPES)
+            or self.carries_secrets(request, response)
+        ):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = self.negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+        if response.streaming:
+            if not self.options.get("STREAMING", False) or response.is_async:
+                return response
+            response.streaming_content = self.compress_sequence(response.streaming_content, encoding)
+            del response["Content-Length"]
+        else:
+            if len(response.content) < self.options.get("MIN_SIZE", 1024):
+                return response
+            compressed = self.compressed_content(response, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    @staticmethod
+    def carries_secrets(request, response) -> bool:
+        return (
+            response.get("Content-Type", "").startswith("text/html")
+            or request.META.get("CSRF_COOKIE_NEEDS_UPDATE", False)
+            or settings.CSRF_COOKIE_NAME in response.cookies
+        )
+
+    @staticmethod
+    def negotiate(header: str):
+        encodings = accepted_encodings(header)
+        if brotli is not None and "br" in encodings:
+            return "br"
+        if "gzip" in encodings:
+            return "gzip"
+        return None
+
+    def compress(self, content: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(content, quality=self.options.get("BROTLI_QUALITY", 5))
+        return compress_string(content, max_random_bytes=self.max_random_bytes)
+
+    def compress_sequence(self, sequence, encoding: str):
+        if encoding == "br":
+            return brotli_sequence(sequence, self.options.get("BROTLI_QUALITY", 5))
+        return compress_sequence(sequence, max_random_bytes=self.max_random_bytes)
+
+    def compressed_content(self, response, encoding: str) -> bytes:
+        etag = response.get("ETag")
+        if not etag or etag.startswith("W/"):
+            return self.compress(response.content, encoding)
+        key = f"compressed:{encoding}:{etag}"
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = self.compress(response.content, encoding)
+            cache.set(key, compressed, self.options.get("CACHE_TIMEOUT", 3600))
+        return compressed
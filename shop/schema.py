@@ -0,0 +1,102 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+FORMATS = {".json": ("json", "application/json"), ".yaml": ("yaml", "application/yaml")}
+
+_documents = {}
+_lock = threading.Lock()
+
+
+class SchemaDocument:
+    __slots__ = ("content", "etag")
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="EBS SHOP API",
+        default_version="v1",
+        description="Documentation for the EBS Company Test Task API",
+    )
+
+
+def generate_schema() -> dict:
+    """Introspect the API once with drf_yasg and return the encoded schema per format."""
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    import products.schema  # noqa: F401
+
+    schema = OpenAPISchemaGenerator(info=api_info()).get_schema(request=None, public=True)
+    return {
+        "json": OpenAPICodecJson(validators=[]).encode(schema),
+        "yaml": OpenAPICodecYaml(validators=[]).encode(schema),
+    }
+
+
+def schema_path(extension: str):
+    return settings.OPENAPI_SCHEMA_DIR / f"openapi.{extension}"
+
+
+def get_document(extension: str) -> SchemaDocument:
+    """
+    Serve the schema written by ``manage.py generate_schema`` when present, otherwise generate it
+    on first use. Either way it is built once per process and kept in memory.
+    """
+    document = _documents.get(extension)
+    if document is not None:
+        return document
+    with _lock:
+        if extension not in _documents:
+            path = schema_path(extension)
+            if path.exists():
+                _documents[extension] = SchemaDocument(path.read_bytes())
+            else:
+                _documents.update({key: SchemaDocument(content) for key, content in generate_schema().items()})
+        return _documents[extension]
+
+
+def clear_cache() -> None:
+    with _lock:
+        _documents.clear()
+
+
+def schema_view(request, format):
+    if format not in FORMATS:
+        raise Http404
+    extension, content_type = FORMATS[format]
+    document = get_document(extension)
+    response = get_conditional_response(request, etag=document.etag)
+    if response is None:
+        response = HttpResponse(document.content, content_type=content_type)
+    response["ETag"] = document.etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def lazy_ui_view(renderer: str):
+    """The Swagger and ReDoc pages import drf_yasg only when they are first requested."""
+    view = None
+
+    def docs_view(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            from drf_yasg.views import get_schema_view
+            from rest_framework import permissions
+
+            import products.schema  # noqa: F401
+
+            schema_view_class = get_schema_view(api_info(), public=True, permission_classes=[permissions.AllowAny])
+            view = schema_view_class.with_ui(renderer, cache_timeout=settings.OPENAPI_UI_CACHE_TIMEOUT)
+        return view(request, *args, **kwargs)
+
+    return docs_view
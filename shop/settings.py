@@ -1,11 +1,14 @@
 import os
 from pathlib import Path
 
-from dotenv import load_dotenv
-
-load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+ENV_FILE = BASE_DIR / ".env"
+if ENV_FILE.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(ENV_FILE)
+
 
 SECRET_KEY = os.getenv("APP__SECRET_KEY")
 
@@ -19,18 +22,23 @@ SUPERUSER_PWD = os.getenv("SUPERUSER_PWD", "admin")
 
 
 INSTALLED_APPS = [
-    "django.contrib.admin",
+    # The admin registrations are discovered lazily, on the first hit on /admin/ (see shop/admin_urls.py).
+    "django.contrib.admin.apps.SimpleAdminConfig",
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "drf_yasg",
     "products",
 ]
 
 MIDDLEWARE = [
+    "shop.middleware.PerformanceMiddleware",
+    "shop.middleware.CompressionMiddleware",
+    "shop.middleware.QueryTimeoutMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -71,6 +79,16 @@ DATABASES = {
     }
 }
 
+# The default local-memory cache is per process. Use Redis or Memcached (e.g. APP__CACHE_BACKEND=
+# django.core.cache.backends.redis.RedisCache, APP__CACHE_LOCATION=redis://host:6379) so the cost throttle's
+# budgets are shared by all workers.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("APP__CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("APP__CACHE_LOCATION", ""),
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,13 +115,113 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
+    "DEFAULT_THROTTLE_CLASSES": [
+        "products.throttling.CostThrottle",
+    ],
 }
 SWAGGER_SETTINGS = {
     "DEFAULT_MODEL_RENDERING": "example",
+    "SPEC_URL": ("schema-json", {"format": ".json"}),
 }
 
 REDOC_SETTINGS = {
     "LAZY_RENDERING": True,
+    "SPEC_URL": ("schema-json", {"format": ".json"}),
+}
+
+OPENAPI_SCHEMA_DIR = Path(os.getenv("APP__OPENAPI_SCHEMA_DIR", BASE_DIR / "schema"))
+OPENAPI_UI_CACHE_TIMEOUT = int(os.getenv("APP__OPENAPI_UI_CACHE_TIMEOUT", 60 * 60 * 24))
+
+PRICE_BULK_PARALLEL = {
+    "CHUNK_SIZE": int(os.getenv("APP__PRICE_BULK_CHUNK_SIZE", 1000)),
+    "WORKERS": int(os.getenv("APP__PRICE_BULK_WORKERS", os.cpu_count() or 1)),
+    "EXECUTOR": os.getenv("APP__PRICE_BULK_EXECUTOR", "thread"),
+}
+
+PRODUCT_BULK_UPSERT = {
+    "BATCH_SIZE": int(os.getenv("APP__PRODUCT_UPSERT_BATCH_SIZE", 1000)),
+    "MAX_ITEMS": int(os.getenv("APP__PRODUCT_UPSERT_MAX_ITEMS", 10_000)),
+}
+
+PRICE_TIMELINE_CACHE = {
+    "ENABLED": os.getenv("APP__PRICE_TIMELINE_CACHE", "0") == "1",
+    "MAX_PRODUCTS": int(os.getenv("APP__PRICE_TIMELINE_CACHE_MAX_PRODUCTS", 10_000)),
+}
+
+# Token buckets of the cost-based throttle, in cost units (one unit is about a product-year of prices to scan;
+# requests without an estimate cost one). Buckets refill continuously at RATE units per second.
+COST_THROTTLE = {
+    "ENABLED": os.getenv("APP__COST_THROTTLE", "1") == "1",
+    "CACHE": os.getenv("APP__COST_THROTTLE_CACHE", "default"),
+    "CLIENT_CAPACITY": float(os.getenv("APP__COST_THROTTLE_CLIENT_CAPACITY", 1000)),
+    "CLIENT_RATE": float(os.getenv("APP__COST_THROTTLE_CLIENT_RATE", 50)),
+    "GLOBAL_CAPACITY": float(os.getenv("APP__COST_THROTTLE_GLOBAL_CAPACITY", 20_000)),
+    "GLOBAL_RATE": float(os.getenv("APP__COST_THROTTLE_GLOBAL_RATE", 500)),
+    "CATEGORY_SIZE_TIMEOUT": int(os.getenv("APP__COST_THROTTLE_CATEGORY_SIZE_TIMEOUT", 300)),
+}
+
+INVALIDATION_BUS = {
+    # Only needed when per-worker caches are enabled, so it follows the timeline cache by default.
+    "ENABLED": os.getenv("APP__INVALIDATION_BUS", os.getenv("APP__PRICE_TIMELINE_CACHE", "0")) == "1",
+    "CHANNEL": os.getenv("APP__INVALIDATION_BUS_CHANNEL", "cache_invalidation"),
+    "MAX_IDS": int(os.getenv("APP__INVALIDATION_BUS_MAX_IDS", 500)),
+    "POLL_INTERVAL": float(os.getenv("APP__INVALIDATION_BUS_POLL_INTERVAL", 5)),
+    "RECONNECT_DELAY": float(os.getenv("APP__INVALIDATION_BUS_RECONNECT_DELAY", 1)),
+}
+
+CATALOG_SNAPSHOTS = {
+    "DIR": Path(os.getenv("APP__CATALOG_SNAPSHOT_DIR", BASE_DIR / "snapshots")),
+    "CHUNK_SIZE": int(os.getenv("APP__CATALOG_SNAPSHOT_CHUNK_SIZE", 5000)),
+    "KEEP": int(os.getenv("APP__CATALOG_SNAPSHOT_KEEP", 30)),
+}
+
+CHANGE_FEED = {
+    "PAGE_SIZE": int(os.getenv("APP__CHANGE_FEED_PAGE_SIZE", 1000)),
+    "MAX_PAGE_SIZE": int(os.getenv("APP__CHANGE_FEED_MAX_PAGE_SIZE", 10_000)),
+    "SEQUENCE_BATCH_SIZE": int(os.getenv("APP__CHANGE_FEED_SEQUENCE_BATCH_SIZE", 50_000)),
+}
+
+JOBS = {
+    "POLL_INTERVAL": float(os.getenv("APP__JOBS_POLL_INTERVAL", 1)),
+    "HEARTBEAT_INTERVAL": float(os.getenv("APP__JOBS_HEARTBEAT_INTERVAL", 10)),
+    "STALE_AFTER": float(os.getenv("APP__JOBS_STALE_AFTER", 60)),
+    "MAX_ATTEMPTS": int(os.getenv("APP__JOBS_MAX_ATTEMPTS", 3)),
+}
+
+IMPORT_TIME_BUDGET_MS = float(os.getenv("APP__IMPORT_TIME_BUDGET_MS", 1000))
+
+# Postgres statement_timeout and lock_timeout in milliseconds (0 disables), per URL name over DEFAULT.
+QUERY_TIMEOUTS = {
+    "ENABLED": os.getenv("APP__QUERY_TIMEOUTS", "1") == "1",
+    "DEFAULT": {
+        "STATEMENT": int(os.getenv("APP__STATEMENT_TIMEOUT_MS", 10_000)),
+        "LOCK": int(os.getenv("APP__LOCK_TIMEOUT_MS", 3_000)),
+    },
+    "ROUTES": {
+        "product-average-price": {"STATEMENT": 2_000},
+        "price-average-by-category": {"STATEMENT": 5_000},
+        "price-analytics-by-category": {"STATEMENT": 5_000},
+        "price-statistics": {"STATEMENT": 5_000},
+        "price-bulk-create-by-category": {"STATEMENT": 60_000, "LOCK": 10_000},
+        "price-bulk-close": {"STATEMENT": 60_000, "LOCK": 10_000},
+        "product-bulk-upsert": {"STATEMENT": 60_000, "LOCK": 10_000},
+    },
+    "RETRY_AFTER": int(os.getenv("APP__QUERY_TIMEOUT_RETRY_AFTER", 5)),
+}
+
+COMPRESSION = {
+    "ENABLED": os.getenv("APP__COMPRESSION", "1") == "1",
+    "MIN_SIZE": int(os.getenv("APP__COMPRESSION_MIN_SIZE", 1024)),
+    "BROTLI_QUALITY": int(os.getenv("APP__COMPRESSION_BROTLI_QUALITY", 5)),
+    "STREAMING": os.getenv("APP__COMPRESSION_STREAMING", "0") == "1",
+    "CACHE_TIMEOUT": int(os.getenv("APP__COMPRESSION_CACHE_TIMEOUT", 3600)),
+}
+
+PERFORMANCE_METRICS = {
+    "ENABLED": os.getenv("APP__PERFORMANCE_METRICS", "1") == "1",
+    "BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    # Shared by all worker processes, which write their metrics there; gunicorn.conf.py sets it.
+    "MULTIPROCESS_DIR": os.getenv("APP__METRICS_DIR", ""),
 }
 
 LANGUAGE_CODE = "en-us"
@@ -1,23 +1,57 @@
-from django.contrib import admin
-from django.urls import include, path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="EBS SHOP API",
-        default_version="v1",
-        description="Documentation for the EBS Company Test Task API",
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
+import threading
+
+from django.urls import URLResolver, clear_url_caches, include, path
+from django.urls.resolvers import RoutePattern
+
+from .metrics import metrics_view
+from .schema import lazy_ui_view, schema_view
+
+
+class LazyURLResolver(URLResolver):
+    """
+    A resolver without any patterns until a request path matches its prefix. Django populates every
+    resolver on the first ``reverse()``, so a plain ``URLResolver`` with a dotted path would import its
+    URLconf during the first API request; the module's names can only be reversed once it is loaded.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaded = False
+        self._load_lock = threading.Lock()
+
+    @property
+    def url_patterns(self):
+        if not self.loaded:
+            return []
+        return super().url_patterns
+
+    def resolve(self, path):
+        if not self.loaded and self.pattern.match(str(path)):
+            self.load()
+        return super().resolve(path)
+
+    def load(self) -> None:
+        with self._load_lock:
+            if self.loaded:
+                return
+            self._reverse_dict, self._namespace_dict, self._app_dict = {}, {}, {}
+            self._callback_strs = set()
+            self._populated = False
+            self.loaded = True
+        # The root resolver has cached its reverse lookups without this module's patterns.
+        clear_url_caches()
+
+
+def lazy_include(route, urlconf_module):
+    """Like ``include()``, but the URLconf module is imported on the first request that matches ``route``."""
+    return LazyURLResolver(RoutePattern(route, is_endpoint=False), urlconf_module)
+
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
+    lazy_include("admin/", "shop.admin_urls"),
     path("api/v1/", include("products.urls")),
-    path("swagger<format>/", schema_view.without_ui(cache_timeout=0), name="schema-json"),
-    path("swagger/", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path("metrics", metrics_view, name="metrics"),
+    path("swagger<format>/", schema_view, name="schema-json"),
+    path("swagger/", lazy_ui_view("swagger"), name="schema-swagger-ui"),
+    path("redoc/", lazy_ui_view("redoc"), name="schema-redoc"),
 ]
@@ -1,7 +1,13 @@
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "shop.settings")
 
 application = get_wsgi_application()
+
+# Import the API URLconf, views and serializers now rather than on the first request, so that with
+# gunicorn --preload they are loaded once in the master and shared copy-on-write by the workers.
+# The admin and the API documentation stay lazy.
+get_resolver().url_patterns